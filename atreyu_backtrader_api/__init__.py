@@ -1,9 +1,10 @@
 from .ibstore import IBStore
 from .ibbroker import IBBroker
 from .ibdata import IBData
+from .ibreplay import IBReplayData
 from .custom_logger import setup_custom_logger
 
 __all__ = [
-  'IBStore', 'IBBroker', 'IBData', 'setup_custom_logger',
+  'IBStore', 'IBBroker', 'IBData', 'IBReplayData', 'setup_custom_logger',
 ]
 __version__ = '0.1.0'
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Versioned (copy-on-write) snapshots of the account values sent by TWS
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+
+def copyvalues(values):
+    '''Returns a copy of the (nested) dicts of account ``values``, which can
+    be modified without changing the snapshot they come from'''
+    return {k: copyvalues(v) if isinstance(v, dict) else v
+            for k, v in values.items()}
+
+
+class AccountSnapshot(object):
+    '''State of the accounts at a given ``version``. A snapshot is never
+    modified once published: updates return a new snapshot in which only the
+    dicts on the path to the updated value are copied (the rest is shared with
+    the previous one). Readers can therefore keep and use a reference without
+    any lock
+
+      - ``values``: account -> key -> currency -> value
+      - ``cash``: account -> ``CashBalance`` (``BASE``)
+      - ``value``: account -> ``NetLiquidation``
+      - ``downloaded``: the end of a complete download has been seen
+    '''
+    __slots__ = ('version', 'downloaded', 'values', 'cash', 'value')
+
+    def __init__(self, version=0, downloaded=False, values=None, cash=None,
+                 value=None):
+        self.version = version
+        self.downloaded = downloaded
+        self.values = values if values is not None else dict()
+        self.cash = cash if cash is not None else dict()
+        self.value = value if value is not None else dict()
+
+    def update(self, account, key, currency, value):
+        '''Returns a new snapshot with ``value`` for account/key/currency'''
+        values = dict(self.values)
+        accvalues = values[account] = dict(values.get(account, ()))
+        keyvalues = accvalues[key] = dict(accvalues.get(key, ()))
+        keyvalues[currency] = value
+
+        cash, netvalue = self.cash, self.value
+        if key == 'NetLiquidation':
+            # NetLiquidationByCurrency and currency == 'BASE' is the same
+            netvalue = dict(netvalue)
+            netvalue[account] = value
+        elif key == 'CashBalance' and currency == 'BASE':
+            cash = dict(cash)
+            cash[account] = value
+
+        return AccountSnapshot(self.version + 1, self.downloaded, values,
+                               cash, netvalue)
+
+    def download_end(self):
+        '''Returns a new snapshot marked as ``downloaded``'''
+        return AccountSnapshot(self.version + 1, True, self.values, self.cash,
+                               self.value)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# asyncio bridge for the queues of the store: messages put by the TWS API
+# thread are handed over to an event loop
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import threading
+
+
+class AsyncQueue(object):
+    '''Stands in the store queues (``put``/``qsize``) for a request made from
+    an asyncio event loop
+
+    ``put`` can be called from any thread. Messages are appended to a pending
+    buffer and the loop is woken up with ``call_soon_threadsafe`` only if no
+    wake up is already scheduled: all the messages put until the loop runs
+    are handed over in a single callback (``wakeups`` vs ``msgs``)
+    '''
+    def __init__(self, loop):
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._pending = collections.deque()  # filled by the API thread
+        self._scheduled = False  # a _flush is waiting to run in the loop
+        self._ready = collections.deque()  # handed over to the loop
+        self._waiter = None  # future of a consumer waiting for messages
+
+        self.msgs = 0
+        self.wakeups = 0
+
+    def put(self, msg):
+        with self._lock:
+            self._pending.append(msg)
+            self.msgs += 1
+            if self._scheduled:
+                return
+
+            self._scheduled = True
+            self.wakeups += 1
+
+        self.loop.call_soon_threadsafe(self._flush)
+
+    def qsize(self):
+        return len(self._pending) + len(self._ready)
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, collections.deque()
+            self._scheduled = False
+
+        self._ready.extend(pending)
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def getmany(self):
+        '''Returns a list with all the messages available, waiting for at
+        least one if needed'''
+        while not self._ready:
+            self._waiter = self.loop.create_future()
+            await self._waiter
+
+        msgs = list(self._ready)
+        self._ready.clear()
+        return msgs
+
+    async def get(self):
+        '''Returns the next message, waiting for it if needed'''
+        while not self._ready:
+            self._waiter = self.loop.create_future()
+            await self._waiter
+
+        return self._ready.popleft()
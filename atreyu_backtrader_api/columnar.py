@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Columnar (NumPy) helpers to load historical bars in bulk. NumPy is only
+# needed if this module is used
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import numpy as np
+
+from backtrader import date2num
+
+
+class BarColumns(object):
+    '''Collects historical bars (``HistBar`` like messages) column by column
+    and returns them as NumPy arrays with ``arrays``. The ``date2num`` value
+    of the bars is taken from ``dtnum`` if the store has already set it'''
+    FIELDS = ('open', 'high', 'low', 'close', 'volume', 'count', 'wap')
+
+    __slots__ = ('nums',) + FIELDS
+
+    def __init__(self):
+        for field in self.__slots__:
+            setattr(self, field, list())
+
+    def __len__(self):
+        return len(self.nums)
+
+    def append(self, bar):
+        dtnum = getattr(bar, 'dtnum', None)
+        if dtnum is None:
+            dtnum = date2num(bar.date)
+        self.nums.append(dtnum)
+        self.open.append(bar.open)
+        self.high.append(bar.high)
+        self.low.append(bar.low)
+        self.close.append(bar.close)
+        self.volume.append(bar.volume)
+        self.count.append(bar.count)
+        self.wap.append(bar.wap)
+
+    def arrays(self, fromdate=float('-inf'), todate=float('inf')):
+        '''Returns a dict with the ``datetime`` (``date2num``) and the value
+        columns as ``float64`` arrays. As in the one by one loading, bars
+        earlier than an already seen one are removed, as are those before
+        ``fromdate`` and everything from the first one after ``todate``'''
+        dt = np.asarray(self.nums, dtype=np.float64)
+
+        keep = np.ones(len(dt), dtype=bool)
+        if len(dt) > 1:  # no bar can go back in time
+            keep[1:] = dt[1:] >= np.maximum.accumulate(dt)[:-1]
+
+        over = np.flatnonzero(keep & (dt > todate))
+        if over.size:
+            keep[over[0]:] = False
+
+        keep &= dt >= fromdate
+
+        columns = dict(datetime=dt[keep])
+        for field in self.FIELDS:
+            columns[field] = np.asarray(getattr(self, field),
+                                        dtype=np.float64)[keep]
+
+        return columns
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Bounded/conflating data queues for the streaming subscriptions of the store
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import time
+
+from backtrader.utils.py3 import integer_types, queue
+
+
+class ConflatingQueue(queue.Queue):
+    '''``queue.Queue`` with a maximum depth, an overflow policy and an optional
+    conflation (latest value wins) mode
+
+    Params:
+
+      - ``maxsize`` (default: ``0``): maximum number of pending data
+        messages. ``0`` is unbounded
+
+      - ``overflow`` (default: ``block``): what happens with a new message if
+        ``maxsize`` is reached
+
+        - ``block``: the producer (the TWS API thread) waits for the consumer
+          to make room, as a bounded ``queue.Queue`` does
+        - ``dropoldest``: the oldest pending message is discarded
+        - ``conflate``: the message replaces the pending one of the same kind
+          (or the oldest one is discarded if there is none)
+
+      - ``conflate`` (default: ``False``): conflate always and not only on
+        overflow. Only one message per kind (class) is pending at any time:
+        each new one replaces the previous, keeping its position in the queue,
+        so that the consumer always reads the freshest state
+
+      - ``merge`` (default: ``None``): callable ``merge(old, new)`` returning
+        the message which replaces ``old``. ``None`` returns ``new``
+
+    Notifications (``None`` and integer codes) are never conflated nor
+    discarded and act as a barrier: messages are not conflated with those
+    which were queued before a notification. They do not count for
+    ``maxsize`` and never wait for room, nor does a message conflated into a
+    pending one
+
+    The number of conflated/discarded messages are kept in ``coalesced`` and
+    ``dropped``
+    '''
+    OVERFLOWS = ('block', 'dropoldest', 'conflate')
+
+    def __init__(self, maxsize=0, overflow='block', conflate=False,
+                 merge=None):
+        if overflow not in self.OVERFLOWS:
+            raise ValueError(f'overflow must be one of {self.OVERFLOWS}')
+
+        self.limit = maxsize
+        self.overflow = overflow
+        self.conflate = conflate
+        self.merge = merge
+        self.coalesced = 0  # messages merged into a pending one
+        self.dropped = 0  # messages discarded
+
+        # The base class only blocks if the policy asks for it
+        super(ConflatingQueue, self).__init__(
+            maxsize if overflow == 'block' else 0)
+
+    def put(self, item, block=True, timeout=None):
+        '''As ``queue.Queue.put``, but only waiting for room (``block``
+        overflow) if the message takes a new place among the data messages'''
+        with self.not_full:
+            if self.overflow == 'block' and block and timeout is not None:
+                if timeout < 0:
+                    raise ValueError("'timeout' must be a non-negative number")
+                endtime = time.monotonic() + timeout
+
+            while (self.overflow == 'block' and self._full() and
+                   not self._takesnoroom(item)):
+                if not block:
+                    raise queue.Full
+                if timeout is None:
+                    self.not_full.wait()
+                else:
+                    remaining = endtime - time.monotonic()
+                    if remaining <= 0.0:
+                        raise queue.Full
+                    self.not_full.wait(remaining)
+
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _init(self, maxsize):
+        # Pending data messages are held as [key, msg] to update them in place
+        self.queue = collections.deque()
+        self._latest = dict()  # key -> pending entry
+        self._ndata = 0  # pending data messages (notifications apart)
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _full(self):
+        return self.limit > 0 and self._ndata >= self.limit
+
+    def _takesnoroom(self, item):
+        # notification or data message conflated into a pending one
+        if item is None or isinstance(item, integer_types):
+            return True
+        return self.conflate and type(item) in self._latest
+
+    def _put(self, item):
+        if item is None or isinstance(item, integer_types):
+            self._latest.clear()  # barrier for conflation
+            self.queue.append(item)
+            return
+
+        key = type(item)
+        entry = self._latest.get(key)
+        if entry is not None:
+            if self.conflate or (self.overflow == 'conflate' and self._full()):
+                old = entry[1]
+                entry[1] = item if self.merge is None else self.merge(old, item)
+                self.coalesced += 1
+                return
+
+        if self._full():
+            self._dropoldest()
+
+        entry = [key, item]
+        self._latest[key] = entry
+        self.queue.append(entry)
+        self._ndata += 1
+
+    def _dropoldest(self):
+        for entry in self.queue:
+            if isinstance(entry, list):
+                break
+        else:
+            return  # only notifications pending, which cannot be dropped
+
+        self.queue.remove(entry)
+        self._ndata -= 1
+        if self._latest.get(entry[0]) is entry:
+            del self._latest[entry[0]]
+
+        self.dropped += 1
+
+    def _get(self):
+        entry = self.queue.popleft()
+        if not isinstance(entry, list):
+            return entry  # notification
+
+        key, item = entry
+        self._ndata -= 1
+        if self._latest.get(key) is entry:
+            del self._latest[key]
+
+        return item
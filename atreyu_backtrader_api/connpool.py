@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Additional TWS connections (own clientIds) for the data requests of the
+# store, sharded by contract
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import bisect
+import collections
+import hashlib
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class ConnectionPool(object):
+    '''Pool of data connections, one per clientId in ``clientIds`` (created
+    with ``connfactory(clientId)``), to which requests are assigned by
+    consistent hashing of the ``conId`` of the contract (``vnodes`` points
+    per connection in the ring). The connection used by each tickerId is kept
+    until ``release`` to send the cancellation over the same one
+    '''
+    def __init__(self, connfactory, clientIds, vnodes=160):
+        self.conns = [connfactory(clientId) for clientId in clientIds]
+        self.threads = dict()  # clientId -> thread running the connection
+
+        ring = list()
+        for conn in self.conns:
+            for i in range(vnodes):
+                point = _hash(f'{conn.poolid}-{i}')
+                ring.append((point, conn.poolid))
+
+        ring.sort()
+        self._points = [point for point, _ in ring]
+        byid = {conn.poolid: conn for conn in self.conns}
+        self._ring = [byid[clientId] for _, clientId in ring]
+
+        self._lock = threading.Lock()
+        self._tconns = dict()  # tickerId -> connection of the request
+        self.requests = collections.Counter()  # clientId -> requests sent
+
+    def connect(self, host, port, timeout=None):
+        '''Connects the connections not yet connected and waits up to
+        ``timeout`` seconds for them to be ready'''
+        for conn in self.conns:
+            if conn.isConnected():
+                continue
+
+            conn.connect(host, port, conn.poolid)
+            t = threading.Thread(target=conn.run, daemon=True)
+            t.start()
+            self.threads[conn.poolid] = t
+
+        for conn in self.conns:
+            conn.ready.wait(timeout)
+
+        return all(conn.isConnected() for conn in self.conns)
+
+    def disconnect(self):
+        for conn in self.conns:
+            conn.ready.clear()  # expected: no warning when closed
+            conn.disconnect()
+
+    @staticmethod
+    def shardkey(contract):
+        if contract.conId:
+            return str(contract.conId)
+
+        # not yet resolved (contract details): by its description
+        return (f'{contract.symbol}-{contract.secType}-{contract.exchange}-'
+                f'{contract.currency}-{contract.localSymbol}-'
+                f'{contract.lastTradeDateOrContractMonth}')
+
+    def shard(self, contract):
+        '''Returns the connection for contract'''
+        point = _hash(self.shardkey(contract))
+        idx = bisect.bisect(self._points, point) % len(self._points)
+        return self._ring[idx]
+
+    def route(self, tickerId, contract):
+        '''Returns the connection for request tickerId on contract'''
+        conn = self.shard(contract)
+        with self._lock:
+            self._tconns[tickerId] = conn
+            self.requests[conn.poolid] += 1
+
+        return conn
+
+    def connof(self, tickerId):
+        '''Returns the connection of request tickerId (if any)'''
+        return self._tconns.get(tickerId)
+
+    def tickers(self, conn):
+        '''Returns the tickerIds of the requests sent over conn'''
+        with self._lock:
+            return [tickerId for tickerId, c in self._tconns.items()
+                    if c is conn]
+
+    def release(self, tickerId):
+        with self._lock:
+            self._tconns.pop(tickerId, None)
+
+    def stats(self):
+        '''Returns a dict (key: clientId) with the requests sent over each
+        connection, the requests active and whether it is connected'''
+        with self._lock:
+            active = collections.Counter(
+                conn.poolid for conn in self._tconns.values())
+
+        return {
+            conn.poolid: dict(requests=self.requests[conn.poolid],
+                                active=active[conn.poolid],
+                                connected=conn.isConnected())
+            for conn in self.conns
+        }
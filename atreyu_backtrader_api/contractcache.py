@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Registry of the contract details resolved by the store (memory and disk)
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import pickle
+import sqlite3
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# Contract fields which identify the instrument(s) requested
+_SPECFIELDS = ('conId', 'symbol', 'secType', 'lastTradeDateOrContractMonth',
+               'strike', 'right', 'multiplier', 'exchange', 'primaryExchange',
+               'currency', 'localSymbol', 'tradingClass', 'secIdType', 'secId')
+
+
+def contractspec(contract):
+    '''Returns the normalized spec (string) of a requested contract: the
+    identifying fields with the defaults/empty values removed and upper cased,
+    so that equivalent requests have the same spec'''
+    tokens = list()
+    for field in _SPECFIELDS:
+        value = getattr(contract, field, None)
+        if not value:  # '', None, 0, 0.0
+            continue
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        tokens.append(f'{field}={str(value).strip().upper()}')
+
+    return '|'.join(tokens)
+
+
+def contractkey(contract):
+    '''Returns the key (string) under which the details of a resolved
+    ``contract`` are interned: the instrument (``conId``) and its routing
+    (``exchange``, ``primaryExchange``), for the same ``conId`` resolved for
+    another exchange is a different answer'''
+    return (f'{contract.conId}|{contract.exchange or ""}|'
+            f'{contract.primaryExchange or ""}')
+
+
+def _detailvars(cd):
+    # The values of ContractDetails other than the contract
+    attrs = dict(vars(cd))
+    attrs.pop('contract', None)
+    return attrs
+
+
+class ContractRegistry(object):
+    '''Keeps the ``ContractDetails`` answered by TWS
+
+    The answers are kept by request spec (see ``contractspec``) and the
+    details are interned by ``contractkey`` (``conId`` and exchanges): all the
+    requests (and data feeds) resolving to the same instrument routed the same
+    way share a single ``ContractDetails`` (and ``Contract``) instance
+
+    The instances handed out are never modified. If an instrument is received
+    again with other values, the new instance is the one held (and returned)
+    from then on
+
+    Params:
+
+      - ``path`` (default: ``None``): SQLite database in which the answers are
+        also kept, to have them available across runs
+      - ``ttl`` (default: ``86400.0``): seconds an answer is valid. An expired
+        answer is requested again to TWS
+
+    The instance can be used from several threads
+    '''
+    _SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS contracts (
+            key TEXT PRIMARY KEY, details BLOB NOT NULL)''',
+        '''CREATE TABLE IF NOT EXISTS specs (
+            spec TEXT PRIMARY KEY, keys TEXT NOT NULL,
+            stamp REAL NOT NULL)''',
+    )
+
+    def __init__(self, path=None, ttl=86400.0):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._specs = dict()  # spec -> (stamp, keys)
+        self._details = dict()  # contractkey -> ContractDetails
+        self._conids = dict()  # conId -> contractkey last received
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            with self._db:
+                self._db.execute('PRAGMA journal_mode=WAL')
+                for sql in self._SCHEMA:
+                    self._db.execute(sql)
+
+        self.counters = collections.Counter()
+
+    def get(self, contract):
+        '''Returns the list of ``ContractDetails`` for the requested
+        ``contract`` or ``None`` if it is not known (or expired)'''
+        spec = contractspec(contract)
+        now = time.time()
+        with self._lock:
+            entry = self._specs.get(spec)
+            if entry is None and self._db is not None:
+                entry = self._load(spec)
+
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+
+            stamp, keys = entry
+            if now - stamp > self.ttl:
+                self.counters['expired'] += 1
+                self.counters['misses'] += 1
+                return None
+
+            try:
+                cds = [self._details[key] for key in keys]
+            except KeyError:  # incomplete on disk
+                self.counters['misses'] += 1
+                return None
+
+            self.counters['hits'] += 1
+            return cds
+
+    def put(self, contract, cds):
+        '''Keeps the answer ``cds`` (list of ``ContractDetails``) received for
+        the requested ``contract``. Returns the list with the interned
+        instances, which are the ones to be used'''
+        spec = contractspec(contract)
+        now = time.time()
+        with self._lock:
+            interned = [self._intern(cd) for cd in cds]
+            keys = tuple(contractkey(cd.contract) for cd in interned)
+            self._specs[spec] = (now, keys)
+            self.counters['stored'] += 1
+
+            if self._db is not None:
+                with self._db:
+                    self._db.executemany(
+                        'INSERT OR REPLACE INTO contracts VALUES (?, ?)',
+                        [(key, pickle.dumps(cd))
+                         for key, cd in zip(keys, interned)])
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO specs VALUES (?, ?, ?)',
+                        (spec, ','.join(keys), now))
+
+        return interned
+
+    def byconid(self, conId):
+        '''Returns the interned ``ContractDetails`` of ``conId`` (or None). If
+        it is known for several exchanges, the one received last'''
+        with self._lock:
+            return self._details.get(self._conids.get(conId))
+
+    def _intern(self, cd):
+        key = contractkey(cd.contract)
+        self._conids[cd.contract.conId] = key
+        current = self._details.get(key)
+        if current is not None and current is not cd:
+            if (vars(current.contract) == vars(cd.contract) and
+                    _detailvars(current) == _detailvars(cd)):
+                self.counters['interned'] += 1
+                return current  # the shared instance
+
+        # new or changed: given out from now on (the old one is left alone)
+        self._details[key] = cd
+        return cd
+
+    def _load(self, spec):
+        # Loads the answer for spec (and the details) from disk
+        row = self._db.execute('SELECT keys, stamp FROM specs WHERE spec = ?',
+                               (spec,)).fetchone()
+        if row is None:
+            return None
+
+        keys = tuple(x for x in row[0].split(',') if x)
+        for key in keys:
+            if key in self._details:
+                continue
+            drow = self._db.execute(
+                'SELECT details FROM contracts WHERE key = ?',
+                (key,)).fetchone()
+            if drow is None:
+                return None
+            try:
+                cd = pickle.loads(drow[0])
+            except Exception as e:  # stale format (api upgrade ...)
+                logger.warning(f'Cannot load details of {key}: {e}')
+                return None
+            self._details[key] = cd
+            self._conids.setdefault(cd.contract.conId, key)
+
+        entry = self._specs[spec] = (row[1], keys)
+        self.counters['disk'] += 1
+        return entry
+
+    def stats(self):
+        '''Returns a dict with the counters: ``hits`` (answered from the
+        registry), ``misses`` (requested to TWS), ``expired`` (misses due to
+        the ``ttl``), ``disk`` (answers loaded from disk), ``stored``,
+        ``interned`` (received instances answered with a shared one) and the
+        number of ``specs`` and ``contracts`` held'''
+        with self._lock:
+            stats = dict.fromkeys(('hits', 'misses', 'expired', 'disk',
+                                   'stored', 'interned'), 0)
+            stats.update(self.counters)
+            stats['specs'] = len(self._specs)
+            stats['contracts'] = len(self._details)
+
+        return stats
+
+    def clear(self):
+        '''Forgets all answers held in memory (not on disk)'''
+        with self._lock:
+            self._specs.clear()
+            self._details.clear()
+            self._conids.clear()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Worker pool for the subscribe/cancel calls of the data feeds of the store
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+from atreyu_backtrader_api.histogram import LatencyHistogram
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class _Job(object):
+    __slots__ = ('fn', 'batches')
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.batches = list()  # batches waiting for the job
+
+
+class _Batch(object):
+    __slots__ = ('name', 't0', 'remaining', 'done')
+
+    def __init__(self, name, count):
+        self.name = name
+        self.t0 = time.monotonic()
+        self.remaining = count
+        self.done = threading.Event()
+
+
+class SubscriptionDispatcher(object):
+    '''Runs the ``reqdata``/``canceldata`` calls of the data feeds in a fixed
+    pool of ``workers`` threads (started on first use), instead of a thread
+    per data feed and call
+
+    Calls are submitted in named batches (``start``, ``stop``, ``resub``) and
+    the time it takes for a complete batch to be done is kept per name. A call
+    which is still pending when submitted again is not duplicated: the new
+    batch waits for the pending one. A batch can be staggered: the calls are
+    released in groups of ``size`` every ``stagger`` seconds
+    '''
+    def __init__(self, workers=4):
+        self.workers = max(1, workers)
+        self._cond = threading.Condition()
+        self._heap = list()  # (notbefore, seq, job)
+        self._seq = itertools.count()
+        self._pending = dict()  # fn -> job not yet done
+        self._threads = list()
+
+        self.counters = collections.Counter()
+        self.timings = collections.defaultdict(LatencyHistogram)
+        self.last = dict()  # batch name -> seconds of last complete batch
+
+    def batch(self, name, fns, wait=True, stagger=0.0, size=0):
+        '''Runs the calls ``fns`` in the pool. If ``wait`` is ``True`` it
+        returns after all of them have been done. If ``stagger`` and ``size``
+        are set, the calls are released in groups of ``size`` separated by
+        ``stagger`` seconds'''
+        fns = list(fns)
+        b = _Batch(name, len(fns))
+        now = time.monotonic()
+        with self._cond:
+            self._startworkers()
+            self.counters[name] += 1
+            for i, fn in enumerate(fns):
+                job = self._pending.get(fn)
+                if job is None:
+                    job = self._pending[fn] = _Job(fn)
+                    notbefore = now
+                    if stagger and size:
+                        notbefore += (i // size) * stagger
+                    heapq.heappush(self._heap, (notbefore, next(self._seq), job))
+                else:
+                    self.counters['deduped'] += 1
+
+                job.batches.append(b)
+
+            if not fns:
+                self._batchdone(b)
+            self._cond.notify_all()
+
+        if wait:
+            b.done.wait()
+
+        return b
+
+    def _startworkers(self):
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._run, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _batchdone(self, b):
+        elapsed = time.monotonic() - b.t0
+        self.timings[b.name].record(int(elapsed * 1e9))
+        self.last[b.name] = elapsed
+        b.done.set()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        job = heapq.heappop(self._heap)[2]
+                        # a new submission from now on is a new call
+                        self._pending.pop(job.fn, None)
+                        break
+
+                    wait = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(wait)
+
+            try:
+                job.fn()
+            except Exception as e:
+                self.counters['errors'] += 1
+                logger.exception(f'Dispatching {job.fn}: {e}')
+
+            with self._cond:
+                self.counters['calls'] += 1
+                for b in job.batches:
+                    b.remaining -= 1
+                    if not b.remaining:
+                        self._batchdone(b)
+
+    def stats(self):
+        '''Returns a dict with the counters (batches per name, ``calls``,
+        ``deduped``, ``errors``), the calls ``pending`` and for each batch
+        name the ``last`` duration and the report (ns) of the durations'''
+        with self._cond:
+            stats = dict.fromkeys(('calls', 'deduped', 'errors'), 0)
+            stats.update(self.counters)
+            stats['pending'] = len(self._heap)
+            stats['batches'] = {
+                name: dict(last=self.last.get(name), durations=hist.report())
+                for name, hist in self.timings.items()
+            }
+
+        return stats
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# On-disk cache (SQLite) of the historical bars downloaded by the store
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import sqlite3
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class HistoricalCache(object):
+    '''Keeps the historical bars received from TWS in a SQLite database
+
+    Bars are stored per key ``(conId, whatToShow, barsize, useRTH)`` with the
+    raw timestamp of the bar as integer (UTC epoch seconds of the start of the
+    bar, midnight for daily and larger sizes). Together with the bars, the
+    time ranges which have been completely downloaded (``coverage``) are kept,
+    so that a request can be split in the parts which can be answered from
+    disk and the gaps which have to be requested to TWS
+
+    The instance can be used from several threads (the TWS API thread writes,
+    the data feeds read)
+    '''
+    _SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS bars (
+            key TEXT NOT NULL, t INTEGER NOT NULL,
+            open REAL, high REAL, low REAL, close REAL,
+            volume REAL, wap REAL, count INTEGER,
+            PRIMARY KEY (key, t)) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS coverage (
+            key TEXT NOT NULL, begin INTEGER NOT NULL, end INTEGER NOT NULL)''',
+        '''CREATE INDEX IF NOT EXISTS coverage_key ON coverage (key, begin)''',
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            for sql in self._SCHEMA:
+                self._db.execute(sql)
+
+        self.counters = collections.Counter()
+
+    @staticmethod
+    def makekey(conId, what, barsize, useRTH):
+        return f'{conId}|{what}|{barsize}|{int(bool(useRTH))}'
+
+    def plan(self, key, begin, end):
+        '''Splits ``[begin, end)`` in a list of ``(cached, begin, end)``
+        segments in chronological order. ``cached`` is ``True`` if the segment
+        can be read from the cache and ``False`` if it has to be downloaded
+        '''
+        with self._lock:
+            covered = self._db.execute(
+                'SELECT begin, end FROM coverage '
+                'WHERE key = ? AND end > ? AND begin < ? ORDER BY begin',
+                (key, begin, end)).fetchall()
+
+        segments = list()
+        cur = begin
+        for b, e in covered:
+            if b > cur:
+                segments.append((False, cur, b))
+                cur = b
+            e = min(e, end)
+            if e > cur:
+                segments.append((True, cur, e))
+                cur = e
+
+        if cur < end:
+            segments.append((False, cur, end))
+
+        self.counters['requests'] += 1
+        fetches = sum(not cached for cached, b, e in segments)
+        if not fetches:
+            self.counters['hits'] += 1
+        elif fetches < len(segments):
+            self.counters['partial'] += 1
+        else:
+            self.counters['misses'] += 1
+        self.counters['fetches'] += fetches
+
+        return segments
+
+    def bars(self, key, begin, end):
+        '''Returns the rows ``(t, open, high, low, close, volume, wap, count)``
+        with ``begin <= t < end`` sorted by time'''
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT t, open, high, low, close, volume, wap, count '
+                'FROM bars WHERE key = ? AND t >= ? AND t < ? ORDER BY t',
+                (key, begin, end)).fetchall()
+
+        self.counters['bars_cached'] += len(rows)
+        return rows
+
+    def store(self, key, rows, begin, end):
+        '''Stores the downloaded ``rows`` and marks ``[begin, end)`` as
+        completely downloaded (nothing is marked if ``end <= begin``)'''
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(key,) + tuple(row) for row in rows])
+
+            if end > begin:
+                # merge with the overlapping/adjacent ranges
+                merged = self._db.execute(
+                    'SELECT min(begin), max(end) FROM coverage '
+                    'WHERE key = ? AND end >= ? AND begin <= ?',
+                    (key, begin, end)).fetchone()
+                if merged[0] is not None:
+                    begin = min(begin, merged[0])
+                    end = max(end, merged[1])
+                self._db.execute(
+                    'DELETE FROM coverage '
+                    'WHERE key = ? AND end >= ? AND begin <= ?',
+                    (key, begin, end))
+                self._db.execute('INSERT INTO coverage VALUES (?, ?, ?)',
+                                 (key, begin, end))
+
+        self.counters['bars_fetched'] += len(rows)
+
+    def stats(self):
+        '''Returns a dict with the counters: ``requests`` (answered through the
+        cache), ``hits`` (completely from disk), ``partial``, ``misses``
+        (nothing on disk), ``fetches`` (gaps requested to TWS),
+        ``bars_cached`` (read from disk) and ``bars_fetched`` (stored)'''
+        stats = dict.fromkeys(('requests', 'hits', 'partial', 'misses',
+                               'fetches', 'bars_cached', 'bars_fetched'), 0)
+        stats.update(self.counters)
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Conversion of the dates of historical bars (with memoized session ends and
+# batch conversion)
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import calendar
+from datetime import datetime
+import time
+
+from backtrader import date2num
+from backtrader.utils import UTC
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # batches are converted one by one
+
+# date2num of 1970-01-01 (proleptic gregorian ordinal)
+EPOCH_ORDINAL = 719163
+SECONDS_PER_DAY = 86400
+MSECONDS_PER_DAY = 86400000
+
+
+def epoch2num(t):
+    '''Returns the ``date2num`` value of the UTC epoch seconds ``t``. For
+    whole seconds the result is bit for bit the one of ``date2num``, for
+    fractions (``time.time()``) it may differ below the microsecond'''
+    days, secs = divmod(t, SECONDS_PER_DAY)
+    return float(days + EPOCH_ORDINAL) + secs / float(SECONDS_PER_DAY)
+
+
+def ms2num(ms):
+    '''Returns the ``date2num`` value of the integer UTC epoch milliseconds
+    ``ms`` (as the timestamps of ``RTVolume``), without going through a
+    ``datetime``. The result is the one of ``date2num``'''
+    days, msecs = divmod(ms, MSECONDS_PER_DAY)
+    return float(days + EPOCH_ORDINAL) + msecs / float(MSECONDS_PER_DAY)
+
+
+class HistDateConverter(object):
+    '''Converts the dates of the historical bars sent by TWS to naive UTC
+    ``datetime`` instances and ``date2num`` values
+
+      - Intraday bars (epoch seconds) are converted arithmetically
+
+      - Daily and larger bars (``YYYYMMDD``) are moved to the end of the
+        session in the timezone of the data (as long as the session has
+        already ended). The result for each ``(tz, sessionend, day)`` is
+        computed once and kept (``maxsize`` entries at most)
+    '''
+    def __init__(self, maxsize=1 << 16):
+        self.maxsize = maxsize
+        # (tz, sessionend, dtstr) -> (eos ts, eos, eos num, day, day num)
+        self._days = dict()
+        self._midnights = dict()  # dtstr -> epoch seconds
+
+    def _day(self, dtstr, sessionend, tz):
+        key = (tz, sessionend, dtstr)
+        entry = self._days.get(key)
+        if entry is None:
+            dt = datetime.strptime(dtstr, '%Y%m%d')
+            dteos = datetime.combine(dt, sessionend)
+            if tz:
+                dteostz = tz.localize(dteos)
+                dteos = dteostz.astimezone(UTC).replace(tzinfo=None)
+
+            eosts = calendar.timegm(dteos.timetuple()) + dteos.microsecond / 1e6
+            entry = (eosts, dteos, self._date2num(dteos), dt, self._date2num(dt))
+            if len(self._days) >= self.maxsize:
+                self._days.clear()
+            self._days[key] = entry
+
+        return entry
+
+    def epoch(self, dtstr, daily):
+        '''Returns the raw timestamp of a bar as epoch seconds (midnight UTC
+        for daily and larger bars)'''
+        if not daily:
+            return int(dtstr)
+
+        t = self._midnights.get(dtstr)
+        if t is None:
+            if len(self._midnights) >= self.maxsize:
+                self._midnights.clear()
+            t = calendar.timegm(datetime.strptime(dtstr, '%Y%m%d').timetuple())
+            self._midnights[dtstr] = t
+
+        return t
+
+    def convert(self, dtstr, daily, sessionend, tz, now=None):
+        '''Returns ``(datetime, date2num)`` for the date string of a bar'''
+        if daily:
+            eosts, dteos, eosnum, dt, dtnum = self._day(dtstr, sessionend, tz)
+            # When requesting for example daily bars, the current day will be
+            # returned with the already happened data. If the session end were
+            # added, the new ticks wouldn't make it through, because they
+            # happen before the end of time
+            if eosts <= (now or time.time()):
+                return dteos, eosnum
+
+            return dt, dtnum
+
+        t = int(dtstr)
+        days, secs = divmod(t, SECONDS_PER_DAY)  # inlined epoch2num
+        return (datetime.utcfromtimestamp(t),
+                float(days + EPOCH_ORDINAL) + secs / float(SECONDS_PER_DAY))
+
+    @staticmethod
+    def _date2num(dt):
+        if dt.microsecond:
+            return date2num(dt)
+
+        return epoch2num(calendar.timegm(dt.timetuple()))
+
+    def convert_many(self, dtstrs, daily, sessionend, tz):
+        '''Returns the lists of ``datetime`` and ``date2num`` values for the
+        date strings (or epoch seconds for intraday bars) of several bars'''
+        if daily or np is None:
+            now = time.time()
+            pairs = [self.convert(dtstr, daily, sessionend, tz, now)
+                     for dtstr in dtstrs]
+            return [p[0] for p in pairs], [p[1] for p in pairs]
+
+        epochs = np.asarray([int(x) for x in dtstrs], dtype=np.int64)
+        days, secs = np.divmod(epochs, SECONDS_PER_DAY)
+        nums = (days + EPOCH_ORDINAL).astype(np.float64)
+        nums += secs / float(SECONDS_PER_DAY)
+        dts = epochs.astype('datetime64[s]').tolist()
+        return dts, nums.tolist()
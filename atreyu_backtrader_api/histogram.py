@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Latency histograms for the instrumentation of the store
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+
+class LatencyHistogram(object):
+    '''Fixed memory histogram of integer values (nanoseconds)
+
+    Values are put in log-linear buckets: each power of two is split in
+    ``2 ** SUBBITS`` buckets, which bounds the relative error of the reported
+    percentiles to ``1 / 2 ** SUBBITS`` (12.5%). Recording is a couple of
+    integer operations and a list increment, cheap enough to be done for each
+    message received from TWS
+
+    Recording is not locked. It is meant to be done from a single thread (the
+    one running the callback being measured) and the readings taken from
+    other threads are a consistent enough snapshot for monitoring
+    '''
+    SUBBITS = 3
+    SUBCOUNT = 1 << SUBBITS
+    LINEAR = SUBCOUNT << 1  # values below are recorded exactly
+    NBUCKETS = LINEAR + SUBCOUNT * 64
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.buckets = [0] * self.NBUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        if value < self.LINEAR:
+            idx = value if value > 0 else 0
+        else:
+            exp = value.bit_length() - self.SUBBITS - 1
+            idx = self.LINEAR + (exp - 1) * self.SUBCOUNT + \
+                (value >> exp) - self.SUBCOUNT
+
+        self.buckets[idx] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def _upper(self, idx):
+        # Highest value which can be recorded in bucket idx
+        if idx < self.LINEAR:
+            return idx
+
+        exp, sub = divmod(idx - self.LINEAR, self.SUBCOUNT)
+        exp += 1
+        return ((self.SUBCOUNT + sub + 1) << exp) - 1
+
+    def percentile(self, pct):
+        '''Returns the value below which ``pct`` percent of the recorded values
+        are (upper bound of the bucket, capped to the maximum seen)'''
+        if not self.count:
+            return 0
+
+        target = max(1, int(self.count * pct / 100.0 + 0.5))
+        seen = 0
+        for idx, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min(self._upper(idx), self.max)
+
+        return self.max
+
+    def report(self):
+        '''Returns a dict with count, mean, p50, p99 and max'''
+        count = self.count
+        return dict(
+            count=count,
+            mean=self.total / count if count else 0.0,
+            p50=self.percentile(50),
+            p99=self.percentile(99),
+            max=self.max,
+        )
+
+    def __str__(self):
+        r = self.report()
+        return (f'count: {r["count"]} p50: {r["p50"] / 1e3:.1f}us '
+                f'p99: {r["p99"] / 1e3:.1f}us max: {r["max"] / 1e3:.1f}us')
+
+
+class TickLatency(object):
+    '''Latency of the live messages of an instrument, from the stamps
+    (``perf_counter_ns``) set by the store: ``tin`` when the message is
+    received (decoded) and ``tenq`` when it is put in the queue of the data.
+    ``record`` is called when the data takes it out of the queue
+
+      - ``store``: from reception to the queue (message building, journal)
+      - ``queue``: time waiting in the queue
+      - ``total``: from reception until the data takes it
+
+    Recorded from a single thread (the one running the datas)
+    '''
+    __slots__ = ('store', 'queue', 'total')
+
+    def __init__(self):
+        self.store = LatencyHistogram()
+        self.queue = LatencyHistogram()
+        self.total = LatencyHistogram()
+
+    def record(self, msg, tdeq):
+        tin = getattr(msg, 'tin', 0)
+        if not tin:
+            return  # not stamped (replayed, historical)
+
+        tenq = msg.tenq
+        self.store.record(tenq - tin)
+        self.queue.record(tdeq - tenq)
+        self.total.record(tdeq - tin)
+
+    def reset(self):
+        for hist in (self.store, self.queue, self.total):
+            hist.reset()
+
+    def report(self):
+        '''Returns a dict with the report of each histogram'''
+        return dict(store=self.store.report(), queue=self.queue.report(),
+                    total=self.total.report())
+
+    def __str__(self):
+        return f'total: {self.total} queue: {self.queue} store: {self.store}'
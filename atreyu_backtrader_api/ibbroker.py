@@ -40,6 +40,7 @@ from backtrader.metabase import MetaParams
 from backtrader.comminfo import CommInfoBase
 from backtrader.position import Position
 from atreyu_backtrader_api import ibstore
+from atreyu_backtrader_api.orderbook import OrderIndex, qty
 from backtrader.utils import AutoDict, AutoOrderedDict
 from backtrader.comminfo import CommInfoBase
 
@@ -264,8 +265,29 @@ class IBBroker(with_metaclass(MetaIBBroker, BrokerBase)):
         management which would also allow tradeid with multiple ids (profit and
         loss would also be calculated locally), but could be considered to be
         defeating the purpose of working with a live broker
+
+    Params:
+
+      - ``orderkeep`` (default: ``1000``)
+
+        Number of finished (completed, cancelled, ...) orders kept in memory
+        after the last notification. Older ones are dropped or archived
+
+      - ``orderarchive`` (default: ``None``)
+
+        Path to an SQLite file in which the finished orders dropped from
+        memory are archived (see ``get_archived_order``)
+
+      - ``execpending`` (default: ``10000``)
+
+        Maximum number of executions waiting for their commission report (and
+        of reported execution ids remembered to discard duplicates)
     '''
-    params = ()
+    params = (
+        ('orderkeep', 1000),  # finished orders kept in memory
+        ('orderarchive', None),  # path to sqlite file for evicted orders
+        ('execpending', 10000),  # executions waiting for commission
+    )
 
     def __init__(self, **kwargs):
         super(IBBroker, self).__init__()
@@ -275,9 +297,10 @@ class IBBroker(with_metaclass(MetaIBBroker, BrokerBase)):
         self.startingvalue = self.value = 0.0
 
         self._lock_orders = threading.Lock()  # control access
-        self.orderbyid = dict()  # orders by order id
-        self.executions = dict()  # notified executions
-        self.ordstatus = collections.defaultdict(dict)
+        # orders by order id and executions waiting for commission reports
+        self.orderbyid = OrderIndex(self.p.orderkeep, self.p.orderarchive,
+                                    self.p.execpending)
+        self.ordstatus = dict()  # order id -> last status with fills
         self.notifs = queue.Queue()  # holds orders which are notified
         self.tonotify = collections.deque()  # hold oids to be notified
 
@@ -307,6 +330,12 @@ class IBBroker(with_metaclass(MetaIBBroker, BrokerBase)):
         logger.debug(f"getvalue: {self.value}")
         return self.value
 
+    def getaccversion(self):
+        '''Returns the version of the account values (cash, value, ...) of
+        the store. It changes with each update received from TWS and can be
+        used to skip work if nothing has changed'''
+        return self.ib.get_acc_version()
+
     def getposition(self, data, clone=True):
         position = self.ib.getposition(data.tradecontract, clone=clone)
         logger.info(f"getposition: {position}")
@@ -338,7 +367,8 @@ class IBBroker(with_metaclass(MetaIBBroker, BrokerBase)):
         if order.oco is None:  # Generate a UniqueId
             order.ocaGroup = bytes(uuid.uuid4())
         else:
-            order.ocaGroup = self.orderbyid[order.oco.orderId].ocaGroup
+            oco = self.orderbyid.get(order.oco.orderId, order.oco)
+            order.ocaGroup = oco.ocaGroup
 
         self.orderbyid[order.orderId] = order
         self.ib.placeOrder(order.orderId, order.data.tradecontract, order)
@@ -401,6 +431,21 @@ class IBBroker(with_metaclass(MetaIBBroker, BrokerBase)):
 
     def notify(self, order):
         self.notifs.put(order.clone())
+        if not order.alive():  # finished: nothing else to be reported
+            self.orderbyid.finish(order)
+            self.ordstatus.pop(order.orderId, None)
+
+    def get_order_stats(self):
+        '''Returns the memory statistics of the order bookkeeping (see
+        ``OrderIndex.stats``) and the number of ``statuses`` held'''
+        stats = self.orderbyid.stats()
+        stats['statuses'] = len(self.ordstatus)
+        return stats
+
+    def get_archived_order(self, orderId):
+        '''Returns the archived record (dict) of a finished order no longer
+        kept in memory or ``None``'''
+        return self.orderbyid.archived(orderId)
 
     def get_notification(self):
         try:
@@ -426,6 +471,11 @@ class IBBroker(with_metaclass(MetaIBBroker, BrokerBase)):
         except KeyError:
             return  # not found, it was not an order
 
+        if not order.alive():
+            # Late repeats for a finished order: notify already dropped its
+            # status and storing it again would keep it forever
+            return
+
         if msg.status == self.SUBMITTED and msg.filled == 0:
             if order.status == order.Accepted:  # duplicate detection
                 return
@@ -472,27 +522,29 @@ class IBBroker(with_metaclass(MetaIBBroker, BrokerBase)):
         elif msg.status in [self.SUBMITTED, self.FILLED]:
             # These two are kept inside the order until execdetails and
             # commission are all in place - commission is the last to come
-            self.ordstatus[msg.orderId][msg.filled] = msg
+            self.ordstatus[msg.orderId] = msg
 
         elif msg.status in [self.PENDINGSUBMIT, self.PRESUBMITTED]:
             # According to the docs, these statuses can only be set by the
             # programmer but the demo account sent it back at random times with
             # "filled"
             if msg.filled:
-                self.ordstatus[msg.orderId][msg.filled] = msg
+                self.ordstatus[msg.orderId] = msg
         else:  # Unknown status ...
             pass
 
     def push_execution(self, ex):
-        self.executions[ex.execId] = ex
+        self.orderbyid.add_execution(ex)
 
     def push_commissionreport(self, cr):
         with self._lock_orders:
+            ex = self.orderbyid.pop_execution(cr.execId)
+            if ex is None:
+                return  # not of an order of ours or already reported
+
             try:
-                ex = self.executions.pop(cr.execId)
                 oid = ex.orderId
                 order = self.orderbyid[oid]
-                ostatus = self.ordstatus[oid].pop(ex.cumQty)
 
                 position = self.getposition(order.data, clone=False)
                 pprice_orig = position.price
@@ -537,9 +589,15 @@ class IBBroker(with_metaclass(MetaIBBroker, BrokerBase)):
                             margin, pnl,
                             float(psize), pprice)
 
-                if ostatus.status == self.FILLED:
+                # Exact comparison of quantities (not float keys): the
+                # order is complete when all its quantity has been executed
+                cumqty = qty(ex.cumQty)
+                ostatus = self.ordstatus.get(oid)
+                if (cumqty >= qty(order.totalQuantity) or
+                        (ostatus is not None and
+                         ostatus.status == self.FILLED and
+                         qty(ostatus.filled) == cumqty)):
                     order.completed()
-                    self.ordstatus.pop(oid)  # nothing left to be reported
                 else:
                     order.partial()
 
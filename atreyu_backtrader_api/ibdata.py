@@ -21,6 +21,7 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import array
 import datetime
 import time
 
@@ -41,8 +42,9 @@ class MetaIBData(DataBase.__class__):
         # Initialize the class
         super(MetaIBData, cls).__init__(name, bases, dct)
 
-        # Register with the store
-        ibstore.IBStore.DataCls = cls
+        # Register with the store (unless a feed which does not use it)
+        if dct.get('_register', True):
+            ibstore.IBStore.DataCls = cls
 
 
 class IBData(with_metaclass(MetaIBData, DataBase)):
@@ -216,6 +218,54 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
         the ``IBStore`` instance and the TWS server time is not in sync with
         that of the local computer
 
+      - ``conflate`` (default: ``False``)
+
+        Only for ``reqMktData``/tick-by-tick subscriptions. If ``True`` the
+        store keeps only the latest message of each kind pending for the data
+        (latest value wins, sizes of trades are accumulated) and the data
+        always reads the freshest state when falling behind
+
+      - ``qmaxsize`` (default: ``0``)
+
+        Maximum number of pending live messages for the data (``0`` is no
+        limit)
+
+      - ``qoverflow`` (default: ``block``)
+
+        What to do when ``qmaxsize`` is reached: ``block`` (the TWS API thread
+        waits), ``dropoldest`` (the oldest pending message is discarded) or
+        ``conflate`` (the new message replaces the pending one of the same
+        kind). The number of coalesced/dropped messages can be retrieved with
+        ``IBStore.get_queue_stats``
+
+      - ``storebars`` (default: ``False``)
+
+        Only for ``Seconds``/``Minutes`` datas using ``RTVolume`` (no
+        ``rtbar``). If ``True`` the store builds the bars of the
+        timeframe/compression of the data from the trades as they arrive and
+        only delivers the completed ones, instead of each tick. The bars are
+        labelled with their start time, as real time bars
+
+      - ``storebarspartial`` (default: ``0.0``)
+
+        With ``storebars``, if greater than ``0``, seconds between deliveries
+        of the bar in progress, which are then loaded as bars with the same
+        time. Meant for ``cerebro.replaydata``
+
+      - ``columnar`` (default: ``False``)
+
+        Only for ``historical`` downloads of bars with ``Cerebro(preload=True)``.
+        If ``True`` the whole download is collected in NumPy arrays and the
+        lines are filled in one go instead of loading the bars one by one.
+        The arrays (including the ``count`` and ``wap`` of the bars) are kept
+        in the ``histcolumns`` attribute. If NumPy is not available or filters
+        have been added to the data, the bars are loaded one by one
+
+      - ``numberOfTicks`` (default: ``1000``)
+
+        Ticks requested per page for historical ``Ticks`` downloads (``1000``
+        is the maximum). Pages are requested until the whole range is covered
+
       - ``tradename`` (default: ``None``)
         Useful for some specific cases like ``CFD`` in which prices are offered
         by one asset and trading happens in a different onel
@@ -259,6 +309,12 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
         ('backfill_from', None),  # additional data source to do backfill from
         ('latethrough', False),  # let late samples through
         ('tradename', None),  # use a different asset as order target
+        ('conflate', False),  # latest value wins for pending live ticks
+        ('qmaxsize', 0),  # max pending live messages (0: no limit)
+        ('qoverflow', 'block'),  # block, dropoldest, conflate
+        ('storebars', False),  # Seconds/Minutes bars built by the store
+        ('storebarspartial', 0.0),  # secs between bars in progress (replay)
+        ('columnar', False),  # preload historical bars in bulk (NumPy)
         ('numberOfTicks', 1000),  # Number of distinct data points. Max is 1000 per request.
         ('ignoreSize', False),  # Omit updates that reflect only changes in size, and not price. Applicable to Bid_Ask data requests.
     )
@@ -390,7 +446,7 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
             pass
 
         # Make the initial contract
-        precon = self.ib.makecontract(
+        precon = self._store.makecontract(
             symbol=symbol, sectype=sectype, exch=exch, curr=curr,
             expiry=expiry, strike=strike, right=right, mult=mult, 
             primaryExch=primaryExch, localSymbol=localSymbol)
@@ -411,6 +467,8 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
             # Requested timeframe/compression not supported by rtbars
             self._usertvol = True
 
+        self._storebars = self._storebarsize()
+
         self.contract = None
         self.contractdetails = None
         self.tradecontract = None
@@ -425,6 +483,7 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
         self._statelivereconn = False  # if reconnecting in live state
         self._subcription_valid = False  # subscription state
         self._storedmsg = dict()  # keep pending live message (under None)
+        self._ticklat = None  # latency of the live messages (if recorded)
 
         if not self.ib.connected():
             return
@@ -441,6 +500,8 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
             self.put_notification(self.DISCONNECTED)
             return
 
+        self._ticklat = self.ib.latencyfor(self.contract)
+
         if self.pretradecontract is None:
             # no different trading asset - default to standard asset
             self.tradecontract = self.contract
@@ -462,6 +523,98 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
             self._start_finish()  # to finish initialization
             self._st_start()
 
+    def preload(self):
+        '''Loads the historical download in bulk if ``columnar`` is set and
+        possible (else one by one)'''
+        if not self._canbulk():
+            return super(IBData, self).preload()
+
+        from atreyu_backtrader_api.columnar import BarColumns
+        import numpy as np
+
+        bars = BarColumns()
+        notif = self.DISCONNECTED  # end of historical
+        while True:
+            try:
+                msg = self.qhist.get(timeout=self.p.qcheck)
+            except queue.Empty:
+                if self.ib.validQueue(self.qhist):
+                    continue  # download still in progress
+                break
+
+            if msg is None:  # Conn broken during historical
+                self._subcription_valid = False
+                break
+
+            elif msg == -354 or msg == -420:  # not subscribed / no permissions
+                self._subcription_valid = False
+                notif = self.NOTSUBSCRIBED
+                break
+
+            elif msg == -1100 or msg == -504:  # connection lost
+                self._subcription_valid = False
+                break  # the download will not be completed
+
+            elif isinstance(msg, integer_types):
+                self.put_notification(self.UNKNOWN, msg)
+                continue
+
+            if msg.date is None:
+                break  # end of histdata
+
+            bars.append(msg)
+
+        self.histcolumns = columns = bars.arrays(self.fromdate, self.todate)
+        size = len(columns['datetime'])
+        for alias in self.getlinealiases():
+            values = columns.get(alias)
+            if values is None:
+                values = np.zeros(size)  # openinterest
+            getattr(self.lines, alias).array.frombytes(values.tobytes())
+
+        self._state = self._ST_OVER
+        self.put_notification(notif)
+
+        self._last()
+        self.home()
+
+    def _canbulk(self):
+        # Bulk loading is only possible for a pristine historical download of
+        # bars (no filters/input timezone which have to see each bar)
+        if not (self.p.columnar and self.p.historical):
+            return False
+
+        if self._timeframe == bt.TimeFrame.Ticks or self.contract is None:
+            return False
+
+        if self._state != self._ST_HISTORBACK or len(self.lines.datetime.array):
+            return False
+
+        if self._filters or self._ffilters or self._tzinput:
+            return False
+
+        if not isinstance(self.lines.datetime.array, array.array):
+            return False  # memory saving (deque) mode
+
+        try:
+            import numpy  # noqa: F401 keep the import very local
+        except ImportError:
+            return False
+
+        return True
+
+    def _storebarsize(self):
+        # Seconds of the bars to be built by the store (0: deliver ticks)
+        if not (self.p.storebars and self._usertvol):
+            return 0
+
+        if self._timeframe == TimeFrame.Seconds:
+            return self._compression
+        elif self._timeframe == TimeFrame.Minutes:
+            return 60 * self._compression
+
+        return 0
+
     def stop(self):
         '''Stops and tells the store to stop'''
         super(IBData, self).stop()
@@ -472,16 +625,32 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
         if self.contract is None or self._subcription_valid:
             return
 
+        qkwargs = dict(conflate=self.p.conflate, maxsize=self.p.qmaxsize,
+                       overflow=self.p.qoverflow)
         if self._usertvol and self._timeframe != bt.TimeFrame.Ticks:
-            self.qlive = self.ib.reqMktData(self.contract, self.p.what)
+            if self._storebars:
+                qkwargs.update(barsize=self._storebars,
+                               partial=self.p.storebarspartial)
+            self.qlive = self.ib.reqMktData(self.contract, self.p.what,
+                                            **qkwargs)
         elif self._usertvol and self._timeframe == bt.TimeFrame.Ticks:
-            self.qlive = self.ib.reqTickByTickData(self.contract, self.p.what)
+            self.qlive = self.ib.reqTickByTickData(self.contract, self.p.what,
+                                                   **qkwargs)
         else:
             self.qlive = self.ib.reqRealTimeBars(self.contract, what = self.p.what)
 
         self._subcription_valid = True
         return self.qlive
 
+    def resubdata(self):
+        '''The subscription has been lost (``1101``): request it again (only
+        if live data has been requested)'''
+        if self.p.historical:
+            return
+
+        self._subcription_valid = False
+        return self.reqdata()
+
     def canceldata(self):
         '''Cancels Market Data subscription, checking asset type and rtbar'''
         if self.contract is None:
@@ -577,6 +746,12 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
 
                 elif msg == -1101:  # conn broken/restored tickerId gone
                     # The message may be duplicated
+                    if self.ib.p.resubstagger > 0:
+                        # the store resubscribes the datas (staggered)
+                        if not self._statelivereconn:
+                            self._statelivereconn = self.p.backfill
+                        continue
+
                     self._subcription_valid = False
                     if not self._statelivereconn:
                         self._statelivereconn = self.p.backfill
@@ -598,11 +773,16 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
 
                 # Process the message according to expected return type
                 if not self._statelivereconn:
+                    if self._ticklat is not None:
+                        self._ticklat.record(msg, time.perf_counter_ns())
+
                     if self._laststatus != self.LIVE:
                         if self.qlive.qsize() <= 1:  # very short live queue
                             self.put_notification(self.LIVE)
 
-                    if self._usertvol and self._timeframe != bt.TimeFrame.Ticks:
+                    if self._storebars:
+                        ret = self._load_rtbar(msg)
+                    elif self._usertvol and self._timeframe != bt.TimeFrame.Ticks:
                         ret = self._load_rtvolume(msg)
                     elif self._usertvol and self._timeframe == bt.TimeFrame.Ticks:
                         ret = self._load_rtticks(msg)
@@ -632,20 +812,25 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
                     # passing None to fetch max possible in 1 request
                     dtbegin = None
 
-                dtend = msg.datetime if self._usertvol else msg.time
+                if self._usertvol and not self._storebars:
+                    dtend = msg.datetime
+                else:
+                    dtend = msg.time
 
                 if self._timeframe != bt.TimeFrame.Ticks:
                     self.qhist = self.ib.reqHistoricalDataEx(
                         contract=self.contract, enddate=dtend, begindate=dtbegin,
                         timeframe=self._timeframe, compression=self._compression,
                         what=self.p.what, useRTH=self.p.useRTH, tz=self._tz,
-                        sessionend=self.p.sessionend)
+                        sessionend=self.p.sessionend,
+                        priority=self.ib.PRIO_BACKFILL)
                 else:
                     # dtend = num2date(dtend)
                     self.qhist = self.ib.reqHistoricalTicksEx(
-                        contract=self.contract, enddate=dtend,
+                        contract=self.contract, enddate=dtend, begindate=dtbegin,
                         what=self.p.what, useRTH=self.p.useRTH, tz=self._tz,
-                        )
+                        priority=self.ib.PRIO_BACKFILL,
+                        numberOfTicks=self.p.numberOfTicks)
 
                 self._state = self._ST_HISTORBACK
                 self._statelivereconn = False  # no longer in live
@@ -657,6 +842,9 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
                 except queue.Empty:
                     if True:
                         if self.p.historical:  # only historical
+                            if self.ib.validQueue(self.qhist):
+                                continue  # download still in progress
+
                             self.put_notification(self.DISCONNECTED)
                             return False  # end of historical
 
@@ -680,6 +868,13 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
                     self.put_notification(self.NOTSUBSCRIBED)
                     return False
 
+                elif (msg == -1100 or msg == -504) and self.p.historical:
+                    # Connection (or the data connection of the request) lost:
+                    # nothing will end the download, which is the whole feed
+                    self._subcription_valid = False
+                    self.put_notification(self.DISCONNECTED)
+                    return False
+
                 elif isinstance(msg, integer_types):
                     # Unexpected notification for historical data skip it
                     # May be a "not connected not yet processed"
@@ -739,13 +934,16 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
             if self._timeframe == bt.TimeFrame.Ticks:
                 self.qhist = self.ib.reqHistoricalTicksEx(
                     contract=self.contract, enddate=dtend, begindate=dtbegin,
-                    what=self.p.what, useRTH=self.p.useRTH, tz=self._tz)
+                    what=self.p.what, useRTH=self.p.useRTH, tz=self._tz,
+                    priority=self.ib.PRIO_RESEARCH,
+                    numberOfTicks=self.p.numberOfTicks)
             else:
                 self.qhist = self.ib.reqHistoricalDataEx(
                     contract=self.contract, enddate=dtend, begindate=dtbegin,
                     timeframe=self._timeframe, compression=self._compression,
                     what=self.p.what, useRTH=self.p.useRTH, tz=self._tz,
-                    sessionend=self.p.sessionend)
+                    sessionend=self.p.sessionend,
+                    priority=self.ib.PRIO_RESEARCH)
 
             self._state = self._ST_HISTORBACK
             return True  # continue before
@@ -768,7 +966,13 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
         # contains open/high/low/close/volume prices
         # The historical data has the same data but with 'date' instead of
         # 'time' for datetime
-        dt = date2num(rtbar.time if not hist else rtbar.date)
+        if not hist:
+            dt = rtbar.dtnum
+        elif rtbar.dtnum is not None:
+            dt = rtbar.dtnum  # already converted by the store
+        else:
+            dt = date2num(rtbar.date)
+
         if dt < self.lines.datetime[-1] and not self.p.latethrough:
             return False  # cannot deliver earlier than already delivered
 
@@ -788,7 +992,7 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
         # of prices. Ideally the
         # contains open/high/low/close/volume prices
         # Datetime transformation
-        dt = date2num(rtvol.datetime)
+        dt = rtvol.dtnum
         if dt < self.lines.datetime[-1] and not self.p.latethrough:
             return False  # cannot deliver earlier than already delivered
 
@@ -807,7 +1011,7 @@ class IBData(with_metaclass(MetaIBData, DataBase)):
 
     def _load_rtticks(self, tick, hist=False):
 
-        dt = date2num(tick.datetime if not hist else tick.date)
+        dt = tick.dtnum if not hist else date2num(tick.date)
         if dt < self.lines.datetime[-1] and not self.p.latethrough:
             return False  # cannot deliver earlier than already delivered
 
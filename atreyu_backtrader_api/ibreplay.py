@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Data feed replaying the live market data recorded by the store (journal)
+# through the live logic of IBData, without TWS
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import datetime
+import os.path
+import time
+
+import backtrader as bt
+from backtrader.utils.py3 import queue, string_types
+
+from ibapi.common import TickAttribBidAsk, TickAttribLast
+
+from atreyu_backtrader_api import journal
+from atreyu_backtrader_api.ibdata import IBData
+from atreyu_backtrader_api.ibstore import (
+    RTBar, RTPrice, RTSize, RTTickBidAsk, RTTickLast, RTTickMidPoint,
+    RTVolume)
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# Kinds of journal records delivered for each kind of live subscription
+MKTDATA = (journal.PRICE, journal.SIZE, journal.RTVOLUME)
+TICKBYTICK = (journal.LAST, journal.BIDASK, journal.MIDPOINT)
+RTBARS = (journal.RTBAR,)
+
+
+def replaymessages(records, kinds, cashcode=0):
+    '''Yields (receive time ns, message) for the journal records of the given
+    ``kinds`` with the messages the store delivers for them when live.
+    ``cashcode`` is the tickType tracked for cash products (``0``: not cash)
+    '''
+    attriblast, attribbidask = TickAttribLast(), TickAttribBidAsk()
+    for t, ival, kind, ttype, v0, v1, v2, v3, v4, v5, v6 in records:
+        if kind not in kinds:
+            continue
+
+        if kind == journal.RTVOLUME:
+            msg = RTVolume(price=v0)
+            msg.size, msg.volume, msg.vwap, msg.single = v1, v2, v3, bool(v4)
+            msg.ms = ival
+            msg._settime(ival / 1000.0)
+
+        elif kind == journal.PRICE:
+            if v0 == -1.0:
+                continue  # halted stream, skipped by the store
+            if cashcode:
+                if ttype != cashcode:
+                    continue
+                msg = RTVolume(price=v0)
+            else:
+                msg = RTPrice(price=v0)
+            msg._settime(t / 1e9)
+
+        elif kind == journal.SIZE:
+            msg = RTSize(size=v0)
+            msg._settime(t / 1e9)
+
+        elif kind == journal.LAST:
+            msg = RTTickLast(ttype, ival, v0, v1, attriblast, '', '')
+        elif kind == journal.BIDASK:
+            msg = RTTickBidAsk(ival, v0, v1, v2, v3, attribbidask)
+        elif kind == journal.MIDPOINT:
+            msg = RTTickMidPoint(ival, v0)
+        elif kind == journal.RTBAR:
+            msg = RTBar(0, ival, v0, v1, v2, v3, v4, v5, int(v6))
+        else:
+            continue
+
+        yield t, msg
+
+
+class ReplayQueue(object):
+    '''Stands for the live queue of a data: ``get`` returns the messages of
+    ``messages`` (receive time ns, message) paced at ``speed`` times the
+    recorded pace (``0``: as fast as possible). ``queue.Empty`` is raised if
+    the next message is not due within ``timeout`` and when the messages are
+    exhausted (see ``exhausted``)
+    '''
+    def __init__(self, messages, speed=1.0):
+        self._messages = iter(messages)
+        self.speed = speed
+        self.exhausted = False
+        self.delivered = 0
+        self._next = None  # (receive time, message) not yet due
+        self._t0 = None  # (first receive time, monotonic time of replay)
+
+    def qsize(self):
+        return 0
+
+    def get(self, block=True, timeout=None):
+        nxt = self._next
+        if nxt is None:
+            try:
+                nxt = next(self._messages)
+            except StopIteration:
+                self.exhausted = True
+                raise queue.Empty
+
+        if self.speed:
+            if self._t0 is None:
+                self._t0 = (nxt[0], time.monotonic())
+
+            rt0, mt0 = self._t0
+            wait = mt0 + (nxt[0] - rt0) / 1e9 / self.speed - time.monotonic()
+            if wait > 0:
+                if timeout is not None and wait > timeout:
+                    self._next = nxt
+                    time.sleep(timeout)
+                    raise queue.Empty
+
+                time.sleep(wait)
+
+        self._next = None
+        self.delivered += 1
+        return nxt[1]
+
+
+class IBReplayData(IBData):
+    '''Replays the live market data recorded by ``IBStore`` (param
+    ``journal``) through the same live logic of ``IBData``: the messages the
+    store delivered are rebuilt from the journal and loaded (``_load``) as if
+    they came from TWS, which is not needed (no store is created)
+
+    The kind of recorded data used follows the parameters as for ``IBData``:
+    ``RTVolume``/tickPrice/tickSize (reqMktData), tick by tick (timeframe
+    ``Ticks``) or real time bars (``rtbar``). The contract is made from
+    ``dataname`` as for ``IBData``, but it is not resolved: the timezone has
+    to be given with ``tz`` (name or object), else times are in UTC
+
+    There is no backfilling: the data is live from the first recorded
+    message and ends (``DISCONNECTED``) when all have been delivered
+
+    Params:
+
+      - ``replay`` (default: ``None``)
+
+        Journal file, list of journal files (replayed in order) or journal
+        directory. In the latter case the files of all days for
+        ``journalname`` are replayed
+
+      - ``journalname`` (default: ``None``)
+
+        Name of the files of the instrument in the journal directory. ``None``
+        uses the name the store gives to the (unresolved) contract. The store
+        uses the ``conId`` for resolved contracts, as those of ``IBData``
+
+      - ``speed`` (default: ``1.0``)
+
+        Pace of the replay relative to the recorded one (``10.0`` is 10 times
+        faster). ``0`` delivers the messages as fast as they are consumed
+    '''
+    _register = False  # IBStore.getdata keeps on returning IBData
+
+    params = (
+        ('replay', None),  # journal file(s) or directory
+        ('journalname', None),  # name of the files in the journal directory
+        ('speed', 1.0),  # pace relative to the recorded one (0: no pacing)
+    )
+
+    def __init__(self, **kwargs):
+        self.ib = None  # no store
+        self.precontract = self.parsecontract(self.p.dataname)
+        self.pretradecontract = self.parsecontract(self.p.tradename)
+
+    def setenvironment(self, env):
+        # Skip IBData: there is no store for cerebro
+        super(IBData, self).setenvironment(env)
+
+    def _timeoffset(self):
+        return datetime.timedelta()
+
+    def _gettz(self):
+        # No contract details to take the timezone from: a name in ``tz`` is
+        # looked up directly
+        if not isinstance(self.p.tz, string_types):
+            return super(IBReplayData, self)._gettz()
+
+        try:
+            import pytz  # keep the import very local
+            return pytz.timezone(self.p.tz)
+        except (ImportError, LookupError):
+            return None
+
+    def replayfiles(self):
+        '''Returns the journal files to replay'''
+        replay = self.p.replay
+        if isinstance(replay, string_types):
+            if not os.path.isdir(replay):
+                return [replay]
+
+            name = self.p.journalname
+            if name is None:
+                name = journal.journal_name(self.precontract)
+            return journal.journal_files(replay, str(name))
+
+        return list(replay or ())
+
+    def _records(self, files):
+        for fname in files:
+            for record in journal.read_journal(fname):
+                yield record
+
+    def start(self):
+        super(IBData, self).start()
+
+        self._usertvol = not self.p.rtbar
+        tfcomp = (self._timeframe, self._compression)
+        if tfcomp < self.RTBAR_MINSIZE:
+            self._usertvol = True
+        self._storebars = 0  # the recorded ticks are replayed
+
+        self.contract = self.tradecontract = self.precontract
+        self.contractdetails = self.tradecontractdetails = None
+        if self.pretradecontract is not None:
+            self.tradecontract = self.pretradecontract
+
+        cashcode = 0
+        if self._usertvol and self._timeframe != bt.TimeFrame.Ticks:
+            kinds = MKTDATA
+            if self.contract.secType in ['CASH', 'CFD']:
+                cashcode = 2 if self.p.what == 'ASK' else 1
+        elif self._usertvol:
+            kinds = TICKBYTICK
+        else:
+            kinds = RTBARS
+
+        files = self.replayfiles()
+        if not files:
+            logger.warning(f'Nothing to replay for {self.p.dataname}')
+
+        msgs = replaymessages(self._records(files), kinds, cashcode)
+        self.qlive = ReplayQueue(msgs, self.p.speed)
+        self.qhist = None
+
+        self._state = self._ST_LIVE
+        self._statelivereconn = False
+        self._subcription_valid = True
+        self._storedmsg = dict()
+        self._ticklat = None
+
+    def stop(self):
+        super(IBData, self).stop()
+
+    def reqdata(self):
+        pass  # the replay is the only subscription
+
+    def canceldata(self):
+        pass
+
+    def _load(self):
+        ret = super(IBReplayData, self)._load()
+        if ret is None and self.qlive.exhausted:
+            self.put_notification(self.DISCONNECTED)
+            self._state = self._ST_OVER
+            return False
+
+        return ret
@@ -0,0 +1,938 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Local stand-in for TWS/IB Gateway speaking the IB socket protocol
+#
+# The simulator implements the server side of the (v100+) TWS API wire
+# protocol for the subset of messages used by IBStore/IBData/IBBroker. It is
+# meant to drive the real ``IBApi`` client offline to measure throughput,
+# backlog and latency of the tick path without a live TWS
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import asyncio
+import collections
+from datetime import datetime
+import itertools
+import json
+import math
+import random
+import struct
+import threading
+import time
+
+from backtrader.metabase import MetaParams
+from backtrader.utils.py3 import with_metaclass
+
+from ibapi.message import IN, OUT
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Version reported to the client at handshake. All messages below are encoded
+# with the field layout corresponding to this version (MIN_SERVER_VER_
+# REPLACE_FA_END), which is accepted by 9.81+ and 10.x python clients
+SERVER_VERSION = 157
+
+_LEN = struct.Struct('!I')
+
+_ERRMSGS = {
+    162: 'Historical Market Data Service error message:API historical data '
+         'query cancelled: pacing violation',
+    200: 'No security definition has been found for the request',
+    326: 'Unable to connect as the client id is already in use. '
+         'Retry with a unique client id.',
+    504: 'Not connected',
+    1100: 'Connectivity between IB and Trader Workstation has been lost.',
+    1101: 'Connectivity between IB and Trader Workstation has been restored '
+          '- data lost.',
+    1102: 'Connectivity between IB and Trader Workstation has been restored '
+          '- data maintained.',
+}
+
+# Barsize/duration units of the historical data requests in seconds
+_BARSECS = {
+    'secs': 1, 'sec': 1, 'min': 60, 'mins': 60, 'hour': 3600, 'hours': 3600,
+    'day': 86400, 'days': 86400, 'W': 7 * 86400, 'M': 30 * 86400,
+}
+
+_DURSECS = {
+    'S': 1, 'D': 86400, 'W': 7 * 86400, 'M': 30 * 86400, 'Y': 365 * 86400,
+}
+
+_TBT_TYPES = {'Last': 1, 'AllLast': 2, 'BidAsk': 3, 'MidPoint': 4}
+
+
+def _encode(fields):
+    '''Returns the length prefixed, null terminated wire format of fields'''
+    data = ('\0'.join(map(str, fields)) + '\0').encode()
+    return _LEN.pack(len(data)) + data
+
+
+def _parsetime(dtstr):
+    '''Parses the endDateTime/startDateTime of requests. Returns epoch secs'''
+    if not dtstr:
+        return time.time()
+
+    dtstr = dtstr.strip()
+    for fmt in ('%Y%m%d-%H:%M:%S', '%Y%m%d %H:%M:%S'):
+        try:
+            dt = datetime.strptime(dtstr[:17], fmt)
+        except ValueError:
+            continue
+        return (dt - datetime(1970, 1, 1)).total_seconds()
+
+    return time.time()
+
+
+class Scenario(with_metaclass(MetaParams, object)):
+    '''Scripted behaviour of the simulated gateway
+
+    Params:
+
+      - ``symbols`` (default: ``None``): symbols which can be resolved with
+        ``reqContractDetails``. ``None`` resolves any symbol
+
+      - ``rate`` (default: ``50.0``): ticks per second delivered for each
+        market data subscription
+
+      - ``duration`` (default: ``None``): seconds after which a subscription
+        stops ticking. ``None`` keeps it ticking until cancelled
+
+      - ``mix`` (default: ``('rtvolume',)``): messages generated per tick of a
+        ``reqMktData`` subscription. Any of ``rtvolume`` (tickString 48),
+        ``last`` (tickPrice/tickSize LAST) and ``bidask`` (tickPrice BID/ASK).
+        ``CASH`` contracts always get ``bidask``
+
+      - ``interval`` (default: ``0.005``): granularity in seconds of the tick
+        scheduler
+
+      - ``highwater`` (default: ``4 << 20``): bytes pending in the socket
+        after which ticks are dropped instead of queued
+
+      - ``histlatency`` (default: ``0.0``): seconds to wait before answering
+        historical data/ticks requests
+
+      - ``histpacing`` (default: ``0``): maximum number of historical requests
+        in a 10 minutes window before error 162 is returned. ``0`` disables it
+
+      - ``maxbars`` (default: ``100000``): maximum bars in a single answer
+
+      - ``cdlatency`` (default: ``0.0``): seconds to wait before answering
+        contract details requests
+
+      - ``fillafter`` (default: ``0.05``): seconds after which orders fill
+
+      - ``commission`` (default: ``1.0``): commission for each execution
+
+      - ``account`` (default: ``DU0000001``): managed account
+
+      - ``cash`` (default: ``1000000.0``): cash/net liquidation reported
+
+      - ``events`` (default: ``()``): scripted events. Each one is a sequence
+        ``(at, action, arg)`` where ``at`` is the time in seconds since the
+        start of the simulator and ``action`` is one of:
+
+          - ``error``: ``arg`` is the error code broadcast (1100, 1101, ...)
+          - ``pause``: stop ticking for ``arg`` seconds
+          - ``disconnect``: close all client connections
+
+      - ``seed`` (default: ``0``): seed of the random price walks
+    '''
+    params = (
+        ('symbols', None),
+        ('rate', 50.0),
+        ('duration', None),
+        ('mix', ('rtvolume',)),
+        ('interval', 0.005),
+        ('highwater', 4 << 20),
+        ('histlatency', 0.0),
+        ('histpacing', 0),
+        ('maxbars', 100000),
+        ('cdlatency', 0.0),
+        ('fillafter', 0.05),
+        ('commission', 1.0),
+        ('account', 'DU0000001'),
+        ('cash', 1000000.0),
+        ('events', ()),
+        ('seed', 0),
+    )
+
+    @classmethod
+    def fromfile(cls, filename, **kwargs):
+        '''Creates a scenario from a JSON file with the params as keys'''
+        with open(filename) as f:
+            params = json.load(f)
+
+        params.update(kwargs)
+        return cls(**params)
+
+
+class SimStats(object):
+    '''Counters of the traffic generated by the simulator'''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.tstart = time.monotonic()
+        self.msgs = 0  # messages written to the sockets
+        self.nbytes = 0  # bytes written to the sockets
+        self.ticks = 0  # market data ticks delivered
+        self.dropped = 0  # ticks dropped due to socket backpressure
+        self.backlog = 0  # bytes pending to be written (last sample)
+        self.backlog_peak = 0  # max bytes pending to be written
+        self.requests = collections.Counter()  # requests received by type
+
+    def report(self):
+        '''Returns a dict with the cumulative figures and rates'''
+        elapsed = max(time.monotonic() - self.tstart, 1e-9)
+        return dict(
+            elapsed=elapsed,
+            msgs=self.msgs,
+            msgs_s=self.msgs / elapsed,
+            mbytes_s=self.nbytes / elapsed / 1e6,
+            ticks=self.ticks,
+            ticks_s=self.ticks / elapsed,
+            dropped=self.dropped,
+            backlog=self.backlog,
+            backlog_peak=self.backlog_peak,
+            requests=dict(self.requests),
+        )
+
+    def __str__(self):
+        r = self.report()
+        return (f"{r['elapsed']:.1f}s msgs: {r['msgs']} ({r['msgs_s']:.0f}/s, "
+                f"{r['mbytes_s']:.2f} MB/s) ticks: {r['ticks']} "
+                f"({r['ticks_s']:.0f}/s) dropped: {r['dropped']} "
+                f"backlog: {r['backlog']} (peak {r['backlog_peak']}) bytes")
+
+
+class _Instrument(object):
+    '''State of a simulated contract'''
+    def __init__(self, conId, symbol, secType, exchange, currency, rng):
+        self.conId = conId
+        self.symbol = symbol
+        self.secType = secType
+        self.exchange = exchange or 'SMART'
+        self.currency = currency or 'USD'
+        self.rng = rng
+        self.base = 50.0 + (conId % 200)
+        self.price = self.base
+        self.volume = 0
+
+    def step(self):
+        '''Random walk of the last price'''
+        self.price = max(0.01, self.price + (self.rng.random() - 0.5) * 0.02)
+        return self.price
+
+    def histprice(self, t):
+        '''Deterministic price for a given epoch time (historical answers)'''
+        return self.base * (1.0 + 0.02 * math.sin(t / 7919.0 + self.conId))
+
+
+class _Subscription(object):
+    '''A streaming request (reqMktData, reqRealTimeBars, reqTickByTickData)'''
+    def __init__(self, conn, reqId, kind, inst, what=''):
+        self.conn = conn
+        self.reqId = reqId
+        self.kind = kind
+        self.inst = inst
+        self.what = what
+        self.t0 = time.monotonic()
+        self.sent = 0  # ticks accounted for (delivered + dropped)
+        self.dropped = 0
+
+
+class _GatewayConnection(asyncio.Protocol):
+    '''Server side of a single client connection'''
+
+    _handlers = {
+        OUT.START_API: 'startApi',
+        OUT.REQ_CURRENT_TIME: 'reqCurrentTime',
+        OUT.REQ_IDS: 'reqIds',
+        OUT.REQ_CONTRACT_DATA: 'reqContractDetails',
+        OUT.REQ_MKT_DATA: 'reqMktData',
+        OUT.CANCEL_MKT_DATA: 'cancelMktData',
+        OUT.REQ_REAL_TIME_BARS: 'reqRealTimeBars',
+        OUT.CANCEL_REAL_TIME_BARS: 'cancelRealTimeBars',
+        OUT.REQ_TICK_BY_TICK_DATA: 'reqTickByTickData',
+        OUT.CANCEL_TICK_BY_TICK_DATA: 'cancelTickByTickData',
+        OUT.REQ_HISTORICAL_DATA: 'reqHistoricalData',
+        OUT.CANCEL_HISTORICAL_DATA: 'cancelHistoricalData',
+        OUT.REQ_HISTORICAL_TICKS: 'reqHistoricalTicks',
+        OUT.PLACE_ORDER: 'placeOrder',
+        OUT.CANCEL_ORDER: 'cancelOrder',
+        OUT.REQ_ACCT_DATA: 'reqAccountUpdates',
+        OUT.REQ_POSITIONS: 'reqPositions',
+    }
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.p = sim.scenario.p
+        self.transport = None
+        self.clientId = None
+        self.handshaked = False
+        self.paused = False
+        self._buf = b''
+        self.subs = dict()  # reqId -> _Subscription
+        self.orders = dict()  # orderId -> order info dict
+
+    # Transport callbacks
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(high=self.p.highwater)
+        self.sim._conns.add(self)
+
+    def connection_lost(self, exc):
+        self.sim._conns.discard(self)
+        self.sim._clientIds.discard(self.clientId)
+        for sub in self.subs.values():
+            self.sim._subs.discard(sub)
+        self.subs.clear()
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+
+    def data_received(self, data):
+        buf = self._buf + data
+        if not self.handshaked:
+            if len(buf) < 8:
+                self._buf = buf
+                return
+            if not buf.startswith(b'API\0'):
+                self.transport.close()
+                return
+            buf = buf[4:]
+            size = _LEN.unpack_from(buf)[0]
+            if len(buf) < 4 + size:
+                self._buf = b'API\0' + buf
+                return
+            self.handshake(buf[4:4 + size].decode())
+            buf = buf[4 + size:]
+
+        while len(buf) >= 4:
+            size = _LEN.unpack_from(buf)[0]
+            if len(buf) < 4 + size:
+                break
+            fields = buf[4:4 + size].split(b'\0')[:-1]
+            buf = buf[4 + size:]
+            if fields:
+                self.dispatch([f.decode() for f in fields])
+
+        self._buf = buf
+
+    def handshake(self, versions):
+        # Client sends "v<min>..<max> [options]"
+        try:
+            vmin, vmax = versions.split()[0][1:].split('..')
+            vmin, vmax = int(vmin), int(vmax)
+        except ValueError:
+            logger.error(f"Bad handshake {versions!r}")
+            self.transport.close()
+            return
+
+        if not vmin <= SERVER_VERSION <= vmax:
+            logger.error(f"Unsupported client versions {versions!r}")
+            self.transport.close()
+            return
+
+        self.handshaked = True
+        conntime = datetime.utcnow().strftime('%Y%m%d %H:%M:%S') + ' UTC'
+        self.send(SERVER_VERSION, conntime)
+
+    def dispatch(self, fields):
+        msgid = int(fields[0])
+        name = self._handlers.get(msgid)
+        self.sim.stats.requests[name or msgid] += 1
+        if name is None:
+            logger.debug(f"Unhandled request {fields}")
+            return
+
+        try:
+            getattr(self, name)(fields)
+        except Exception as e:
+            logger.exception(f"Failed to process {name}: {e}")
+
+    # Output
+    def send(self, *fields):
+        data = _encode(fields)
+        self.transport.write(data)
+        stats = self.sim.stats
+        stats.msgs += 1
+        stats.nbytes += len(data)
+
+    def error(self, reqId, errorCode, errorString=None):
+        if errorString is None:
+            errorString = _ERRMSGS.get(errorCode, '')
+        self.send(IN.ERR_MSG, 2, reqId, errorCode, errorString)
+
+    def later(self, delay, fn, *args):
+        if delay:
+            self.sim._loop.call_later(delay, fn, *args)
+        else:
+            fn(*args)
+
+    def _contract(self, fields, idx):
+        # conId, symbol, secType, lastTradeDate, strike, right, multiplier,
+        # exchange, primaryExchange, currency, localSymbol starting at idx
+        conId, symbol, secType = fields[idx:idx + 3]
+        exchange = fields[idx + 7]
+        currency = fields[idx + 9]
+        localSymbol = fields[idx + 10]
+        return self.sim.instrument(symbol or localSymbol, secType, exchange,
+                                   currency, int(conId or 0))
+
+    # Requests
+    def startApi(self, fields):
+        clientId = int(fields[2])
+        if clientId in self.sim._clientIds:
+            self.error(-1, 326)
+            self.transport.close()
+            return
+
+        self.clientId = clientId
+        self.sim._clientIds.add(clientId)
+        self.send(IN.NEXT_VALID_ID, 1, self.sim.nextorderid())
+        self.send(IN.MANAGED_ACCTS, 1, self.p.account)
+
+    def reqCurrentTime(self, fields):
+        self.send(IN.CURRENT_TIME, 1, int(time.time()))
+
+    def reqIds(self, fields):
+        self.send(IN.NEXT_VALID_ID, 1, self.sim.nextorderid())
+
+    def reqContractDetails(self, fields):
+        # 9, version, reqId, conId, symbol, secType, ...
+        reqId = int(fields[2])
+        symbol = fields[4] or fields[13]
+        if self.p.symbols is not None and symbol not in self.p.symbols:
+            self.later(self.p.cdlatency, self.error, reqId, 200)
+            return
+
+        inst = self._contract(fields, 3)
+        self.later(self.p.cdlatency, self._contractData, reqId, inst)
+
+    def _contractData(self, reqId, inst):
+        tz = 'EST' if inst.secType != 'CASH' else 'US/Eastern'
+        self.send(
+            IN.CONTRACT_DATA, 8, reqId,
+            inst.symbol, inst.secType, '', 0.0, '', inst.exchange,
+            inst.currency, inst.symbol, inst.symbol, inst.symbol,
+            inst.conId, 0.01, 1, '', 'ACTIVETIM,LMT,MKT,STP', inst.exchange,
+            1, 0, f'{inst.symbol} SIMULATED', 'NASDAQ',
+            '', 'Simulated', 'Simulated', 'Simulated', tz, '', '',
+            '', 0, 0,  # evRule, evMultiplier, secIdList count
+            1, '', '', '26', '', 'COMMON')
+        self.send(IN.CONTRACT_DATA_END, 1, reqId)
+
+    def reqMktData(self, fields):
+        # 1, version, reqId, conId, symbol, secType, ...
+        reqId = int(fields[2])
+        inst = self._contract(fields, 3)
+        self.subscribe(_Subscription(self, reqId, 'mktdata', inst))
+
+    def reqRealTimeBars(self, fields):
+        reqId = int(fields[2])
+        inst = self._contract(fields, 3)
+        self.subscribe(_Subscription(self, reqId, 'rtbars', inst))
+
+    def reqTickByTickData(self, fields):
+        # 97, reqId, conId, symbol, ..., tradingClass, tickType
+        reqId = int(fields[1])
+        inst = self._contract(fields, 2)
+        what = _TBT_TYPES.get(fields[14], 1)
+        self.subscribe(_Subscription(self, reqId, 'tickbytick', inst, what))
+
+    def subscribe(self, sub):
+        old = self.subs.pop(sub.reqId, None)
+        if old is not None:
+            self.sim._subs.discard(old)
+        self.subs[sub.reqId] = sub
+        self.sim._subs.add(sub)
+
+    def cancelMktData(self, fields):
+        sub = self.subs.pop(int(fields[2]), None)
+        self.sim._subs.discard(sub)
+
+    cancelRealTimeBars = cancelMktData
+
+    def cancelTickByTickData(self, fields):
+        sub = self.subs.pop(int(fields[1]), None)
+        self.sim._subs.discard(sub)
+
+    def cancelHistoricalData(self, fields):
+        pass  # answers are sent in a single message
+
+    def reqHistoricalData(self, fields):
+        # 20, reqId, conId, symbol, secType, ltd, strike, right, mult, exch,
+        # primaryExch, currency, localSymbol, tradingClass, includeExpired,
+        # endDateTime, barSize, duration, useRTH, whatToShow, formatDate, ...
+        reqId = int(fields[1])
+        if not self.sim.histpacing():
+            self.later(self.p.histlatency, self.error, reqId, 162)
+            return
+
+        inst = self._contract(fields, 2)
+        end = _parsetime(fields[15])
+        barsize, duration = fields[16], fields[17]
+        datefmt = int(fields[20] or 1)
+        self.later(self.p.histlatency, self._historicalData,
+                   reqId, inst, end, barsize, duration, datefmt)
+
+    def _historicalData(self, reqId, inst, end, barsize, duration, datefmt):
+        n, unit = barsize.split()
+        barsecs = int(n) * _BARSECS[unit]
+        n, unit = duration.split()
+        dursecs = int(n) * _DURSECS[unit]
+
+        tend = int(end) - int(end) % barsecs
+        count = min(dursecs // barsecs, self.p.maxbars)
+        daily = barsecs >= 86400
+
+        fields = [IN.HISTORICAL_DATA, reqId]
+        tstart = tend - count * barsecs
+        fmt = '%Y%m%d-%H:%M:%S'
+        fields.append(datetime.utcfromtimestamp(tstart).strftime(fmt))
+        fields.append(datetime.utcfromtimestamp(tend).strftime(fmt))
+        fields.append(count)
+        for t in range(tstart, tend, barsecs):
+            if daily:
+                dtstr = datetime.utcfromtimestamp(t).strftime('%Y%m%d')
+            elif datefmt == 2:
+                dtstr = t
+            else:
+                dtstr = datetime.utcfromtimestamp(t).strftime(
+                    '%Y%m%d  %H:%M:%S')
+
+            o = inst.histprice(t)
+            c = inst.histprice(t + barsecs)
+            h = max(o, c) + 0.01
+            lo = min(o, c) - 0.01
+            vol = 100 + (t // barsecs) % 50 * 10
+            fields += [dtstr, round(o, 4), round(h, 4), round(lo, 4),
+                       round(c, 4), vol, round((o + c) / 2.0, 4), vol // 100]
+
+        self.send(*fields)
+
+    def reqHistoricalTicks(self, fields):
+        # 96, reqId, conId, symbol, ..., tradingClass, includeExpired,
+        # startDateTime, endDateTime, numberOfTicks, whatToShow, useRth, ...
+        reqId = int(fields[1])
+        if not self.sim.histpacing():
+            self.later(self.p.histlatency, self.error, reqId, 162)
+            return
+
+        inst = self._contract(fields, 2)
+        start, end = fields[15], fields[16]
+        nticks = min(int(fields[17] or 1000), 1000)
+        what = fields[18]
+        self.later(self.p.histlatency, self._historicalTicks,
+                   reqId, inst, start, end, nticks, what)
+
+    def _historicalTicks(self, reqId, inst, start, end, nticks, what):
+        # Ticks are generated at 4 ticks/second. Either forward from start or
+        # backwards from end. No ticks in the future
+        if start:
+            t0 = int(_parsetime(start) * 4)
+            t1 = min(t0 + nticks, int(time.time() * 4))
+        else:
+            t1 = int(_parsetime(end) * 4) + 1
+            t0 = t1 - nticks
+
+        ticks = [t / 4.0 for t in range(t0, max(t0, t1))]
+        if what == 'BID_ASK':
+            fields = [IN.HISTORICAL_TICKS_BID_ASK, reqId, len(ticks)]
+            for t in ticks:
+                p = inst.histprice(t)
+                fields += [int(t), 0, round(p - 0.01, 4), round(p + 0.01, 4),
+                           100, 100]
+        elif what == 'MIDPOINT':
+            fields = [IN.HISTORICAL_TICKS, reqId, len(ticks)]
+            for t in ticks:
+                fields += [int(t), '', round(inst.histprice(t), 4), 0]
+        else:
+            fields = [IN.HISTORICAL_TICKS_LAST, reqId, len(ticks)]
+            for t in ticks:
+                fields += [int(t), 0, round(inst.histprice(t), 4), 100,
+                           inst.exchange, '']
+
+        fields.append(1)  # done
+        self.send(*fields)
+
+    def placeOrder(self, fields):
+        # 3, orderId, conId, symbol, secType, ltd, strike, right, mult, exch,
+        # primaryExch, currency, localSymbol, tradingClass, secIdType, secId,
+        # action, totalQuantity, orderType, lmtPrice, auxPrice, ...
+        orderId = int(fields[1])
+        inst = self._contract(fields, 2)
+        action = fields[16]
+        qty = float(fields[17])
+        ordtype = fields[18]
+        lmtprice = float(fields[19] or 0.0)
+        order = dict(inst=inst, action=action, qty=qty, ordtype=ordtype,
+                     lmtprice=lmtprice, status='Submitted')
+        self.orders[orderId] = order
+        self.orderStatus(orderId, 'Submitted', 0.0, qty, 0.0)
+        self.later(self.p.fillafter, self._fill, orderId)
+
+    def orderStatus(self, orderId, status, filled, remaining, avgprice):
+        self.send(IN.ORDER_STATUS, orderId, status, filled, remaining,
+                  avgprice, orderId, 0, avgprice, self.clientId, '', 0.0)
+
+    def _fill(self, orderId):
+        order = self.orders.get(orderId)
+        if order is None or order['status'] != 'Submitted':
+            return
+
+        order['status'] = 'Filled'
+        inst = order['inst']
+        qty = order['qty']
+        price = order['lmtprice'] if order['ordtype'] == 'LMT' else inst.price
+        price = round(price, 2)
+        side = 'BOT' if order['action'] == 'BUY' else 'SLD'
+        execId = f'{inst.conId:08x}.{orderId:08x}.01.01'
+        now = datetime.utcnow().strftime('%Y%m%d %H:%M:%S') + ' UTC'
+
+        self.send(
+            IN.EXECUTION_DATA, -1, orderId,
+            inst.conId, inst.symbol, inst.secType, '', 0.0, '', '',
+            inst.exchange, inst.currency, inst.symbol, inst.symbol,
+            execId, now, self.p.account, inst.exchange, side, qty, price,
+            orderId, self.clientId, 0, qty, price, '', '', '', '', 1)
+        self.orderStatus(orderId, 'Filled', qty, 0.0, price)
+        self.send(IN.COMMISSION_REPORT, 1, execId, self.p.commission,
+                  inst.currency, 0.0, 1.7976931348623157e308, 0)
+
+        pos = self.sim.positions[inst.conId]
+        pos[0] += qty if side == 'BOT' else -qty
+        pos[1] = price
+
+    def cancelOrder(self, fields):
+        orderId = int(fields[2])
+        order = self.orders.get(orderId)
+        if order is None or order['status'] != 'Submitted':
+            self.error(orderId, 161, 'Cancel attempted when order is not in '
+                                     'a cancellable state')
+            return
+
+        order['status'] = 'Cancelled'
+        self.orderStatus(orderId, 'Cancelled', 0.0, order['qty'], 0.0)
+
+    def reqAccountUpdates(self, fields):
+        if not int(fields[2]):  # unsubscribe
+            return
+
+        acc = self.p.account
+        cash = self.p.cash
+        for key, currency in (('NetLiquidation', 'USD'),
+                              ('CashBalance', 'BASE'),
+                              ('CashBalance', 'USD'),
+                              ('AvailableFunds', 'USD')):
+            self.send(IN.ACCT_VALUE, 2, key, cash, currency, acc)
+
+        self.send(IN.ACCT_UPDATE_TIME, 1, time.strftime('%H:%M'))
+        self.send(IN.ACCT_DOWNLOAD_END, 1, acc)
+
+    def reqPositions(self, fields):
+        for conId, (pos, avgcost) in self.sim.positions.items():
+            inst = self.sim._byconid[conId]
+            self.send(IN.POSITION_DATA, 3, self.p.account,
+                      conId, inst.symbol, inst.secType, '', 0.0, '', '',
+                      inst.exchange, inst.currency, inst.symbol, inst.symbol,
+                      pos, avgcost)
+        self.send(IN.POSITION_END, 1)
+
+    # Streaming
+    def pump(self, sub, now, chunks):
+        '''Generates the ticks due for ``sub`` at ``now``. Returns the number
+        of messages added to chunks'''
+        p = self.p
+        if sub.kind == 'rtbars':
+            due = int((now - sub.t0) / 5.0) - sub.sent
+        else:
+            elapsed = now - sub.t0
+            if p.duration is not None:
+                elapsed = min(elapsed, p.duration)
+            due = int(elapsed * p.rate) - sub.sent
+
+        if due <= 0:
+            return 0
+
+        sub.sent += due
+        if self.paused or self.sim._paused:
+            sub.dropped += due
+            self.sim.stats.dropped += due
+            return 0
+
+        inst = sub.inst
+        reqId = sub.reqId
+        nmsgs = 0
+        for _ in range(due):
+            price = round(inst.step(), 2)
+            inst.volume += 100
+            if sub.kind == 'mktdata':
+                if inst.secType in ('CASH', 'CFD'):
+                    chunks.append(_encode((IN.TICK_PRICE, 6, reqId, 1,
+                                           price, 100000, 0)))
+                    chunks.append(_encode((IN.TICK_PRICE, 6, reqId, 2,
+                                           price + 0.0001, 100000, 0)))
+                    nmsgs += 2
+                    continue
+
+                for kind in p.mix:
+                    if kind == 'rtvolume':
+                        ms = int(time.time() * 1000)
+                        rtvol = f'{price};100;{ms};{inst.volume};{price};false'
+                        chunks.append(_encode((IN.TICK_STRING, 6, reqId, 48,
+                                               rtvol)))
+                        nmsgs += 1
+                    elif kind == 'last':
+                        chunks.append(_encode((IN.TICK_PRICE, 6, reqId, 4,
+                                               price, 100, 0)))
+                        nmsgs += 1
+                    elif kind == 'bidask':
+                        chunks.append(_encode((IN.TICK_PRICE, 6, reqId, 1,
+                                               price - 0.01, 100, 0)))
+                        chunks.append(_encode((IN.TICK_PRICE, 6, reqId, 2,
+                                               price + 0.01, 100, 0)))
+                        nmsgs += 2
+
+            elif sub.kind == 'tickbytick':
+                t = int(time.time())
+                if sub.what in (1, 2):
+                    fields = (IN.TICK_BY_TICK, reqId, sub.what, t, price, 100,
+                              0, inst.exchange, '')
+                elif sub.what == 3:
+                    fields = (IN.TICK_BY_TICK, reqId, 3, t, price - 0.01,
+                              price + 0.01, 100, 100, 0)
+                else:
+                    fields = (IN.TICK_BY_TICK, reqId, 4, t, price)
+                chunks.append(_encode(fields))
+                nmsgs += 1
+
+            else:  # rtbars
+                t = int(time.time())
+                t -= t % 5
+                chunks.append(_encode((IN.REAL_TIME_BARS, 3, reqId, t - 5,
+                                       price, price + 0.02, price - 0.02,
+                                       price, 500, price, 5)))
+                nmsgs += 1
+
+        return nmsgs
+
+
+class IBGatewaySimulator(object):
+    '''Simulated TWS/IB Gateway serving the IB API socket protocol
+
+    It can either be run in the foreground with ``run`` (see the command line
+    entry point at the end of the module) or in a background thread with
+    ``start``/``stop``, which is the way to drive an ``IBStore`` living in the
+    same process::
+
+        sim = IBGatewaySimulator(port=0, scenario=Scenario(rate=50.0))
+        sim.start()
+        store = IBStore(port=sim.port)
+        ...
+        print(sim.stats)
+        sim.stop()
+
+    ``port=0`` picks a free port, which is available in ``sim.port`` after
+    ``start``
+    '''
+    def __init__(self, host='127.0.0.1', port=7499, scenario=None):
+        self.host = host
+        self.port = port
+        self.scenario = scenario or Scenario()
+        self.stats = SimStats()
+
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+        self._conns = set()
+        self._subs = set()
+        self._clientIds = set()
+        self._paused = False
+
+        self._rng = random.Random(self.scenario.p.seed)
+        self._conids = itertools.count(100000)
+        self._orderids = itertools.count(1)
+        self._instruments = dict()  # (symbol, secType) -> _Instrument
+        self._byconid = dict()  # conId -> _Instrument
+        self._histreqs = collections.deque()  # times of historical requests
+        self.positions = collections.defaultdict(lambda: [0.0, 0.0])
+
+    def instrument(self, symbol, secType='STK', exchange='', currency='',
+                   conId=0):
+        '''Returns the simulated instrument, creating it if needed'''
+        if conId and conId in self._byconid:
+            return self._byconid[conId]
+
+        key = (symbol, secType or 'STK')
+        try:
+            return self._instruments[key]
+        except KeyError:
+            pass
+
+        inst = _Instrument(conId or next(self._conids), symbol, key[1],
+                           exchange, currency,
+                           random.Random(self._rng.random()))
+        self._instruments[key] = inst
+        self._byconid[inst.conId] = inst
+        return inst
+
+    def nextorderid(self):
+        return next(self._orderids)
+
+    def histpacing(self):
+        '''Returns ``True`` if a historical request fits the pacing window'''
+        maxreqs = self.scenario.p.histpacing
+        if not maxreqs:
+            return True
+
+        now = time.monotonic()
+        reqs = self._histreqs
+        while reqs and now - reqs[0] > 600.0:
+            reqs.popleft()
+
+        if len(reqs) >= maxreqs:
+            return False
+
+        reqs.append(now)
+        return True
+
+    # Event loop side
+    async def serve(self):
+        '''Starts listening and runs the tick scheduler until cancelled'''
+        self._loop = asyncio.get_running_loop()
+        self._server = await self._loop.create_server(
+            lambda: _GatewayConnection(self), self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Simulated gateway listening on {self.host}:{self.port}")
+
+        for at, action, arg in self.scenario.p.events:
+            self._loop.call_later(at, self._event, action, arg)
+
+        self.stats.reset()
+        self._started.set()
+        try:
+            await self._pump()
+        finally:
+            self._server.close()
+            for conn in list(self._conns):
+                conn.transport.close()
+
+    async def _pump(self):
+        interval = self.scenario.p.interval
+        stats = self.stats
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            byconn = collections.defaultdict(list)
+            for sub in list(self._subs):
+                chunks = byconn[sub.conn]
+                nmsgs = sub.conn.pump(sub, now, chunks)
+                if sub.kind != 'rtbars':
+                    stats.ticks += nmsgs
+
+            backlog = 0
+            for conn, chunks in byconn.items():
+                if chunks:
+                    data = b''.join(chunks)
+                    conn.transport.write(data)
+                    stats.msgs += len(chunks)
+                    stats.nbytes += len(data)
+                backlog += conn.transport.get_write_buffer_size()
+
+            stats.backlog = backlog
+            stats.backlog_peak = max(stats.backlog_peak, backlog)
+
+    def _event(self, action, arg):
+        logger.info(f"Scenario event: {action} {arg}")
+        if action == 'error':
+            for conn in list(self._conns):
+                if conn.clientId is not None:
+                    conn.error(-1, int(arg))
+        elif action == 'pause':
+            self._paused = True
+            self._loop.call_later(float(arg), self._resume)
+        elif action == 'disconnect':
+            for conn in list(self._conns):
+                conn.transport.close()
+        else:
+            logger.error(f"Unknown scenario action {action}")
+
+    def _resume(self):
+        self._paused = False
+
+    # Thread side
+    def start(self):
+        '''Runs the simulator in a background (daemon) thread'''
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def run(self):
+        '''Runs the simulator in the calling thread until ``stop``'''
+        try:
+            asyncio.run(self.serve())
+        except asyncio.CancelledError:
+            pass
+
+    def stop(self):
+        '''Stops a simulator started with ``start``'''
+        if self._loop is None:
+            return
+
+        def cancel():
+            for task in asyncio.all_tasks(self._loop):
+                task.cancel()
+
+        self._loop.call_soon_threadsafe(cancel)
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Simulated TWS/IB Gateway for offline throughput tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', default=7499, type=int)
+    parser.add_argument('--scenario', default=None,
+                        help='JSON file with the scenario params')
+    parser.add_argument('--rate', default=None, type=float,
+                        help='ticks per second per subscription')
+    parser.add_argument('--report', default=5.0, type=float,
+                        help='seconds in between statistics reports')
+    args = parser.parse_args(argv)
+
+    kwargs = dict()
+    if args.rate is not None:
+        kwargs['rate'] = args.rate
+
+    if args.scenario:
+        scenario = Scenario.fromfile(args.scenario, **kwargs)
+    else:
+        scenario = Scenario(**kwargs)
+
+    sim = IBGatewaySimulator(args.host, args.port, scenario).start()
+    try:
+        while True:
+            time.sleep(args.report)
+            print(sim.stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -22,7 +22,9 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 # import functools
+import asyncio
 import collections
+import contextlib
 from copy import copy, deepcopy
 from datetime import date, datetime, timedelta
 import inspect
@@ -31,12 +33,13 @@ import random
 import threading
 import time
 
-from backtrader import TimeFrame, Position
+from backtrader import TimeFrame, Position, date2num
 from backtrader.metabase import MetaParams
-from backtrader.utils.py3 import bytes, bstr, queue, with_metaclass, long
-from backtrader.utils import AutoDict, UTC
+from backtrader.utils.py3 import (bytes, bstr, queue, with_metaclass, long,
+                                  integer_types)
 
 import bisect
+import calendar
 
 bytes = bstr  # py2/3 need for ibpy
 
@@ -45,6 +48,22 @@ from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
 from ibapi.ticktype import TickTypeEnum
 
+from atreyu_backtrader_api.accounts import AccountSnapshot, copyvalues
+from atreyu_backtrader_api.aio import AsyncQueue
+from atreyu_backtrader_api.connpool import ConnectionPool
+from atreyu_backtrader_api.histogram import LatencyHistogram, TickLatency
+from atreyu_backtrader_api.journal import TickJournal
+from atreyu_backtrader_api.qmonitor import QueueMonitor, queue_counts
+from atreyu_backtrader_api.tickbars import TickBars
+from atreyu_backtrader_api.ringbuffer import RingQueue
+from atreyu_backtrader_api.conflation import ConflatingQueue
+from atreyu_backtrader_api.histcache import HistoricalCache
+from atreyu_backtrader_api.histdates import (
+    HistDateConverter, epoch2num, ms2num)
+from atreyu_backtrader_api.contractcache import ContractRegistry
+from atreyu_backtrader_api.dispatcher import SubscriptionDispatcher
+from atreyu_backtrader_api import pacing
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -59,36 +78,78 @@ def _ts2dt(tstamp=None):
     usec = msec * 1000
     return datetime.utcfromtimestamp(sec).replace(microsecond=usec)
 
-class ErrorMsg(object):
+class IBMsg(object):
+    '''Base class for the messages delivered by the store
+
+    Fields are kept in ``__slots__`` (no per instance ``__dict__``) and the
+    textual representation is only built when it is requested
+    '''
+    __slots__ = ()
+
+    def _asdict(self):
+        return {name: getattr(self, name)
+                for name in self.__slots__ if hasattr(self, name)}
+
+    def __str__(self):
+        return f'{self._asdict()}'
+
+class RTMsg(IBMsg):
+    '''Base class for the live market data messages. With ``ticklatency``
+    the store stamps them (``perf_counter_ns``) when received (``tin``) and
+    when put in the queue (``tenq``)
+
+    The time of the message is kept as UTC epoch seconds (``ts``) and its
+    ``date2num`` value (``dtnum``), which is what the data feeds load. The
+    ``datetime`` is only built if requested (logging, backfilling)
+    '''
+    __slots__ = ('tin', 'tenq', 'ts', 'dtnum', '_dt')
+
+    def _settime(self, ts, tmoffset=None):
+        if tmoffset is not None:
+            ts += tmoffset.total_seconds()
+        self.ts = ts
+        self.dtnum = epoch2num(ts)
+        self._dt = None
+
+    @property
+    def datetime(self):
+        if self._dt is None:
+            self._dt = datetime.utcfromtimestamp(self.ts)
+        return self._dt
+
+    @datetime.setter
+    def datetime(self, dt):
+        self._dt = dt
+        self.dtnum = date2num(dt)
+        self.ts = None  # only the datetime is known
+
+class ErrorMsg(IBMsg):
+    __slots__ = ('reqId', 'errorCode', 'errorString', 'advancedOrderRejectJson')
+
     def __init__(self, reqId, errorCode, errorString, advancedOrderRejectJson):
-        self.vars = vars()
-        del self.vars['self']
         self.reqId = reqId
         self.errorCode = errorCode
         self.errorString = errorString
         self.advancedOrderRejectJson = advancedOrderRejectJson
 
-    def __str__(self):
-        return f'{self.vars}'
+class OpenOrderMsg(IBMsg):
+    __slots__ = ('orderId', 'contract', 'order', 'orderState')
 
-class OpenOrderMsg(object):
     def __init__(self, orderId, contract, order, orderState):
-        self.vars = vars()
-        del self.vars['self']
         self.orderId = orderId
         self.contract = contract
         self.order = order
         self.orderState = orderState
 
-    def __str__(self):
-        return f'{self.vars}'
+class OrderStatusMsg(IBMsg):
+    __slots__ = ('orderId', 'status', 'filled', 'remaining', 'avgFillPrice',
+                 'permId', 'parentId', 'lastFillPrice', 'clientId', 'whyHeld',
+                 'mktCapPrice')
 
-class OrderStatusMsg(object):
     def __init__(self, orderId , status, filled,
                     remaining, avgFillPrice, permId,
                     parentId, lastFillPrice, clientId,
                     whyHeld, mktCapPrice):
-        self.vars = vars()
         self.orderId = orderId
         self.status = status
         self.filled = filled
@@ -101,90 +162,92 @@ class OrderStatusMsg(object):
         self.whyHeld = whyHeld
         self.mktCapPrice = mktCapPrice
 
-    def __str__(self):
-        return f'{self.vars}'
-
-class RTVolume(object):
+class RTVolume(RTMsg):
     '''Parses a tickString tickType 48 (RTVolume) event from the IB API into its
     constituent fields
 
     Supports using a "price" to simulate an RTVolume from a tickPrice event
+
+    The timestamp of the event is also kept as given (``ms``, epoch
+    milliseconds). ``ms`` is ``None`` for simulated events, which take the
+    current time
     '''
-    _fields = [
-        ('price', float),
-        ('size', float),
-        ('datetime', _ts2dt),
-        ('volume', float),
-        ('vwap', float),
-        ('single', bool)
-    ]
+    __slots__ = ('price', 'size', 'volume', 'vwap', 'single', 'ms')
 
     def __init__(self, rtvol='', price=None, tmoffset=None):
-        self.vars = vars()
-        # Use a provided string or simulate a list of empty tokens
-        tokens = iter(rtvol.split(';'))
-
-        # Put the tokens as attributes using the corresponding func
-        for name, func in self._fields:
-            setattr(self, name, func(next(tokens)) if rtvol else func())
+        if rtvol:
+            self._parse(rtvol)
+        else:
+            self.price = self.size = self.volume = self.vwap = 0.0
+            self.single = False
+            self.ms = None
+            self._settime(time.time(), tmoffset)
 
         # If price was provided use it
         if price is not None:
             self.price = price
 
-        if tmoffset is not None:
-            self.datetime += tmoffset
-
-    def __str__(self):
-        return f'{self.vars}'
-
-class RTPrice(object):
+    @classmethod
+    def parse(cls, rtvol):
+        '''Returns the message for the tickString ``rtvol``
+        (``price;size;ms;volume;vwap;single``). ``ValueError`` is raised if a
+        field is missing'''
+        msg = cls.__new__(cls)
+        msg._parse(rtvol)
+        return msg
+
+    def _parse(self, rtvol):
+        price, size, ms, volume, vwap, single = rtvol.split(';')
+        self.price = float(price)
+        self.size = float(size)
+        self.volume = float(volume)
+        self.vwap = float(vwap)
+        self.single = single == 'true'
+        self.ms = ms = int(ms)
+        self.ts = ms / 1000.0
+        self.dtnum = ms2num(ms)
+        self._dt = None
+
+class RTPrice(RTMsg):
     '''Set price from a tickPrice
     '''
+    __slots__ = ('price', 'size')
+
     def __init__(self, price, tmoffset=None):
-        self.vars = vars()
         # No size for tickPrice
         self.size = None
 
         # Set the price
         self.price = price
 
-        # Set price to when we received it
-        self.datetime = datetime.now()
-
-        if tmoffset is not None:
-            self.datetime += tmoffset
-
-    def __str__(self):
-        return f'{self.vars}'
+        # Set price to when we received it (server time)
+        self._settime(time.time(), tmoffset)
 
-class RTSize(object):
+class RTSize(RTMsg):
     '''Set size from a tickSize
     '''
+    __slots__ = ('price', 'size')
+
     def __init__(self, size, tmoffset=None):
-        self.vars = vars()
         # No size for tickPrice
         self.price = None
 
         # Set the size
         self.size = size
 
-        # Set price to when we received it
-        self.datetime = datetime.now()
+        # Set size to when we received it (server time)
+        self._settime(time.time(), tmoffset)
 
-        if tmoffset is not None:
-            self.datetime += tmoffset
-
-    def __str__(self):
-        return f'{self.vars}'
-
-class RTBar(object):
-    '''Set realtimeBar object
+class RTBar(RTMsg):
+    '''Set realtimeBar object. ``time`` (start of the bar) is given in epoch
+    seconds and is then the ``datetime`` of the message
     '''
+    __slots__ = ('reqId', 'open', 'high', 'low', 'close', 'volume', 'wap',
+                 'count')
+
     def __init__(self, reqId, time, open_, high, low, close, volume, wap, count):
-        self.vars = vars()
         self.reqId = reqId
-        self.time = time
+        self._settime(int(time))
         self.open = open_
         self.high = high
         self.low = low
@@ -193,16 +256,24 @@ class RTBar(object):
         self.wap = wap
         self.count = count
 
-    def __str__(self):
-        return f'{self.vars}'
+    @property
+    def time(self):
+        return self.datetime  # name of the field in the bars of ibapi
 
-class HistBar(object):
+# bar read from the historical cache, with the attributes of an ibapi BarData
+CachedBar = collections.namedtuple(
+    'CachedBar', 'date open high low close volume wap barCount')
+
+class HistBar(IBMsg):
     '''Set historicalBar object
     '''
+    __slots__ = ('reqId', 'date', 'dtnum', 'open', 'high', 'low', 'close',
+                 'volume', 'wap', 'count')
+
     def __init__(self, reqId, bar):
-        self.vars = vars()
         self.reqId = reqId
         self.date = bar.date
+        self.dtnum = None  # date2num of date, set by the store
         self.open = bar.open
         self.high = bar.high
         self.low = bar.low
@@ -211,14 +282,16 @@ class HistBar(object):
         self.wap = bar.wap
         self.count = bar.barCount
 
-    def __str__(self):
-        return f'{self.vars}'
-
-class HistTick(object):
+class HistTick(IBMsg):
     '''Set historicalTick object: 'MIDPOINT', 'BID_ASK', 'TRADES' 
     '''
+    # Only the fields corresponding to dataType are set
+    __slots__ = ('time', 'date', 'tickType', 'dataType', 'price', 'size',
+                 'unreported', 'pastlimit', 'bidPrice', 'askPrice',
+                 'bidSize', 'askSize')
+
     def __init__(self, tick, dataType):
-        self.vars = vars()
+        self.time = tick.time  # epoch seconds (utc)
         self.date = datetime.utcfromtimestamp(tick.time)
         self.tickType = tick.tickType if hasattr(tick, 'tickType') else int(0)
         self.dataType = dataType
@@ -238,16 +311,15 @@ class HistTick(object):
         # self.exchange = tick.exchange
         # self.specialconditions = tick.tickAttribLast.specialConditions
 
-    def __str__(self):
-        return f'{self.vars}'
-
-class RTTickLast(object):
+class RTTickLast(RTMsg):
     '''Set realtimeTick object: 'TRADES' 
     '''
+    __slots__ = ('dataType', 'tickType', 'price', 'size', 'pastlimit',
+                 'unreported')
+
     def __init__(self, tickType, time, price, size, tickAtrribLast, exchange, specialConditions):
-        self.vars = vars()
         self.dataType = "RT_TICK_LAST"
-        self.datetime = datetime.utcfromtimestamp(time)
+        self._settime(time)
         # self.tickType = TickTypeEnum.to_str(tickType)
         self.tickType = tickType
         self.price = price
@@ -257,16 +329,15 @@ class RTTickLast(object):
         # self.exchange = exchange
         # self.specialConditions = specialConditions
 
-    def __str__(self):
-        return f'{self.vars}'
-
-class RTTickBidAsk(object):
+class RTTickBidAsk(RTMsg):
     '''Set realtimeTick object: 'MIDPOINT', 'BID_ASK', 'TRADES' 
     '''
+    __slots__ = ('dataType', 'bidPrice', 'askPrice', 'bidSize', 'askSize',
+                 'bidPastLow', 'askPastHigh')
+
     def __init__(self, time, bidPrice, askPrice, bidSize, askSize, tickAttribBidAsk):
-        self.vars = vars()
         self.dataType = "RT_TICK_BID_ASK"
-        self.datetime = datetime.utcfromtimestamp(time)
+        self._settime(time)
         self.bidPrice = bidPrice
         self.askPrice = askPrice
         self.bidSize = float(bidSize)
@@ -274,20 +345,147 @@ class RTTickBidAsk(object):
         self.bidPastLow = tickAttribBidAsk.bidPastLow
         self.askPastHigh = tickAttribBidAsk.askPastHigh
 
-    def __str__(self):
-        return f'{self.vars}'
-
-class RTTickMidPoint(object):
+class RTTickMidPoint(RTMsg):
     '''Set realtimeTick object: 'MIDPOINT'
     '''
+    __slots__ = ('dataType', 'midPoint')
+
     def __init__(self, time, midPoint):
-        self.vars = vars()
         self.dataType = "RT_TICK_MIDPOINT"
-        self.datetime = datetime.utcfromtimestamp(time)
+        self._settime(time)
         self.midPoint = midPoint
 
-    def __str__(self):
-        return f'{self.vars}'
+def conflatemsg(old, new):
+    '''Merges ``new`` into the pending ``old`` message of a conflating queue.
+
+    The latest values win, but the sizes of trades are accumulated to keep
+    the traded volume. ``new`` is copied before being modified, because it may
+    also be in the queues of other consumers (shared subscriptions)
+    '''
+    if isinstance(new, (RTVolume, RTTickLast)) and old.size and new.size:
+        new = copy(new)
+        new.size += old.size
+
+    return new
+
+class HistSegments(object):
+    '''State of a historical data request downloaded as several concurrent
+    segments (requests to TWS)
+
+    The bars of each segment are kept apart and released in chronological
+    order: those of the oldest unfinished segment as they arrive, those of
+    the following ones once all previous segments are complete. Bars already
+    released (overlap in between segments) are discarded
+    '''
+    def __init__(self, tickerId, q, segments):
+        self.tickerId = tickerId  # request as seen by the data feed
+        self.q = q
+        self.pending = collections.deque(enumerate(segments))
+        self.bufs = [list() for _ in segments]
+        self.done = [False] * len(segments)
+        self.cur = 0  # oldest unfinished segment
+        self.inflight = 0
+        self.issued = collections.deque()  # times of the requests (pacing)
+        self.failed = False
+        self.last = None  # time of the last released bar
+        self.priority = None  # lane for the pacing scheduler
+        self.lock = threading.Lock()
+
+    def _release(self, msgs):
+        out = list()
+        for msg in msgs:
+            t = int(msg.date)  # epoch seconds or YYYYMMDD, both sortable
+            if self.last is None or t > self.last:
+                self.last = t
+                out.append(msg)
+
+        return out
+
+    def put(self, idx, msg):
+        '''Returns the bars which can be delivered after receiving msg'''
+        with self.lock:
+            if self.failed:
+                return []
+            if idx == self.cur:
+                return self._release((msg,))
+
+            self.bufs[idx].append(msg)
+            return []
+
+    def end(self, idx):
+        '''Marks segment idx as complete. Returns the bars which can be
+        delivered and whether the whole request is complete'''
+        with self.lock:
+            self.inflight -= 1
+            self.done[idx] = True
+            out = list()
+            while self.cur < len(self.done) and self.done[self.cur]:
+                self.cur += 1
+                if self.cur < len(self.done):
+                    out.extend(self._release(self.bufs[self.cur]))
+                    self.bufs[self.cur] = None
+
+            return out, self.cur >= len(self.done) and not self.failed
+
+class HistSegmentSink(object):
+    '''Stands in the store queues for a segment of a concurrent historical
+    request, to receive the notifications (errors) addressed to it'''
+    def __init__(self, store, hseg):
+        self.store = store
+        self.hseg = hseg
+
+    def put(self, msg):
+        self.store._histsegfail(self.hseg, msg)
+
+    def qsize(self):
+        return 0
+
+def putcontrol(q, msg):
+    '''Puts a control message (end of data, connection codes) in data queue
+    q from a thread which may not be the one producing its data (see
+    ``RingQueue.put_control``)'''
+    put = getattr(q, 'put_control', None)
+    if put is None:
+        put = q.put  # the queue takes a lock already
+    put(msg)
+
+class SharedSubscription(object):
+    '''Stands in the store queues for a streaming request (``key``) shared by
+    several consumers, each with its own queue, to which the messages are
+    fanned out. The consumers are kept in a tuple which is replaced (not
+    modified) when one joins or leaves'''
+    def __init__(self, key, tickerId):
+        self.key = key
+        self.tickerId = tickerId
+        self.queues = ()
+
+    def add(self, q):
+        self.queues += (q,)
+
+    def remove(self, q):
+        '''Removes q and returns the number of consumers left'''
+        self.queues = tuple(x for x in self.queues if x is not q)
+        return len(self.queues)
+
+    def put(self, msg):
+        for q in self.queues:
+            q.put(msg)
+
+    def put_control(self, msg):
+        for q in self.queues:
+            putcontrol(q, msg)
+
+    def qsize(self):
+        return max((q.qsize() for q in self.queues), default=0)
+
+    @property
+    def coalesced(self):
+        return sum(getattr(q, 'coalesced', 0) for q in self.queues)
+
+    @property
+    def dropped(self):
+        return sum(getattr(q, 'dropped', 0) for q in self.queues)
+
 
 class MetaSingleton(MetaParams):
     '''Metaclass to make a metaclassed class a singleton'''
@@ -303,27 +501,78 @@ class MetaSingleton(MetaParams):
         return cls._singleton
 
 def logibmsg(fn):
-    def logmsg_decorator(self, *args, **kwargs):
+    '''Marks ``fn`` as a method to be logged (``_debug``) and/or measured
+    (``cbstats``).
+
+    The method is returned untouched: the wrapping is resolved per instance
+    by ``bindlogibmsg`` when the object is created, so that with debugging
+    and statistics off the raw methods are called without an additional
+    frame
+    '''
+    fn._logibmsg = True
+    return fn
+
+def _wrapibmsg(meth, name, debug, hist, lock=None):
+    def logmsg_decorator(*args, **kwargs):
         try:
-            if self._debug:
+            if debug:
                 args_repr = [repr(a) for a in args]
                 kwargs_repr = [f"{k}={v!r}" for k, v in kwargs.items()]
                 signature = ", ".join(args_repr + kwargs_repr)
-                logger.debug(f"Calling {fn.__name__}({signature})")
-                print(f"Calling {fn.__name__}({signature})")
-            return fn(self, *args, **kwargs)
+                logger.debug(f"Calling {name}({signature})")
+                print(f"Calling {name}({signature})")
+            if hist is None:
+                return meth(*args, **kwargs)
+
+            t0 = time.perf_counter_ns()
+            try:
+                return meth(*args, **kwargs)
+            finally:
+                if lock is None:
+                    hist.record(time.perf_counter_ns() - t0)
+                else:
+                    with lock:  # several reader threads (data connections)
+                        hist.record(time.perf_counter_ns() - t0)
         except Exception as e:
-            logger.exception(f"Exception raised in {fn.__name__}. exception: {str(e)}")
+            logger.exception(f"Exception raised in {name}. exception: {str(e)}")
             raise e
 
     return logmsg_decorator
 
+def bindlogibmsg(obj, debug, cbstats=None, lock=None):
+    '''Binds on ``obj`` a logging/measuring wrapper for each of its methods
+    marked with ``logibmsg``.
+
+    ``cbstats`` is either ``None`` or a dict in which a ``LatencyHistogram``
+    per method (key ``Class.method``) will be stored. The histograms are
+    shared by all the objects bound with the same dict: if they are called
+    from several threads, ``lock`` serializes the recording
+    '''
+    if not debug and cbstats is None:
+        return  # the class attributes (raw methods) are used
+
+    seen = set()
+    for cls in type(obj).__mro__:
+        for name, fn in vars(cls).items():
+            if name in seen or not getattr(fn, '_logibmsg', False):
+                continue
+
+            seen.add(name)
+            hist = None
+            if cbstats is not None:
+                hist = cbstats.setdefault(fn.__qualname__, LatencyHistogram())
+
+            meth = fn.__get__(obj, type(obj))
+            setattr(obj, name,
+                    _wrapibmsg(meth, fn.__name__, debug, hist, lock))
+
 class IBApi(EWrapper, EClient):
-    def __init__(self, cb, _debug):
+    def __init__(self, cb, _debug, cbstats=None, cblock=None):
         EClient.__init__(self, self)
         EWrapper.__init__(self)
         self.cb = cb
         self._debug = _debug
+        bindlogibmsg(self, _debug, cbstats, cblock)
 
     @logibmsg
     def currentTime(self, time):
@@ -522,18 +771,24 @@ class IBApi(EWrapper, EClient):
         """
         for tick in ticks:
             self.cb.historicalTicks(reqId, HistTick(tick, 'RT_TICK_MIDPOINT'))
+        if done:
+            self.cb.historicalTicksEnd(reqId)
 
     @logibmsg
     def historicalTicksBidAsk(self, reqId, ticks, done):
         """returns historical tick data when whatToShow=BID_ASK"""
         for tick in ticks:
             self.cb.historicalTicks(reqId, HistTick(tick, 'RT_TICK_BID_ASK'))
+        if done:
+            self.cb.historicalTicksEnd(reqId)
 
     @logibmsg
     def historicalTicksLast(self, reqId, ticks, done):
         """returns tick-by-tick data for tickType = "Last" or "AllLast" """
         for tick in ticks:
             self.cb.historicalTicks(reqId, HistTick(tick, 'RT_TICK_LAST'))
+        if done:
+            self.cb.historicalTicksEnd(reqId)
 
     @logibmsg
     def tickByTickAllLast(self, reqId, tickType, time, price, size, tickAtrribLast, exchange, specialConditions):
@@ -548,13 +803,57 @@ class IBApi(EWrapper, EClient):
     @logibmsg
     def tickByTickMidPoint(self, reqId, time, midPoint):
         """returns tick-by-tick data for tickType = "MidPoint" """
-        self.cb.tickByTickBidAsk(reqId, time, midPoint)
+        self.cb.tickByTickMidPoint(reqId, time, midPoint)
 
     @logibmsg
     def tickString(self, reqId, tickType, value):
         self.cb.tickString(reqId, tickType, value)
 
 
+class DataConnection(IBApi):
+    '''Additional connection (own ``clientId``) carrying only data requests
+
+    The session callbacks (order ids, accounts, connection state) belong to
+    the main connection of the store and are not forwarded. Errors are only
+    forwarded if they refer to a request: connectivity errors (``reqId``
+    ``-1``) are also received by the main connection
+    '''
+    def __init__(self, cb, _debug, cbstats=None, clientId=None, cblock=None):
+        super(DataConnection, self).__init__(cb, _debug, cbstats, cblock)
+        self.poolid = clientId  # EClient resets clientId on disconnection
+        self.ready = threading.Event()  # managedAccounts received
+
+    @logibmsg
+    def currentTime(self, time):
+        pass
+
+    @logibmsg
+    def nextValidId(self, orderId):
+        logger.debug(f"Data connection {self.poolid} ready")
+
+    @logibmsg
+    def managedAccounts(self, accountsList):
+        self.ready.set()
+
+    @logibmsg
+    def connectionClosed(self):
+        if self.ready.is_set():  # else closed by the store
+            logger.warning(f"Data connection {self.poolid} closed")
+            self.ready.clear()
+            self.cb.dataconnLost(self)
+
+    @logibmsg
+    def error(self, reqId, errorCode, errorString, advancedOrderRejectJson = ""):
+        if reqId == -1:
+            # 21xx are informative (data farms), the rest connectivity
+            log = logger.debug if errorCode >= 2100 else logger.warning
+            log(f"Data connection {self.poolid}: {errorCode} {errorString}")
+            return
+
+        super(DataConnection, self).error(reqId, errorCode, errorString,
+                                          advancedOrderRejectJson)
+
+
 class IBStore(with_metaclass(MetaSingleton, object)):
     '''Singleton class wrapping an ibpy ibConnection instance.
 
@@ -587,6 +886,147 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
         Print all messages received from TWS as info output
 
+      - ``cbstats`` (default: ``False``)
+
+        Record the number of calls and the processing time of each of the
+        TWS callbacks (and store methods marked with ``logibmsg``). The
+        figures (count, p50, p99, max in nanoseconds) can be retrieved with
+        ``get_cbstats``. When off (and with ``_debug`` off) the callbacks are
+        dispatched without any intermediate wrapper. With ``dataconns`` the
+        recording is locked, because the callbacks run in several threads
+
+      - ``ringbuffer`` (default: ``0``)
+
+        If greater than ``0``, the queues of the streaming subscriptions
+        (``reqMktData``, ``reqRealTimeBars``, ``reqTickByTickData``) are
+        ``RingQueue`` instances of that size (rounded up to a power of 2)
+        instead of ``queue.Queue``. These are lock free for the single
+        producer (TWS API thread) and single consumer (the data feed). If the
+        ring is full, the API thread waits for the data feed to make room
+
+      - ``histconcurrency`` (default: ``1``)
+
+        Number of segments of a ``reqHistoricalDataEx`` download (range larger
+        than the maximum duration allowed by IB for the barsize) which are
+        requested concurrently. ``1`` requests a segment after the previous
+        one has been received. Regardless of the value, no more than 5
+        requests per 2 seconds are issued for a download, as per the IB
+        pacing rules, and the bars are delivered in chronological order
+
+      - ``histcache`` (default: ``None``)
+
+        Path to a SQLite file used to cache the bars downloaded with
+        ``reqHistoricalDataEx``. The parts of a request already on disk are
+        delivered from the file and only the missing gaps are requested to
+        TWS. The statistics can be retrieved with ``get_histcache_stats``
+
+      - ``pacing`` (default: ``False``)
+
+        If ``True`` the requests for historical data/ticks, contract details
+        and market data are not sent immediately, but queued in a
+        ``RequestScheduler`` which sends them respecting the IB pacing limits
+        (with priority for live subscriptions over backfilling over pure
+        historical downloads) and retries those cancelled by TWS with a
+        pacing violation. The metrics can be retrieved with
+        ``get_pacing_stats``
+
+      - ``contractcache`` (default: ``False``)
+
+        If ``True`` the answers of ``getContractDetails`` are kept in a
+        ``ContractRegistry`` and repeated resolutions (data feeds started
+        again, reconnections, same instrument in several feeds) do not go to
+        TWS. All the feeds of an instrument (on the same exchange) share the
+        same ``ContractDetails`` and ``Contract`` instances, which are never
+        modified afterwards. If it is a string, it is the path to a
+        SQLite file where the answers are also kept across runs. The hit/miss
+        counters can be retrieved with ``get_contractcache_stats``
+
+      - ``contractttl`` (default: ``86400.0``)
+
+        Seconds an answer of the ``contractcache`` is valid
+
+      - ``subworkers`` (default: ``4``)
+
+        Number of threads which run the subscribe/cancel calls of the datas
+        when they are (re)started or stopped. The time taken by each complete
+        round can be retrieved with ``get_subscription_stats``
+
+      - ``resubstagger`` (default: ``0.0``)
+
+        If greater than ``0``, after a ``1101`` event (connectivity restored,
+        data lost) the store resubscribes the live datas itself, in groups of
+        ``resubbatch`` datas separated by ``resubstagger`` seconds, instead of
+        each data resubscribing at once
+
+      - ``resubbatch`` (default: ``25``)
+
+      - ``dataconns`` (default: ``0``)
+
+        Number of additional connections to TWS (``clientId + 1`` to
+        ``clientId + dataconns``) over which the data requests (market data,
+        historical, contract details) are spread by ``conId``. The main
+        connection keeps orders, account and positions. With ``0`` everything
+        goes over the main connection. See ``get_pool_stats``
+
+        If a data connection is lost, its datas receive ``-1100`` and it is
+        reconnected (``reconnect`` attempts, ``timeout`` seconds apart). Once
+        reconnected, the requests are gone (``-1101``) and the datas
+        resubscribe as after a ``1101`` of the main connection
+
+      - ``sharesubs`` (default: ``False``)
+
+        Share the market data, real time bars and tick by tick subscriptions
+        of a contract (with the same parameters) among all the datas which
+        request them: a single request is sent to TWS and its messages are
+        delivered to the queue of each data. The request is cancelled when the
+        last data cancels it. See ``get_shared_stats``
+
+      - ``journal`` (default: ``None``)
+
+        Directory in which the live market data (tickPrice, tickSize, RTVolume,
+        tick by tick and real time bars) received is recorded as it arrives:
+        a subdirectory per day (UTC) with an append-only file of fixed-width
+        records per instrument (``conId``). See ``journal.read_journal``
+
+      - ``journalseg`` (default: ``65536``)
+
+        Records by which the journal files grow (preallocated and
+        memory-mapped)
+
+      - ``ticklatency`` (default: ``False``)
+
+        Stamp the live market data messages when received and when queued and
+        record, when the datas take them, their latency per instrument. See
+        ``get_latency_stats``
+
+      - ``latencylog`` (default: ``0.0``)
+
+        If greater than ``0`` (and ``ticklatency`` is on), seconds between
+        summaries of the latencies in the log
+
+      - ``qmonitor`` (default: ``0.0``)
+
+        If greater than ``0``, seconds between samples of the data queues to
+        keep their high-water mark, put/take rates and age of the oldest
+        pending message. See ``get_queue_stats``
+
+      - ``qmaxdepth`` (default: ``0``)
+
+        With ``qmonitor``, a store notification is issued when the queue of a
+        request reaches this depth (and another one when it is back below).
+        ``0`` disables the check
+
+      - ``qmaxage`` (default: ``0.0``)
+
+        As ``qmaxdepth`` for the age in seconds of the oldest pending message
+
+      - ``barflush`` (default: ``1.0``)
+
+        For the bars built by the store from the ticks (``barsize`` of
+        ``reqMktData``/``reqTickByTickData``), seconds after the end of a bar
+        (server time) after which it is delivered if no tick of a later bar
+        has arrived. ``0`` waits for the tick
+
       - ``reconnect`` (default: ``3``)
 
         Number of attempts to try to reconnect after the 1st connection attempt
@@ -623,6 +1063,11 @@ class IBStore(with_metaclass(MetaSingleton, object)):
     # starting at 1) is set by TWS
     REQIDBASE = 0x01000000
 
+    # Priorities for the requests when pacing is active
+    PRIO_LIVE = pacing.LIVE
+    PRIO_BACKFILL = pacing.BACKFILL
+    PRIO_RESEARCH = pacing.RESEARCH
+
     BrokerCls = None  # broker class will autoregister
     DataCls = None  # data class will auto register
 
@@ -637,6 +1082,26 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         ('broker_password', ''),
         ('notifyall', False),
         ('_debug', False),
+        ('cbstats', False),  # record per callback count/processing time
+        ('ringbuffer', 0),  # size of ring buffer for streaming queues (0: off)
+        ('histconcurrency', 1),  # concurrent segments of historical requests
+        ('histcache', None),  # path to sqlite file to cache historical bars
+        ('pacing', False),  # send requests through the pacing scheduler
+        ('contractcache', False),  # True or path to sqlite file to keep them
+        ('contractttl', 86400.0),  # seconds a cached contract is valid
+        ('subworkers', 4),  # threads for the subscribe/cancel calls of datas
+        ('resubstagger', 0.0),  # seconds between resubscription groups
+        ('resubbatch', 25),  # datas resubscribed per group
+        ('dataconns', 0),  # additional connections for data requests
+        ('sharesubs', False),  # one streaming request per contract/params
+        ('journal', None),  # directory to record the live market data
+        ('journalseg', 1 << 16),  # records per journal file segment
+        ('ticklatency', False),  # record latency of live messages
+        ('latencylog', 0.0),  # seconds between latency log summaries
+        ('qmonitor', 0.0),  # seconds between samples of the data queues
+        ('qmaxdepth', 0),  # notify if a data queue reaches this depth
+        ('qmaxage', 0.0),  # notify if the oldest pending message is older
+        ('barflush', 1.0),  # seconds after its end to deliver a store bar
         ('reconnect', 3),  # -1 forever, 0 No, > 0 number of retries
         ('timeout', 3.0),  # timeout between reconnections
         ('timeoffset', True),  # Use offset to server for timestamps if needed
@@ -658,10 +1123,9 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         super(IBStore, self).__init__()
 
         self._lock_q = threading.Lock()  # sync access to _tickerId/Queues
-        self._lock_accupd = threading.Lock()  # sync account updates
+        self._lock_accupd = threading.Lock()  # sync account updates (writers)
         self._lock_pos = threading.Lock()  # sync account updates
         self._lock_notif = threading.Lock()  # sync access to notif queue
-        self._updacclock = threading.Lock()  # sync account updates
 
         # Account list received
         self._event_managed_accounts = threading.Event()
@@ -681,15 +1145,71 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         self.qs = collections.OrderedDict()  # key: tickerId -> queues
         self.ts = collections.OrderedDict()  # key: queue -> tickerId
         self.iscash = dict()  # tickerIds from cash products (for ex: EUR.JPY)
+        self._aio = threading.local()  # event loop of async requests (if any)
+        self.subs = dict()  # key: shared request -> SharedSubscription
+        self.tickbars = dict()  # key: tickerId -> TickBars (ticks to bars)
+        self._flushing = False  # timer delivering the ended bars running
+
+        # Periodic tasks (daemon timers), cancelled when the store stops
+        self._lock_timers = threading.Lock()
+        self._timers = dict()  # key: task -> pending Timer
+        self._stopped = False
 
         self.histexreq = dict()  # holds segmented historical requests
         self.histfmt = dict()  # holds datetimeformat for request
         self.histsend = dict()  # holds sessionend (data time) for request
         self.histtz = dict()  # holds sessionend (data time) for request
-
-        self.acc_cash = AutoDict()  # current total cash per account
-        self.acc_value = AutoDict()  # current total value per account
-        self.acc_upds = AutoDict()  # current account valueinfos per account
+        self.histdates = HistDateConverter()  # memoized date conversion
+
+        # On disk cache of historical bars and state of cached requests
+        self.histcache = None
+        if self.p.histcache:
+            self.histcache = HistoricalCache(self.p.histcache)
+        self.histcachereq = dict()  # key: tickerId -> cached request plan
+        self.histseg = dict()  # segment tickerId -> (HistSegments, index)
+        self.histsegreq = dict()  # tickerId -> HistSegments (concurrent)
+        self.histtickreq = dict()  # tickerId -> state of paged tick request
+
+        # Registry of contract details resolved (if any)
+        self.contractcache = None
+        if self.p.contractcache:
+            path = self.p.contractcache
+            if path is True:
+                path = None  # only in memory
+            self.contractcache = ContractRegistry(path, self.p.contractttl)
+
+        # Recording of the live market data (if any)
+        self.journal = None
+        if self.p.journal:
+            self.journal = TickJournal(self.p.journal, self.p.journalseg)
+
+        # Latency of the live messages per instrument (if requested). The
+        # clock stamps the messages, int() (0) leaves them unstamped
+        self.ticklat = None
+        self._tickclock = int
+        if self.p.ticklatency:
+            self.ticklat = dict()
+            self._tickclock = time.perf_counter_ns
+            if self.p.latencylog > 0:
+                self._loglatency(first=True)
+
+        # Periodic sampling of the data queues (if requested)
+        self.qmonitor = None
+        if self.p.qmonitor > 0:
+            self.qmonitor = QueueMonitor(self.p.qmaxdepth, self.p.qmaxage)
+            self._sampleqs(first=True)
+
+        # Subscribe/cancel calls of the datas
+        self.dispatcher = SubscriptionDispatcher(self.p.subworkers)
+
+        # Requests sent directly or through the pacing scheduler
+        self.scheduler = None
+        if self.p.pacing:
+            self.scheduler = pacing.RequestScheduler()
+
+        # current account values/cash/value, replaced (not modified) on
+        # updates: readers take the reference without locking
+        self.accsnapshot = AccountSnapshot()
 
         self.port_update = False  # indicate whether to signal to broker
 
@@ -711,15 +1231,35 @@ class IBStore(with_metaclass(MetaSingleton, object)):
             self.clientId = self.p.clientId
 
         self._debug = self.p._debug
+        # per callback LatencyHistogram (key: Class.method) if requested
+        self.cbstats = dict() if self.p.cbstats else None
+        # with data connections the callbacks run in several reader threads
+        self._lock_cbstats = None
+        if self.cbstats is not None and self.p.dataconns > 0:
+            self._lock_cbstats = threading.Lock()
+        bindlogibmsg(self, self._debug, self.cbstats, self._lock_cbstats)
+
         # ibpy connection object
         try:           
-            self.conn = IBApi(self, self._debug)
+            self.conn = IBApi(self, self._debug, self.cbstats,
+                              self._lock_cbstats)
             self.conn.connect(self.p.host, self.p.port, self.clientId)
             self.apiThread = threading.Thread(target=self.conn.run, daemon=True)
             self.apiThread.start()
         except Exception as e:
             print(f"TWS Failed to connect: {e}")
 
+        # Data connections (if any) sharded by contract
+        self.pool = None
+        if self.p.dataconns > 0:
+            clientIds = [self.clientId + i + 1
+                         for i in range(self.p.dataconns)]
+            self.pool = ConnectionPool(self._dataconn, clientIds)
+            try:
+                self.pool.connect(self.p.host, self.p.port, self.p.timeout)
+            except Exception as e:
+                print(f"TWS Failed to connect data connections: {e}")
+
         # This utility key function transforms a barsize into a:
         #   (Timeframe, Compression) tuple which can be sorted
         def keyfn(x):
@@ -752,6 +1292,7 @@ class IBStore(with_metaclass(MetaSingleton, object)):
     
     def start(self, data=None, broker=None):
         logger.info(f"START data: {data} broker: {broker}")
+        self._restart()  # if stopped by a previous run
         self.reconnect(fromstart=True)  # reconnect should be an invariant
 
         # Datas require some processing to kickstart data reception
@@ -773,12 +1314,129 @@ class IBStore(with_metaclass(MetaSingleton, object)):
             self.broker = broker
 
     
+    def _dataconn(self, clientId):
+        return DataConnection(self, self._debug, self.cbstats, clientId,
+                              self._lock_cbstats)
+
+    def get_pool_stats(self):
+        '''Returns the usage of the data connections (see
+        ``ConnectionPool.stats``) or an empty dict if there are none'''
+        if self.pool is None:
+            return dict()
+
+        return self.pool.stats()
+
+    def _rearm(self, task, interval, fn):
+        # Schedules the next run of a periodic task unless stopped
+        with self._lock_timers:
+            if self._stopped:
+                return
+
+            t = threading.Timer(interval, fn)
+            t.daemon = True
+            self._timers[task] = t
+            t.start()
+
+    def _disarm(self, task):
+        # Cancels the scheduled run (if any) of a task which is over
+        with self._lock_timers:
+            t = self._timers.pop(task, None)
+        if t is not None:
+            t.cancel()
+
+    def _restart(self):
+        # Restores the scheduler and periodic tasks ended by stop
+        with self._lock_timers:
+            if not self._stopped:
+                return
+            self._stopped = False
+
+        if self.scheduler is not None:  # the stopped one cannot be restarted
+            self.scheduler = pacing.RequestScheduler()
+        if self.ticklat is not None and self.p.latencylog > 0:
+            self._loglatency(first=True)
+        if self.qmonitor is not None:
+            self._sampleqs(first=True)
+
+        self._flushing = bool(self.tickbars) and self.p.barflush > 0
+        if self._flushing:
+            self._flushbars(first=True)
+
+    def dataconnLost(self, conn):
+        '''A data connection has been closed: the datas fed by it are told
+        (``-1100``) and it is reconnected'''
+        lost = self.pool.tickers(conn)
+        for tickerId in lost:
+            q = self.qs.get(tickerId)
+            if q is not None:
+                putcontrol(q, -1100)
+
+        self._dataconnretry(conn, lost, self.p.reconnect)
+
+    def _dataconnretry(self, conn, lost, retries):
+        if retries == 0:
+            msg = f'Data connection {conn.poolid} could not be reconnected'
+            logger.error(msg)
+            self.notifs.put((msg, (), dict(clientId=conn.poolid)))
+            return
+
+        def retry():
+            try:
+                self.pool.connect(self.p.host, self.p.port, self.p.timeout)
+            except Exception as e:
+                logger.warning(f"Data connection {conn.poolid}: {e}")
+
+            if conn.ready.is_set():
+                self._dataconnrestored(conn, lost)
+            else:
+                self._dataconnretry(conn, lost, retries - 1)
+
+        self._rearm(f'dataconn-{conn.poolid}', self.p.timeout, retry)
+
+    def _dataconnrestored(self, conn, lost):
+        # The requests of lost are gone with the old connection: tell the
+        # datas (-1101) which resubscribe as after a 1101 of the main one
+        logger.info(f"Data connection {conn.poolid} restored")
+        lost = set(lost)
+        with self._lock_q:
+            for key, sub in list(self.subs.items()):
+                if sub.tickerId in lost:
+                    self.subs.pop(key, None)  # must not be joined
+
+        for tickerId in lost:
+            self.pool.release(tickerId)
+            q = self.qs.get(tickerId)
+            if q is not None:
+                putcontrol(q, -1101)
+
+        if self.p.resubstagger > 0:  # else each data resubscribes itself
+            datas = [data for data in self.datas
+                     if self.ts.get(data.qlive) in lost]
+            self.dispatcher.batch('resub', [data.resubdata for data in datas],
+                                  wait=False, stagger=self.p.resubstagger,
+                                  size=self.p.resubbatch)
+
     def stop(self):
+        with self._lock_timers:
+            self._stopped = True
+            for t in self._timers.values():
+                t.cancel()
+            self._timers.clear()
+
+        if self.scheduler is not None:
+            self.scheduler.stop()  # pending requests are discarded
+
         try:
             self.conn.disconnect()  # disconnect should be an invariant
         except AttributeError:
             pass    # conn may have never been connected and lack "disconnect"
 
+        if self.pool is not None:
+            self.pool.disconnect()
+
+        if self.journal is not None:
+            self.journal.close()
+
         # Unblock any calls set on these events
         self._event_managed_accounts.set()
         self._event_accdownload.set()
@@ -842,6 +1500,10 @@ class IBStore(with_metaclass(MetaSingleton, object)):
             try:
                 logger.debug("Connect (host={self.p.host}, port={self.p.port}, clientId={self.clientId})")
                 if self.conn.connect(self.p.host, self.p.port, self.clientId):
+                    self.subs.clear()  # requests of the old connection
+                    if self.pool is not None:
+                        self.pool.connect(self.p.host, self.p.port,
+                                          self.p.timeout)
                     if not fromstart or resub:
                         self.startdatas()
                     return True  # connection successful
@@ -858,33 +1520,67 @@ class IBStore(with_metaclass(MetaSingleton, object)):
     
     def startdatas(self):
         # kickstrat datas, not returning until all of them have been done
-        ts = list()
-        for data in self.datas:
-            t = threading.Thread(target=data.reqdata)
-            t.start()
-            ts.append(t)
-
-        for t in ts:
-            t.join()
+        self.dispatcher.batch('start', [data.reqdata for data in self.datas])
 
     @logibmsg
     def stopdatas(self):
         # stop subs and force datas out of the loop (in LIFO order)
         logger.debug(f"Stopping datas")
         qs = list(self.qs.values())
-        ts = list()
-        for data in self.datas:
-            t = threading.Thread(target=data.canceldata)
-            t.start()
-            ts.append(t)
-
-        for t in ts:
-            t.join()
+        self.dispatcher.batch('stop', [data.canceldata for data in self.datas])
 
         for q in reversed(qs):  # datamaster the last one to get a None
-            q.put(None)
+            putcontrol(q, None)
+
+    def resubdatas(self):
+        '''Resubscribes the live datas after their subscriptions have been
+        lost (``1101``), staggered as per ``resubstagger``/``resubbatch``.
+        It does not wait for the resubscriptions to be done'''
+        logger.info(f"Resubscribing {len(self.datas)} datas")
+        self.dispatcher.batch('resub', [data.resubdata for data in self.datas],
+                              wait=False, stagger=self.p.resubstagger,
+                              size=self.p.resubbatch)
+
+    def get_subscription_stats(self):
+        '''Returns the statistics of the subscribe/cancel calls of the datas
+        (see ``SubscriptionDispatcher.stats``). The ``batches`` entry holds
+        the duration (``last`` in seconds and a report in ns) of the complete
+        ``start``, ``stop`` and ``resub`` rounds'''
+        return self.dispatcher.stats()
 
     
+    def latencyfor(self, contract):
+        '''Returns the ``TickLatency`` recording the latencies of the live
+        messages of contract (``None`` if ``ticklatency`` is off)'''
+        if self.ticklat is None:
+            return None
+
+        key = contract.localSymbol or contract.symbol
+        return self.ticklat.setdefault(key, TickLatency())
+
+    def get_latency_stats(self, reset=False):
+        '''Returns a dict (key: instrument) with the latencies of the live
+        messages (``store``, ``queue`` and ``total``, see ``TickLatency``) in
+        nanoseconds. Empty if ``ticklatency`` is off
+
+        If ``reset`` is ``True`` the histograms are cleared after reading
+        '''
+        stats = dict()
+        for key, lat in list((self.ticklat or {}).items()):
+            stats[key] = lat.report()
+            if reset:
+                lat.reset()
+
+        return stats
+
+    def _loglatency(self, first=False):
+        if not first:
+            for key, lat in list(self.ticklat.items()):
+                if lat.total.count:
+                    logger.info(f'Tick latency {key}: {lat}')
+
+        self._rearm('latencylog', self.p.latencylog, self._loglatency)
+
     def get_notifications(self):
         '''Return the pending "store" notifications'''
         # The background thread could keep on adding notifications. The None
@@ -898,6 +1594,28 @@ class IBStore(with_metaclass(MetaSingleton, object)):
             notifs.append(notif)
 
         return notifs
+
+    def get_cbstats(self, reset=False):
+        '''Returns a dict (key: ``Class.method``) with the call count and the
+        processing time (``mean``, ``p50``, ``p99``, ``max`` in nanoseconds) of
+        each callback, sorted by total time spent. Empty if ``cbstats`` is off
+
+        If ``reset`` is ``True`` the histograms are cleared after reading
+        '''
+        if self.cbstats is None:
+            return dict()
+
+        with self._lock_cbstats or contextlib.nullcontext():
+            hists = sorted(self.cbstats.items(),
+                           key=lambda x: x[1].total, reverse=True)
+            stats = collections.OrderedDict()
+            for name, hist in hists:
+                if hist.count:
+                    stats[name] = hist.report()
+                if reset:
+                    hist.reset()
+
+        return stats
     
     def error(self, msg):
         # 100-199 Order/Data/Historical related
@@ -923,12 +1641,19 @@ class IBStore(with_metaclass(MetaSingleton, object)):
             print(msg.errorString)
 
         if not self.p.notifyall:
-            self.notifs.put((msg, tuple(vars(msg).values()), dict(vars(msg).items())))
+            msgvars = msg._asdict()
+            self.notifs.put((msg, tuple(msgvars.values()), msgvars))
 
         # Manage those events which have to do with connection
         if msg.errorCode is None:
             # Usually received as an error in connection of just before disconn
             pass
+        elif (msg.errorCode == 162 and self.scheduler is not None and
+              'pacing violation' in msg.errorString and
+              self.scheduler.retry(msg.reqId)):
+            # historical request scheduled again after a backoff
+            pass
+
         elif msg.errorCode in [200, 203, 162, 320, 321, 322]:
             # cdetails 200 security not found, notify over right queue
             # cdetails 203 security not allowed for acct
@@ -948,7 +1673,7 @@ class IBStore(with_metaclass(MetaSingleton, object)):
             except KeyError:
                 pass  # should not happend but it can
             else:
-                q.put(-msg.errorCode)
+                putcontrol(q, -msg.errorCode)
                 logger.warn(f"Cancel data queue for {msg.reqId}")
                 self.cancelQueue(q)
 
@@ -960,7 +1685,7 @@ class IBStore(with_metaclass(MetaSingleton, object)):
             except KeyError:
                 pass  # should not happend but it can
             else:
-                q.put(-msg.errorCode)
+                putcontrol(q, -msg.errorCode)
 
         elif msg.errorCode == 326:  # not recoverable, clientId in use
             self.dontreconnect = True
@@ -978,8 +1703,8 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
             # Connection lost - Notify ... datas will wait on the queue
             # with no messages arriving
-            for q in self.ts:  # key: queue -> ticker
-                q.put(-msg.errorCode)
+            for q in list(self.ts):  # key: queue -> ticker
+                putcontrol(q, -msg.errorCode)
 
         elif msg.errorCode == 1300:
             # TWS has been closed. The port for a new connection is there
@@ -990,18 +1715,22 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         elif msg.errorCode == 1100:
             # Connection lost - Notify ... datas will wait on the queue
             # with no messages arriving
-            for q in self.ts:  # key: queue -> ticker
-                q.put(-msg.errorCode)
+            for q in list(self.ts):  # key: queue -> ticker
+                putcontrol(q, -msg.errorCode)
 
         elif msg.errorCode == 1101:
             # Connection restored and tickerIds are gone
-            for q in self.ts:  # key: queue -> ticker
-                q.put(-msg.errorCode)
+            self.subs.clear()  # new requests must not join the lost ones
+            for q in list(self.ts):  # key: queue -> ticker
+                putcontrol(q, -msg.errorCode)
+
+            if self.p.resubstagger > 0:
+                self.resubdatas()  # else each data resubscribes itself
 
         elif msg.errorCode == 1102:
             # Connection restored and tickerIds maintained
-            for q in self.ts:  # key: queue -> ticker
-                q.put(-msg.errorCode)
+            for q in list(self.ts):  # key: queue -> ticker
+                putcontrol(q, -msg.errorCode)
 
         elif msg.errorCode < 500:
             # Given the myriad of errorCodes, start by assuming is an order
@@ -1048,7 +1777,7 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         with self._lock_tmoffset:
             self.tmoffset = curtime - datetime.now()
 
-        threading.Timer(self.p.timerefresh, self.reqCurrentTime).start()
+        self._rearm('timerefresh', self.p.timerefresh, self.reqCurrentTime)
     
     def timeoffset(self):
         with self._lock_tmoffset:
@@ -1067,12 +1796,61 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         # notified value from TWS
         return next(self.orderid)
 
+    def _sendreq(self, kind, priority, fn, tickerId, contract, *args):
+        '''Sends request ``fn(tickerId, contract, *args)`` to TWS, through the
+        pacing scheduler if active. ``kind`` is one of ``hist``, ``cdetails``
+        and ``live``. With data connections, ``fn`` is sent over the one of
+        the contract'''
+        if self.pool is not None:
+            fn = getattr(self.pool.route(tickerId, contract), fn.__name__)
+
+        if self.scheduler is None:
+            fn(tickerId, contract, *args)
+            return
+
+        if priority is None:
+            priority = self.PRIO_LIVE if kind == 'live' else self.PRIO_BACKFILL
+
+        ckey = (contract.conId, contract.symbol, contract.secType,
+                contract.exchange, contract.currency, contract.localSymbol,
+                contract.lastTradeDateOrContractMonth, contract.strike,
+                contract.right)
+        key = (fn.__name__, ckey) + tuple(
+            tuple(a) if isinstance(a, list) else a for a in args)
+        group = None
+        if kind == 'hist':
+            group = (ckey, args[3])  # contract and whatToShow
+
+        self.scheduler.submit(kind, priority, tickerId, fn,
+                              (tickerId, contract) + args, key, group)
+
+    def _cancelreq(self, fn, tickerId):
+        '''Cancels request tickerId in TWS unless it is still waiting in the
+        pacing scheduler (it is then simply discarded)'''
+        if self.pool is not None:
+            conn = self.pool.connof(tickerId)
+            if conn is not None:  # over the connection of the request
+                fn = getattr(conn, fn.__name__)
+
+        if self.scheduler is None or not self.scheduler.cancel(tickerId):
+            fn(tickerId)
+
+    def get_pacing_stats(self):
+        '''Returns the metrics of the pacing scheduler (see
+        ``RequestScheduler.stats``) or an empty dict if pacing is off'''
+        if self.scheduler is None:
+            return dict()
+
+        return self.scheduler.stats()
+
     def reuseQueue(self, tickerId):
         '''Reuses queue for tickerId, returning the new tickerId and q'''
         with self._lock_q:
             # Invalidate tickerId in qs (where it is a key)
             q = self.qs.pop(tickerId, None)  # invalidate old
             iscash = self.iscash.pop(tickerId, None)
+            if self.pool is not None:
+                self.pool.release(tickerId)
 
             # Update ts: q -> ticker
             tickerId = self.nextTickerId()  # get new tickerId
@@ -1082,44 +1860,203 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
         return tickerId, q
     
-    def getTickerQueue(self, start=False):
-        '''Creates ticker/Queue for data delivery to a data feed'''
-        q = queue.Queue()
+    def getTickerQueue(self, start=False, ring=False, conflate=False,
+                       maxsize=0, overflow='block', share=None):
+        '''Creates ticker/Queue for data delivery to a data feed
+
+        If ``conflate`` is ``True`` or ``maxsize`` is set, the queue is a
+        ``ConflatingQueue`` with the given ``overflow`` policy. Else, if
+        ``ring`` is ``True`` and the ``ringbuffer`` param is set, the queue is
+        a ``RingQueue``. Requests made by the async front end (``loop`` set
+        for the calling thread) get an ``AsyncQueue`` bound to the loop
+
+        ``share`` is the key of a shareable request (see ``_sharekey``). If
+        the request is already active, the queue joins it and the returned
+        tickerId is ``None``: no request has to be sent
+        '''
+        loop = getattr(self._aio, 'loop', None)
+        if loop is not None:
+            q = AsyncQueue(loop)
+        elif conflate or maxsize > 0:
+            q = ConflatingQueue(maxsize=maxsize, overflow=overflow,
+                                conflate=conflate, merge=conflatemsg)
+        elif ring and self.p.ringbuffer > 0:
+            q = RingQueue(self.p.ringbuffer)
+        else:
+            q = queue.Queue()
         if start:
             q.put(None)
             return q
 
         with self._lock_q:
+            if share is not None:
+                sub = self.subs.get(share)
+                if sub is not None:  # active: join it
+                    sub.add(q)
+                    self.ts[q] = sub.tickerId
+                    return None, q
+
             tickerId = self.nextTickerId()
-            self.qs[tickerId] = q  # can be managed from other thread
+            if share is not None:
+                sub = self.subs[share] = SharedSubscription(share, tickerId)
+                sub.add(q)
+                self.qs[tickerId] = sub
+            else:
+                self.qs[tickerId] = q  # can be managed from other thread
             self.ts[q] = tickerId
             self.iscash[tickerId] = False
 
         return tickerId, q
     
     def cancelQueue(self, q, sendnone=False):
-        '''Cancels a Queue for data delivery'''
+        '''Cancels a Queue for data delivery. For a shared subscription (``q``
+        being the ``SharedSubscription`` or one of its queues) the queues of
+        all the consumers are cancelled'''
         # pop ts (tickers) and with the result qs (queues)
-        tickerId = self.ts.pop(q, None)
-        self.qs.pop(tickerId, None)
+        if isinstance(q, SharedSubscription):
+            tickerId = q.tickerId
+        else:
+            tickerId = self.ts.pop(q, None)
+
+        qs = [q]
+        sub = self.qs.pop(tickerId, None)
+        if isinstance(sub, SharedSubscription):
+            self.subs.pop(sub.key, None)
+            qs = list(sub.queues) or [q]
+            for sq in qs:
+                self.ts.pop(sq, None)
 
         self.iscash.pop(tickerId, None)
+        self.tickbars.pop(tickerId, None)
+        self.histcachereq.pop(tickerId, None)  # cached request (if any) ends
+        self.histtickreq.pop(tickerId, None)  # paged tick request (if any)
+        hseg = self.histsegreq.pop(tickerId, None)
+        if hseg is not None:  # concurrent segments (if any) left in flight
+            self._histsegcancel(hseg)
+        if self.scheduler is not None and tickerId is not None:
+            self.scheduler.done(tickerId)
+        if self.pool is not None:
+            self.pool.release(tickerId)
+        if self.journal is not None:
+            self.journal.unregister(tickerId)
+
+        # async consumers cannot poll validQueue: they always get the end
+        for q in qs:
+            if sendnone or isinstance(q, AsyncQueue):
+                putcontrol(q, None)
+
+    def _sharekey(self, contract, *args):
+        '''Returns the key to share a streaming request on contract with
+        args (request and parameters) or ``None`` if it is not shareable'''
+        if not self.p.sharesubs or not contract.conId:
+            return None
 
-        if sendnone:
-            q.put(None)
+        return (contract.conId,) + args
+
+    def _cancelstream(self, q, cancelfn):
+        '''Cancels the streaming request of queue q with ``cancelfn``. If the
+        request is shared with other consumers, only q leaves it'''
+        with self._lock_q:
+            tickerId = self.ts.get(q, None)
+            sub = self.qs.get(tickerId)
+            if isinstance(sub, SharedSubscription) and sub.remove(q):
+                logger.debug(f"Leave shared data queue for {tickerId}")
+                self.ts.pop(q, None)
+                putcontrol(q, None)
+                return
+
+            if tickerId is not None:
+                self._cancelreq(cancelfn, tickerId)
+
+            logger.debug(f"Cancel data queue for {tickerId}")
+            self.cancelQueue(q, True)
+
+    def get_shared_stats(self):
+        '''Returns the number of shared ``subscriptions`` active, their
+        ``consumers`` and the TWS requests ``saved`` by sharing them'''
+        with self._lock_q:
+            consumers = sum(len(sub.queues) for sub in self.subs.values())
+            return dict(subscriptions=len(self.subs), consumers=consumers,
+                        saved=consumers - len(self.subs))
     
     def validQueue(self, q):
         '''Returns (bool)  if a queue is still valid'''
         return q in self.ts  # queue -> ticker
+
+    def get_queue_stats(self):
+        '''Returns a dict (key: tickerId) with the number of pending messages
+        (``qsize``), the messages ``enqueued`` and ``dequeued`` and, for
+        bounded/conflating queues, the number of ``coalesced`` and ``dropped``
+        messages
+
+        With ``qmonitor`` it also holds the sampled high-water mark (``hwm``),
+        the put/take rates in messages per second (``inrate``, ``outrate``),
+        the ``age`` in seconds of the oldest pending message and whether the
+        queue is ``lagging`` (``qmaxdepth``/``qmaxage``)'''
+        with self._lock_q:
+            qs = list(self.qs.items())
+
+        stats = dict()
+        for tickerId, q in qs:
+            counts = queue_counts(q)
+            if counts is None:
+                continue  # a segment of a historical request
+
+            qsize, enqueued, dequeued = counts
+            stats[tickerId] = dict(
+                qsize=qsize,
+                enqueued=enqueued,
+                dequeued=dequeued,
+                coalesced=getattr(q, 'coalesced', 0),
+                dropped=getattr(q, 'dropped', 0),
+            )
+            if self.qmonitor is not None:
+                stats[tickerId].update(self.qmonitor.stats(tickerId))
+
+        return stats
+
+    def _sampleqs(self, first=False):
+        if not first:
+            try:
+                self._sampleqsnow()
+            except Exception as e:  # keep sampling in the next round
+                logger.exception(f"Data queue sampling failed: {e}")
+
+        self._rearm('qmonitor', self.p.qmonitor, self._sampleqs)
+
+    def _sampleqsnow(self):
+        with self._lock_q:
+            qs = list(self.qs.items())
+
+        for tickerId, state in self.qmonitor.sample(qs, time.monotonic()):
+            if state.lagging:
+                msg = (f'Data queue {tickerId} lagging: {state.depth} '
+                       f'pending, oldest {state.age:.3f}s')
+                logger.warning(msg)
+            else:
+                msg = f'Data queue {tickerId} no longer lagging'
+                logger.info(msg)
+
+            kwargs = dict(tickerId=tickerId, depth=state.depth,
+                          age=state.age, lagging=state.lagging)
+            self.notifs.put((msg, (), kwargs))
     
     def getContractDetails(self, contract, maxcount=None):
-        cds = list()
-        q = self.reqContractDetails(contract)
-        while True:
-            msg = q.get()
-            if msg is None:
-                break
-            cds.append(msg)
+        cds = None
+        if self.contractcache is not None:
+            cds = self.contractcache.get(contract)
+
+        if cds is None:
+            cds = list()
+            q = self.reqContractDetails(contract)
+            while True:
+                msg = q.get()
+                if msg is None:
+                    break
+                cds.append(msg)
+
+            if cds and self.contractcache is not None:
+                cds = self.contractcache.put(contract, cds)
 
         if not cds or (maxcount and len(cds) > maxcount):
             err = 'Ambiguous contract: none/multiple answers received'
@@ -1128,10 +2065,11 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
         return cds
     
-    def reqContractDetails(self, contract):
+    def reqContractDetails(self, contract, priority=None):
         # get a ticker/queue for identification/data delivery
         tickerId, q = self.getTickerQueue()
-        self.conn.reqContractDetails(tickerId, contract)
+        self._sendreq('cdetails', priority, self.conn.reqContractDetails,
+                      tickerId, contract)
         return q
 
     def contractDetailsEnd(self, reqId):
@@ -1147,13 +2085,15 @@ class IBStore(with_metaclass(MetaSingleton, object)):
     def reqHistoricalDataEx(self, contract, enddate, begindate,
                             timeframe, compression,
                             what=None, useRTH=False, tz='', sessionend=None,
-                            tickerId=None):
+                            tickerId=None, priority=None):
         '''
         Extension of the raw reqHistoricalData proxy, which takes two dates
         rather than a duration, barsize and date
 
         It uses the IB published valid duration/barsizes to make a mapping and
         spread a historical request over several historical requests if needed
+
+        ``priority`` is the lane (``PRIO_xxx``) used if pacing is active
         '''
         # Keep a copy for error reporting purposes
         kwargs = locals().copy()
@@ -1180,23 +2120,39 @@ class IBStore(with_metaclass(MetaSingleton, object)):
                 self.notifs.put((err, (), kwargs))
                 return self.getTickerQueue(start=True)
 
-            return self.reqHistoricalData(contract=contract, enddate=enddate,
-                                          duration=duration, barsize=barsize,
-                                          what=what, useRTH=useRTH, tz=tz,
-                                          sessionend=sessionend)
+            if self.histcache is None:
+                return self.reqHistoricalData(
+                    contract=contract, enddate=enddate, duration=duration,
+                    barsize=barsize, what=what, useRTH=useRTH, tz=tz,
+                    sessionend=sessionend, priority=priority)
+
+            # The cache works with ranges: turn the max duration into one
+            size, dim = duration.split()
+            begindate = self.dt_plus_duration(enddate, f'-{size} {dim}')
 
         # Check if the requested timeframe/compression is supported by IB
         durations = self.getdurations(timeframe, compression)
         if not durations:  # return a queue and put a None in it
             return self.getTickerQueue(start=True)
 
+        if self.histcache is not None and tickerId is None and contract.conId:
+            return self._reqHistoricalCached(
+                contract=contract, enddate=enddate, begindate=begindate,
+                timeframe=timeframe, compression=compression,
+                what=what, useRTH=useRTH, tz=tz, sessionend=sessionend,
+                priority=priority)
+
         # Get or reuse a queue
         if tickerId is None:
             tickerId, q = self.getTickerQueue()
             logger.debug(f"Get tickerId: {tickerId} Q: {q}")
         else:
+            oldtickerId = tickerId
             tickerId, q = self.reuseQueue(tickerId)  # reuse q for old tickerId
             logger.debug(f"Reuse tickerId: {tickerId} Q: {q}")
+            creq = self.histcachereq.pop(oldtickerId, None)
+            if creq is not None:  # cached request moves to the new tickerId
+                self.histcachereq[tickerId] = creq
 
         # Get the best possible duration to reduce number of requests
         duration = None
@@ -1207,14 +2163,19 @@ class IBStore(with_metaclass(MetaSingleton, object)):
                 duration = dur  # begin -> end fits in single request
                 break
 
+        segmented = False
         if duration is None:  # no duration large enough to fit the request
             duration = durations[-1]
 
-            # Store the calculated data
-            self.histexreq[tickerId] = dict(
-                contract=contract, enddate=enddate, begindate=intdate,
-                timeframe=timeframe, compression=compression,
-                what=what, useRTH=useRTH, tz=tz, sessionend=sessionend)
+            if self.p.histconcurrency > 1:
+                segmented = True  # all segments planned and requested below
+            else:
+                # Store the calculated data
+                self.histexreq[tickerId] = dict(
+                    contract=contract, enddate=enddate, begindate=intdate,
+                    timeframe=timeframe, compression=compression,
+                    what=what, useRTH=useRTH, tz=tz, sessionend=sessionend,
+                    priority=priority)
 
         barsize = self.tfcomp_to_size(timeframe, compression)
         self.histfmt[tickerId] = timeframe >= TimeFrame.Days
@@ -1231,7 +2192,15 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
         what = what or 'TRADES'
 
-        self.conn.reqHistoricalData(
+        if segmented:
+            self._reqHistoricalSegments(tickerId, q, contract, begindate,
+                                        enddate, durations, barsize, what,
+                                        useRTH, priority)
+            return q
+
+        self._sendreq(
+            'hist', priority,
+            self.conn.reqHistoricalData,
             tickerId,
             contract,
             #bytes(intdate.strftime('%Y%m%d %H:%M:%S') + ' GMT'),
@@ -1246,8 +2215,234 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
         return q
     
+    # Seconds per unit of timeframe to know when a cached bar is complete
+    _tfsecs = {
+        TimeFrame.Seconds: 1,
+        TimeFrame.Minutes: 60,
+        TimeFrame.Days: 24 * 3600,
+        TimeFrame.Weeks: 7 * 24 * 3600,
+        TimeFrame.Months: 31 * 24 * 3600,
+    }
+
+    def _reqHistoricalCached(self, contract, enddate, begindate,
+                             timeframe, compression,
+                             what=None, useRTH=False, tz='', sessionend=None,
+                             priority=None):
+        '''Answers a reqHistoricalDataEx with the historical cache, requesting
+        to TWS only the gaps which are not on disk'''
+        cachewhat = what
+        if not cachewhat:  # as reqHistoricalDataEx would do
+            cachewhat = 'BID' if contract.secType in ['CASH', 'CFD'] else 'TRADES'
+
+        barsize = self.tfcomp_to_size(timeframe, compression)
+        key = self.histcache.makekey(contract.conId, cachewhat, barsize, useRTH)
+        barsecs = self._tfsecs.get(timeframe, 1) * compression
+
+        begin = calendar.timegm(begindate.timetuple())
+        if barsecs <= self._tfsecs[TimeFrame.Days]:
+            begin -= begin % barsecs  # start of the bar holding begindate
+        end = calendar.timegm(enddate.timetuple())
+
+        tickerId, q = self.getTickerQueue()
+        self.histcachereq[tickerId] = dict(
+            key=key, q=q, barsecs=barsecs,
+            daily=timeframe >= TimeFrame.Days, tz=tz, sessionend=sessionend,
+            segments=collections.deque(self.histcache.plan(key, begin, end)),
+            segment=None,  # gap being downloaded
+            lastt=begin - 1,  # time of last delivered bar (no overlaps)
+            rows=list(),  # bars of the gap being downloaded
+            kwargs=dict(contract=contract, timeframe=timeframe,
+                        compression=compression, what=what, useRTH=useRTH,
+                        tz=tz, sessionend=sessionend, priority=priority),
+        )
+
+        self._histcachenext(tickerId)
+        return q
+
+    def _histcachenext(self, tickerId):
+        '''Delivers the next segments of a cached historical request from disk
+        until a gap is found, which is then requested to TWS'''
+        creq = self.histcachereq[tickerId]
+        q = creq['q']
+        segments = creq['segments']
+        while segments:
+            cached, begin, end = segments.popleft()
+            if not cached:
+                creq['segment'] = (begin, end)
+                self.reqHistoricalDataEx(
+                    enddate=datetime.utcfromtimestamp(end),
+                    begindate=datetime.utcfromtimestamp(begin),
+                    tickerId=tickerId, **creq['kwargs'])
+                return
+
+            daily = creq['daily']
+            rows = self.histcache.bars(creq['key'], begin, end)
+            if daily:
+                dtstrs = [datetime.utcfromtimestamp(row[0]).strftime('%Y%m%d')
+                          for row in rows]
+            else:
+                dtstrs = [row[0] for row in rows]
+
+            dts, nums = self.histdates.convert_many(
+                dtstrs, daily, creq['sessionend'], creq['tz'])
+            for row, dtstr, dt, dtnum in zip(rows, dtstrs, dts, nums):
+                msg = HistBar(tickerId, CachedBar(dtstr, *row[1:]))
+                msg.date = dt
+                msg.dtnum = dtnum
+                q.put(msg)
+
+            if rows:
+                creq['lastt'] = rows[-1][0]
+
+        self.histcachereq.pop(tickerId, None)
+        self.cancelQueue(q)
+
+    # IB pacing: 6 or more requests for the same contract in 2 seconds violate
+    # the rules
+    _HISTSEG_PACING = (5, 2.0)
+
+    def _reqHistoricalSegments(self, tickerId, q, contract, begindate, enddate,
+                               durations, barsize, what, useRTH, priority=None):
+        '''Plans all the segments of a historical request (the same ones
+        which would be chained) and requests ``histconcurrency`` of them
+        concurrently'''
+        segments = list()
+        while begindate < enddate:
+            for duration in durations:
+                intdate = self.dt_plus_duration(begindate, duration)
+                if intdate >= enddate:
+                    intdate = enddate
+                    break
+            # else: the largest duration (last in durations) is used
+
+            segments.append(dict(
+                contract=contract, enddate=intdate, duration=duration,
+                barsize=barsize, what=what, useRTH=useRTH))
+            begindate = intdate
+
+        logger.debug(f"Historical request {tickerId}: {len(segments)} segments")
+        hseg = HistSegments(tickerId, q, segments)
+        hseg.priority = priority
+        self.histsegreq[tickerId] = hseg
+        self._histsegissue(hseg)
+
+    def _histsegissue(self, hseg):
+        '''Requests the pending segments of hseg allowed by concurrency and
+        pacing. If pacing prevents it, a new attempt is scheduled'''
+        if self._stopped:
+            return  # an attempt which was already running when stopped
+
+        maxreqs, period = self._HISTSEG_PACING
+        toissue = list()
+        with hseg.lock:
+            while (not hseg.failed and hseg.pending and
+                   hseg.inflight < self.p.histconcurrency):
+                now = time.monotonic()
+                while hseg.issued and now - hseg.issued[0] >= period:
+                    hseg.issued.popleft()
+
+                if len(hseg.issued) >= maxreqs:
+                    delay = period - (now - hseg.issued[0])
+                    self._rearm(f'histseg-{hseg.tickerId}', delay,
+                                lambda: self._histsegissue(hseg))
+                    break
+
+                hseg.issued.append(now)
+                hseg.inflight += 1
+                toissue.append(hseg.pending.popleft())
+
+        for idx, seg in toissue:
+            with self._lock_q:
+                segtickerId = self.nextTickerId()
+                sink = HistSegmentSink(self, hseg)
+                self.qs[segtickerId] = sink
+                self.ts[sink] = segtickerId
+                self.histseg[segtickerId] = (hseg, idx)
+
+            self._sendreq(
+                'hist', hseg.priority,
+                self.conn.reqHistoricalData,
+                segtickerId,
+                seg['contract'],
+                bytes(seg['enddate'].strftime('%Y%m%d-%H:%M:%S')),
+                bytes(seg['duration']),
+                bytes(seg['barsize']),
+                bytes(seg['what']),
+                int(seg['useRTH']),
+                2, # dateformat 1 for string, 2 for unix time in seconds
+                False,
+                [])
+
+    def _histsegend(self, segtickerId, hseg, idx):
+        '''A segment has been completely received'''
+        with self._lock_q:
+            self.cancelQueue(self.qs.get(segtickerId))
+        msgs, finished = hseg.end(idx)
+        if msgs:
+            self._histbars(hseg.tickerId, msgs)
+
+        if finished:  # the whole request is over: as if it were a single one
+            self.histsegreq.pop(hseg.tickerId, None)
+            self._disarm(f'histseg-{hseg.tickerId}')
+            self.historicalDataEnd(hseg.tickerId, '', '')
+        else:
+            self._histsegissue(hseg)
+
+    def _histsegcancel(self, hseg):
+        '''Stops issuing the segments of hseg and cancels (in TWS or in the
+        pacing scheduler) those in flight'''
+        with hseg.lock:
+            hseg.failed = True
+
+        self._disarm(f'histseg-{hseg.tickerId}')
+        for segtickerId, (h, idx) in list(self.histseg.items()):
+            if h is hseg:
+                self.histseg.pop(segtickerId, None)
+                sink = self.qs.get(segtickerId)
+                if sink is not None:  # not the one which failed
+                    self._cancelreq(self.conn.cancelHistoricalData,
+                                    segtickerId)
+                    self.cancelQueue(sink)
+
+    def _histsegfail(self, hseg, msg):
+        '''A segment has been cancelled (error) with msg as notification'''
+        with hseg.lock:
+            if hseg.failed:
+                return
+            hseg.failed = True
+
+        # cancel the other segments still in flight
+        self._histsegcancel(hseg)
+
+        tickerId = hseg.tickerId
+        self.histsegreq.pop(tickerId, None)
+        self.histfmt.pop(tickerId, None)
+        self.histsend.pop(tickerId, None)
+        self.histtz.pop(tickerId, None)
+        if msg is None:
+            self.cancelQueue(hseg.q, True)
+        else:
+            hseg.q.put(msg)
+
+    def get_contractcache_stats(self):
+        '''Returns the statistics of the contract details registry (see
+        ``ContractRegistry.stats``) or an empty dict if there is none'''
+        if self.contractcache is None:
+            return dict()
+
+        return self.contractcache.stats()
+
+    def get_histcache_stats(self):
+        '''Returns the statistics of the historical cache (see
+        ``HistoricalCache.stats``) or an empty dict if there is no cache'''
+        if self.histcache is None:
+            return dict()
+
+        return self.histcache.stats()
+
     def reqHistoricalData(self, contract, enddate, duration, barsize,
-                          what=None, useRTH=False, tz='', sessionend=None):
+                          what=None, useRTH=False, tz='', sessionend=None,
+                          priority=None):
         '''Proxy to reqHistorical Data'''
 
         # get a ticker/queue for identification/data delivery
@@ -1268,7 +2463,9 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         self.histsend[tickerId] = sessionend
         self.histtz[tickerId] = tz
 
-        self.conn.reqHistoricalData(
+        self._sendreq(
+            'hist', priority,
+            self.conn.reqHistoricalData,
             tickerId,
             contract,
             # bytes(enddate.strftime('%Y%m%d %H:%M:%S') + ' GMT'),
@@ -1285,23 +2482,21 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
     def reqHistoricalTicksEx(self, contract, enddate=None, begindate=None,
                             what=None, useRTH=False, tz='',
-                            tickerId=None):
+                            tickerId=None, priority=None, numberOfTicks=1000):
         '''
-        Extension of the raw reqHistoricalData proxy, which takes two dates
-        rather than a duration, barsize and date
-
-        It uses the IB published valid duration/barsizes to make a mapping and
-        spread a historical request over several historical requests if needed
+        Extension of the raw reqHistoricalTicks proxy, which takes two dates
+        rather than a start/end and a number of ticks
+
+        TWS delivers at most 1000 ticks per request. If ``begindate`` is given
+        (or none of the dates, in which case the download starts at midnight
+        UTC) pages of ``numberOfTicks`` are requested, each one starting at
+        the time of the last tick received, until ``enddate`` (or the current
+        time) is reached. The ticks of the last second of a page, which are
+        sent again at the start of the next one, are delivered only once
+
+        With only ``enddate`` a single page with the ticks before it is
+        requested
         '''
-        # Keep a copy for error reporting purposes
-        kwargs = locals().copy()
-        kwargs.pop('self', None)  # remove self, no need to report it
-
-        if enddate and begindate:
-            err = ('Only fromdate OR enddate can be specified not both')
-            self.notifs.put((err, (), kwargs))
-            return self.getTickerQueue(start=True)
-
         if enddate is None and begindate is None:
             today = datetime.utcnow().date()
             begindate = datetime(today.year, today.month, today.day)
@@ -1326,24 +2521,61 @@ class IBStore(with_metaclass(MetaSingleton, object)):
             self.iscash[tickerId] = 4  # msg.field code
 
         what = what or 'TRADES'
+        numberOfTicks = max(1, min(numberOfTicks, 1000))  # TWS limit
 
-        self.conn.reqHistoricalTicks(
+        if begindate is None:  # only enddate: the ticks before it
+            self._reqHistoricalTicksPage(tickerId, contract, None, enddate,
+                                         numberOfTicks, what, useRTH,
+                                         priority)
+            return q
+
+        end = None
+        if enddate is not None:
+            end = calendar.timegm(enddate.timetuple())
+
+        self.histtickreq[tickerId] = treq = dict(
+            contract=contract, end=end, what=what, useRTH=useRTH,
+            nticks=numberOfTicks, priority=priority,
+            last=None,  # time of the last tick received
+            seen=0,  # ticks received with time == last
+            skip=0,  # ticks at the start of the page already delivered
+            page=0,  # ticks received in the current page
+            new=0,  # ticks delivered from the current page
+            over=False,  # a tick past end was received
+            pages=0, ticks=0, t0=time.monotonic(),
+        )
+        self._histtickpage(tickerId, treq, begindate)
+        return q
+
+    def _reqHistoricalTicksPage(self, tickerId, contract, begindate, enddate,
+                                numberOfTicks, what, useRTH, priority):
+        self._sendreq(
+            'hist', priority,
+            self.conn.reqHistoricalTicks,
             tickerId,
             contract,
             # bytes(begindate.strftime('%Y%m%d %H:%M:%S') + ' GMT') if begindate else '',
             # bytes(enddate.strftime('%Y%m%d %H:%M:%S') + ' GMT') if enddate else '',
             bytes(begindate.strftime('%Y%m%d-%H:%M:%S')) if begindate else '',
             bytes(enddate.strftime('%Y%m%d-%H:%M:%S')) if enddate else '',
-            100,
+            numberOfTicks,
             bytes(what),
             int(useRTH),
             True,
             [])
 
-        return q
+    def _histtickpage(self, tickerId, treq, begindate):
+        # Requests the next page of a paged tick request
+        treq['skip'] = treq['seen']  # sent again if the page starts at last
+        treq['seen'] = 0
+        treq['page'] = treq['new'] = 0
+        treq['pages'] += 1
+        self._reqHistoricalTicksPage(
+            tickerId, treq['contract'], begindate, None, treq['nticks'],
+            treq['what'], treq['useRTH'], treq['priority'])
 
     def reqHistoricalTicks(self, contract, enddate, begindate,
-                          what=None, useRTH=False, tz=''):
+                          what=None, useRTH=False, tz='', priority=None):
         '''Proxy to reqHistoricalTicks'''
 
         # get a ticker/queue for identification/data delivery
@@ -1367,7 +2599,9 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         elif what == 'MIDPOINT':
             when = 'MidPoint'
 
-        self.conn.reqHistoricalTicks(
+        self._sendreq(
+            'hist', priority,
+            self.conn.reqHistoricalTicks,
             tickerId,
             contract,
             # bytes(begindate.strftime('%Y%m%d %H:%M:%S') + ' GMT') if begindate else '',
@@ -1391,7 +2625,9 @@ class IBStore(with_metaclass(MetaSingleton, object)):
           - q: the Queue returned by reqMktData
         '''
         with self._lock_q:
-            self.conn.cancelHistoricalData(self.ts[q])
+            tickerId = self.ts[q]
+            if tickerId not in self.histsegreq:  # else cancelQueue does it
+                self._cancelreq(self.conn.cancelHistoricalData, tickerId)
             logger.warn(f"Cancel data queue for {q}")
             self.cancelQueue(q, True)
 
@@ -1407,13 +2643,21 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         Returns:
           - a Queue the client can wait on to receive a RTVolume instance
         '''
+        what = what or 'TRADES'
+
         # get a ticker/queue for identification/data delivery
-        tickerId, q = self.getTickerQueue()
+        share = self._sharekey(contract, 'rtbars', what, useRTH, duration)
+        tickerId, q = self.getTickerQueue(ring=True, share=share)
+        if tickerId is None:
+            return q  # joined an active subscription
 
-        what = what or 'TRADES'
+        if self.journal is not None:
+            self.journal.register(tickerId, contract)
 
         # 20150929 - Only 5 secs supported for duration
-        self.conn.reqRealTimeBars(
+        self._sendreq(
+            'live', self.PRIO_LIVE,
+            self.conn.reqRealTimeBars,
             tickerId,
             contract,
             duration,
@@ -1430,25 +2674,36 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         Params:
           - q: the Queue returned by reqMktData
         '''
-        with self._lock_q:
-            tickerId = self.ts.get(q, None)
-            if tickerId is not None:
-                self.conn.cancelRealTimeBars(tickerId)
-
-            logger.debug(f"Cancel data queue for {tickerId}")
-            self.cancelQueue(q, True)
+        self._cancelstream(q, self.conn.cancelRealTimeBars)
 
-    def reqMktData(self, contract, what=None):
+    def reqMktData(self, contract, what=None, conflate=False, maxsize=0,
+                   overflow='block', barsize=0, partial=0.0):
         '''Creates a MarketData subscription
 
         Params:
           - contract: a ib.ext.Contract.Contract intance
+          - conflate: (default: False) keep only the latest message of each
+            kind pending in the queue
+          - maxsize: (default: 0) max number of pending messages (0: no limit)
+          - overflow: (default: 'block') policy when maxsize is reached:
+            'block', 'dropoldest' or 'conflate'
+          - barsize: (default: 0) if not 0, seconds of the bars (RTBar) built
+            by the store from the trades (RTVolume, or the tracked price for
+            cash products) and delivered instead of the ticks
+          - partial: (default: 0.0) with barsize, seconds between deliveries
+            of the bar in progress (0: only completed bars)
 
         Returns:
           - a Queue the client can wait on to receive a RTVolume instance
         '''
         # get a ticker/queue for identification/data delivery
-        tickerId, q = self.getTickerQueue()
+        share = self._sharekey(contract, 'mktdata', what, barsize, partial)
+        tickerId, q = self.getTickerQueue(ring=True, conflate=conflate,
+                                          maxsize=maxsize, overflow=overflow,
+                                          share=share)
+        if tickerId is None:
+            return q  # joined an active subscription
+
         ticks = '233'  # request RTVOLUME tick delivered over tickString
 
         if contract.secType in ['CASH', 'CFD']:
@@ -1457,15 +2712,27 @@ class IBStore(with_metaclass(MetaSingleton, object)):
             if what == 'ASK':
                 self.iscash[tickerId] = 2
 
+        if self.journal is not None:
+            self.journal.register(tickerId, contract)
+        if barsize:
+            self._tickbars(tickerId, barsize, partial)
+
         # q.put(None)  # to kickstart backfilling
         # Can request 233 also for cash ... nothing will arrive
-        self.conn.reqMktData(tickerId, contract, bytes(ticks), False, False, [])
+        self._sendreq('live', self.PRIO_LIVE, self.conn.reqMktData,
+                      tickerId, contract, bytes(ticks), False, False, [])
         return q
 
-    def reqTickByTickData(self, contract, what=None, ignoreSize=True):
+    def reqTickByTickData(self, contract, what=None, ignoreSize=True,
+                          conflate=False, maxsize=0, overflow='block',
+                          barsize=0, partial=0.0):
         '''
         Tick-by-tick data corresponding to the data shown in the 
         TWS Time & Sales Window is available starting with TWS v969 and API v973.04.
+
+        ``conflate``, ``maxsize`` and ``overflow`` control the delivery queue
+        as in ``reqMktData``. With ``barsize`` (and ``partial``) the store
+        delivers bars built from the ticks (the midpoint for ``BID_ASK``)
         '''    
 
         if what == 'TRADES':
@@ -1479,23 +2746,70 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         else:
             what = 'Last'
 
-        tickerId, q = self.getTickerQueue()
-        self.conn.reqTickByTickData(tickerId, contract, what, 0, ignoreSize)
+        share = self._sharekey(contract, 'tickbytick', what, ignoreSize,
+                               barsize, partial)
+        tickerId, q = self.getTickerQueue(ring=True, conflate=conflate,
+                                          maxsize=maxsize, overflow=overflow,
+                                          share=share)
+        if tickerId is None:
+            return q  # joined an active subscription
+
+        if self.journal is not None:
+            self.journal.register(tickerId, contract)
+        if barsize:
+            self._tickbars(tickerId, barsize, partial)
+
+        self._sendreq('live', self.PRIO_LIVE, self.conn.reqTickByTickData,
+                      tickerId, contract, what, 0, ignoreSize)
         return q
     
+    def _tickbars(self, tickerId, barsize, partial):
+        # Aggregate the ticks of tickerId into bars (and deliver the ended
+        # ones periodically if barflush is set)
+        self.tickbars[tickerId] = TickBars(tickerId, barsize, RTBar, partial)
+        if self.p.barflush > 0 and not self._flushing:
+            self._flushing = True
+            self._flushbars(first=True)
+
+    def _flushbars(self, first=False):
+        if not first:
+            now = time.time() + self.timeoffset().total_seconds()
+            now -= self.p.barflush
+            for tickerId, bars in list(self.tickbars.items()):
+                with bars.lock:  # see _tickbar
+                    bar = bars.flush(now)
+                    q = self.qs.get(tickerId)
+                    if bar is not None and q is not None:
+                        q.put(bar)
+
+        self._rearm('barflush', self.p.barflush, self._flushbars)
+
+    def _tickbar(self, tickerId, bars, t, price, size=0.0, tin=None):
+        # Adds a tick to the bars of tickerId and delivers the bar it ends (if
+        # any). _flushbars puts bars from a timer thread: holding the lock of
+        # the bars while putting keeps the queue with one producer at a time
+        # and the bars in order
+        with bars.lock:
+            bar = bars.tick(t, price, size)
+            if bar is not None:
+                if tin:
+                    bar.tin, bar.tenq = tin, self._tickclock()
+                self.qs[tickerId].put(bar)
+
+    def get_bar_stats(self):
+        '''Returns a dict (key: tickerId) with the ``ticks`` aggregated, the
+        ``bars`` delivered and the ``late`` ticks discarded by the requests
+        delivering bars built by the store'''
+        return {tickerId: bars.stats()
+                for tickerId, bars in list(self.tickbars.items())}
+
     def cancelMktData(self, q):
         '''Cancels an existing MarketData subscription
 
         Params:
           - q: the Queue returned by reqMktData
         '''
-        with self._lock_q:
-            tickerId = self.ts.get(q, None)
-            if tickerId is not None:
-                self.conn.cancelMktData(tickerId)
-
-            logger.debug(f"Cancel data queue for {tickerId}")
-            self.cancelQueue(q, True)
+        self._cancelstream(q, self.conn.cancelMktData)
 
     def cancelTickByTickData(self, q):
         '''Cancels an existing MarketData subscription
@@ -1503,23 +2817,123 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         Params:
           - q: the Queue returned by reqTickByTickData
         '''
-        with self._lock_q:
-            tickerId = self.ts.get(q, None)
-            if tickerId is not None:
-                self.conn.cancelTickByTickData(tickerId)
+        self._cancelstream(q, self.conn.cancelTickByTickData)
+
+    # asyncio front end. The requests are made from the event loop (and sent
+    # to TWS or the pacing scheduler without blocking) and the answers are
+    # handed over from the API thread to the loop in batches by AsyncQueue
+    @contextlib.contextmanager
+    def _asyncqueues(self):
+        '''Queues created in the block by the calling thread are bound to the
+        running event loop'''
+        self._aio.loop = asyncio.get_running_loop()
+        try:
+            yield
+        finally:
+            self._aio.loop = None
+
+    async def contract_details(self, contract, maxcount=None):
+        '''Async version of ``getContractDetails``'''
+        cds = None
+        if self.contractcache is not None:
+            cds = self.contractcache.get(contract)
+
+        if cds is None:
+            with self._asyncqueues():
+                q = self.reqContractDetails(contract)
+
+            cds = list()
+            while True:
+                msgs = await q.getmany()
+                if msgs[-1] is None:
+                    cds.extend(msgs[:-1])
+                    break
+                cds.extend(msgs)
+
+            if cds and self.contractcache is not None:
+                cds = self.contractcache.put(contract, cds)
+
+        if not cds or (maxcount and len(cds) > maxcount):
+            err = 'Ambiguous contract: none/multiple answers received'
+            self.notifs.put((err, cds, {}))
+            return None
+
+        return cds
+
+    async def historical(self, contract, enddate, begindate,
+                         timeframe, compression, what=None, useRTH=False,
+                         tz='', sessionend=None, priority=None):
+        '''Async generator version of ``reqHistoricalDataEx`` yielding the
+        historical bars. Notifications (integer error codes) are not yielded.
+        The request is cancelled if the generator is closed before the end'''
+        with self._asyncqueues():
+            q = self.reqHistoricalDataEx(
+                contract, enddate, begindate, timeframe, compression,
+                what=what, useRTH=useRTH, tz=tz, sessionend=sessionend,
+                priority=priority)
+
+        try:
+            while True:
+                for msg in await q.getmany():
+                    if msg is None:
+                        return
+                    if not isinstance(msg, integer_types):
+                        yield msg
+        finally:
+            with self._lock_q:
+                tickerId = self.ts.get(q, None)
+                if tickerId is not None:
+                    if tickerId not in self.histsegreq:
+                        self._cancelreq(self.conn.cancelHistoricalData,
+                                        tickerId)
+                    self.cancelQueue(q)
+
+    async def market_data(self, contract, what=None, tickbytick=False):
+        '''Async generator yielding the messages of a market data
+        (``reqMktData``) or, with ``tickbytick``, tick by tick
+        (``reqTickByTickData``) subscription, which is cancelled when the
+        generator is closed. Notifications (integer error codes) are not
+        yielded'''
+        with self._asyncqueues():
+            if tickbytick:
+                q = self.reqTickByTickData(contract, what)
+            else:
+                q = self.reqMktData(contract, what)
+
+        try:
+            while True:
+                for msg in await q.getmany():
+                    if msg is None:
+                        return
+                    if not isinstance(msg, integer_types):
+                        yield msg
+        finally:
+            if tickbytick:
+                self.cancelTickByTickData(q)
+            else:
+                self.cancelMktData(q)
 
-            logger.debug(f"Cancel data queue for {tickerId}")
-            self.cancelQueue(q, True)
-    
     def tickString(self, reqId, tickType, value):
         # Receive and process a tickString message
+        tin = self._tickclock()
         tickerId = reqId
         if tickType == 48:  # RTVolume
             try:
-                rtvol = RTVolume(value)
+                rtvol = RTVolume.parse(value)
             except ValueError:  # price not in message ...
                 pass
             else:
+                if self.journal is not None:
+                    self.journal.rtvolume(
+                        tickerId, rtvol.ms, rtvol.price, rtvol.size,
+                        rtvol.volume, rtvol.vwap, rtvol.single)
+                bars = self.tickbars.get(tickerId)
+                if bars is not None:
+                    self._tickbar(tickerId, bars, rtvol.ms / 1000.0,
+                                  rtvol.price, rtvol.size, tin)
+                    return
+                if tin:
+                    rtvol.tin, rtvol.tenq = tin, self._tickclock()
                 # Don't need to adjust the time, because it is in "timestamp"
                 # form in the message
                 self.qs[tickerId].put(rtvol)
@@ -1536,7 +2950,11 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         # Used for "CASH" markets
         # The price field has been seen to be missing in some instances even if
         # "field" is 1
+        tin = self._tickclock()
         tickerId = reqId
+        if self.journal is not None:
+            self.journal.price(tickerId, tickType, price)
+
         fieldcode = self.iscash[tickerId]
         if fieldcode:
             if tickType == fieldcode:  # Expected cash field code
@@ -1550,11 +2968,19 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
                 try:
                     rtvol = RTVolume(price=price, tmoffset=self.tmoffset)
-                    # print('rtvol with datetime:', rtvol.datetime)
                 except ValueError:  # price not in message ...
                     pass
                 else:
+                    bars = self.tickbars.get(tickerId)
+                    if bars is not None:
+                        now = time.time() + self.tmoffset.total_seconds()
+                        self._tickbar(tickerId, bars, now, price, tin=tin)
+                        return
+                    if tin:
+                        rtvol.tin, rtvol.tenq = tin, self._tickclock()
                     self.qs[tickerId].put(rtvol)
+        elif tickerId in self.tickbars:
+            return  # bars are built from the trades (RTVolume)
         else:
             # Non-cash
             try:
@@ -1565,11 +2991,21 @@ class IBStore(with_metaclass(MetaSingleton, object)):
             except AttributeError:
                 pass
             rtprice = RTPrice(price=price, tmoffset=self.tmoffset)
+            if tin:
+                rtprice.tin, rtprice.tenq = tin, self._tickclock()
             self.qs[tickerId].put(rtprice)
 
     def tickSize(self, reqId, tickType, size):
+        tin = self._tickclock()
         tickerId = reqId
+        if self.journal is not None:
+            self.journal.size(tickerId, tickType, size)
+        if tickerId in self.tickbars:
+            return  # bars are built from the trades (RTVolume)
+
         rtsize = RTSize(size=size, tmoffset=self.tmoffset)
+        if tin:
+            rtsize.tin, rtsize.tenq = tin, self._tickclock()
         self.qs[tickerId].put(rtsize)
 
     def tickGeneric(self, reqId, tickType, value):
@@ -1591,8 +3027,14 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
         Not valid for cash markets
         '''
-        # Get a naive localtime object
-        msg.time = datetime.utcfromtimestamp(float(msg.time))
+        tin = self._tickclock()
+        if self.journal is not None:
+            self.journal.rtbar(msg.reqId, msg.ts, msg.open, msg.high,
+                               msg.low, msg.close, msg.volume, msg.wap,
+                               msg.count)
+
+        if tin:
+            msg.tin, msg.tenq = tin, self._tickclock()
         self.qs[msg.reqId].put(msg)
 
     def historicalData(self, msg):
@@ -1601,35 +3043,69 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         # tickerId (in case tickerIds are not reusable) and instead of putting
         # None, issue a new reqHistData with the new data and move formward
         tickerId = msg.reqId
-        q = self.qs[tickerId]
-
-        dtstr = msg.date  # Format when string req: YYYYMMDD[  HH:MM:SS]
-        if self.histfmt[tickerId]:
-            sessionend = self.histsend[tickerId]
-            dt = datetime.strptime(dtstr, '%Y%m%d')
-            dteos = datetime.combine(dt, sessionend)
-            tz = self.histtz[tickerId]
-            if tz:
-                dteostz = tz.localize(dteos)
-                dteosutc = dteostz.astimezone(UTC).replace(tzinfo=None)
-                # When requesting for example daily bars, the current day
-                # will be returned with the already happened data. If the
-                # session end were added, the new ticks wouldn't make it
-                # through, because they happen before the end of time
-            else:
-                dteosutc = dteos
+        seg = self.histseg.get(tickerId)
+        if seg is not None:  # segment of a concurrent request, re-sequence
+            hseg, idx = seg
+            for msg in hseg.put(idx, msg):
+                self._histbar(hseg.tickerId, msg)
+            return
 
-            if dteosutc <= datetime.utcnow():
-                dt = dteosutc
+        self._histbar(tickerId, msg)
+
+    def _histbar(self, tickerId, msg):
+        '''Converts and delivers a historical bar for request tickerId'''
+        self._histbars(tickerId, (msg,))
+
+    def _histbars(self, tickerId, msgs):
+        '''Converts and delivers historical bars for request tickerId. The
+        dates of several bars are converted in a single batch'''
+        q = self.qs.get(tickerId)
+        if q is None:
+            return  # cancelled: bars sent before TWS got the cancellation
+        daily = self.histfmt[tickerId]
+
+        creq = self.histcachereq.get(tickerId)
+        if creq is not None:  # keep the raw bars for the historical cache
+            fresh = list()
+            for msg in msgs:
+                t = self.histdates.epoch(msg.date, daily)
+                creq['rows'].append((t, msg.open, msg.high, msg.low, msg.close,
+                                     float(msg.volume), float(msg.wap),
+                                     msg.count))
+                if t <= creq['lastt']:
+                    continue  # already delivered (disk or previous segment)
+                creq['lastt'] = t
+                fresh.append(msg)
+
+            msgs = fresh
+
+        # Format of date when string req: YYYYMMDD or epoch seconds
+        sessionend, tz = self.histsend[tickerId], self.histtz[tickerId]
+        if len(msgs) == 1:
+            msg = msgs[0]
+            msg.date, msg.dtnum = self.histdates.convert(msg.date, daily,
+                                                         sessionend, tz)
+            msg.reqId = tickerId
+            q.put(msg)
+            return
 
-            msg.date = dt
-        else:
-            msg.date = datetime.utcfromtimestamp(long(dtstr))
+        dts, nums = self.histdates.convert_many([msg.date for msg in msgs],
+                                                daily, sessionend, tz)
+        for msg, dt, dtnum in zip(msgs, dts, nums):
+            msg.date, msg.dtnum = dt, dtnum
+            msg.reqId = tickerId
+            q.put(msg)
 
-        q.put(msg)
-    
     def historicalDataEnd(self, reqId, start, end):
         tickerId = reqId
+        if self.scheduler is not None:
+            self.scheduler.done(tickerId)
+
+        seg = self.histseg.pop(tickerId, None)
+        if seg is not None:  # segment of a concurrent request
+            self._histsegend(tickerId, *seg)
+            return
+
         self.histfmt.pop(tickerId, None)
         self.histsend.pop(tickerId, None)
         self.histtz.pop(tickerId, None)
@@ -1638,31 +3114,129 @@ class IBStore(with_metaclass(MetaSingleton, object)):
             self.reqHistoricalDataEx(tickerId=tickerId, **kargs)
             return
 
-        q = self.qs[tickerId]
-        self.cancelQueue(q)
+        creq = self.histcachereq.get(tickerId)
+        if creq is not None:
+            # gap completely downloaded. The bars which may still change
+            # (too close to now) are stored but the range is not marked as
+            # downloaded to have them requested again
+            begin, end = creq['segment']
+            end = min(end, int(time.time()) - creq['barsecs'])
+            self.histcache.store(creq['key'], creq['rows'], begin, end)
+            creq['rows'] = list()
+            self._histcachenext(tickerId)
+            return
+
+        q = self.qs.get(tickerId)
+        if q is not None:  # else cancelled
+            self.cancelQueue(q)
 
     def historicalTicks(self, reqId, tick):
         tickerId = reqId
+        treq = self.histtickreq.get(tickerId)
+        if treq is not None:
+            treq['page'] += 1
+            if tick.time == treq['last']:
+                treq['seen'] += 1
+                if treq['seen'] <= treq['skip']:
+                    return  # already delivered with the previous page
+            else:
+                treq['last'] = tick.time
+                treq['seen'] = 1
+                treq['skip'] = 0  # only for the second at the page start
+
+            if treq['end'] is not None and tick.time > treq['end']:
+                treq['over'] = True
+                return
+
+            treq['new'] += 1
+            treq['ticks'] += 1
+
         self.qs[tickerId].put(tick)
 
     def historicalTicksEnd(self, reqId):
         tickerId = reqId
-        q = self.qs[tickerId]
-        self.cancelTickByTickData(q)
+        q = self.qs.get(tickerId)
+        if q is None:
+            return  # cancelled in the meantime
+
+        treq = self.histtickreq.get(tickerId)
+        if treq is not None:
+            if self.scheduler is not None:
+                self.scheduler.done(tickerId)
+
+            # A short page means there is nothing else up to now
+            more = not treq['over'] and treq['page'] >= treq['nticks']
+            if more and treq['end'] is not None:
+                more = treq['last'] < treq['end']
+
+            if more:
+                last = treq['last']
+                if not treq['new']:
+                    # A full page inside the same second: the rest of the
+                    # second cannot be requested. Move to the next one
+                    logger.warning(f'Ticks of {tickerId} at {last} over the '
+                                   f'page size, skipping to next second')
+                    last += 1
+                    treq['last'], treq['seen'] = last, 0
+
+                self._histtickpage(tickerId, treq,
+                                   datetime.utcfromtimestamp(last))
+                return
+
+            elapsed = time.monotonic() - treq['t0']
+            logger.debug(f'Ticks of {tickerId}: {treq["ticks"]} in '
+                         f'{treq["pages"]} pages, {elapsed:.2f} seconds')
+
+        self.cancelQueue(q)
 
     def tickByTickBidAsk(self, reqId, time, bidPrice, askPrice, bidSize, askSize, tickAttribBidAsk):
+        tin = self._tickclock()
         tickerId = reqId
+        if self.journal is not None:
+            self.journal.bidask(tickerId, time, bidPrice, askPrice, bidSize,
+                                askSize)
+
+        bars = self.tickbars.get(tickerId)
+        if bars is not None:
+            self._tickbar(tickerId, bars, time, (bidPrice + askPrice) / 2.0,
+                          tin=tin)
+            return
+
         tick = RTTickBidAsk(time, bidPrice, askPrice, bidSize, askSize, tickAttribBidAsk)
+        if tin:
+            tick.tin, tick.tenq = tin, self._tickclock()
         self.qs[tickerId].put(tick)
 
     def tickByTickAllLast(self, reqId, tickType, time, price, size, tickAtrribLast, exchange, specialConditions):
+        tin = self._tickclock()
         tickerId = reqId
+        if self.journal is not None:
+            self.journal.last(tickerId, tickType, time, price, size)
+
+        bars = self.tickbars.get(tickerId)
+        if bars is not None:
+            self._tickbar(tickerId, bars, time, price, float(size), tin)
+            return
+
         tick = RTTickLast(tickType, time, price, size, tickAtrribLast, exchange, specialConditions)
+        if tin:
+            tick.tin, tick.tenq = tin, self._tickclock()
         self.qs[tickerId].put(tick)
 
     def tickByTickMidPoint(self, reqId, time, midPoint):
+        tin = self._tickclock()
         tickerId = reqId
-        tick = RTTickMidPoint(time, time, midPoint)
+        if self.journal is not None:
+            self.journal.midpoint(tickerId, time, midPoint)
+
+        bars = self.tickbars.get(tickerId)
+        if bars is not None:
+            self._tickbar(tickerId, bars, time, midPoint, tin=tin)
+            return
+
+        tick = RTTickMidPoint(time, midPoint)
+        if tin:
+            tick.tin, tick.tenq = tin, self._tickclock()
         self.qs[tickerId].put(tick)
 
     # The _durations are meant to calculate the needed historical data to
@@ -1961,7 +3535,8 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
         return '1 Y'  # to keep the table clean
 
-    def makecontract(self, symbol, sectype, exch, curr,
+    @staticmethod
+    def makecontract(symbol, sectype, exch, curr,
                      expiry='', strike=0.0, right='', mult=1, 
                      primaryExch=None, localSymbol=None):
         '''returns a contract from the parameters without check'''
@@ -2066,6 +3641,8 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         # Signals the end of an account update
         # the event indicates it's over. It's only false once, and can be used
         # to find out if it has at least been downloaded once
+        with self._lock_accupd:
+            self.accsnapshot = self.accsnapshot.download_end()
         self._event_accdownload.set()
         if False:
             if self.port_update:
@@ -2115,22 +3692,43 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
     @logibmsg
     def updateAccountValue(self, key, value, currency, accountName):
-        # Lock access to the dicts where values are updated. This happens in a
-        # sub-thread and could kick it at anytime
-        with self._lock_accupd:
-            try:
-                value = float(value)
-            except ValueError:
-                value = value
+        # A new snapshot is published for each update. The lock only
+        # serializes writers: readers simply take the current reference
+        try:
+            value = float(value)
+        except ValueError:
+            value = value
 
-            self.acc_upds[accountName][key][currency] = value
+        with self._lock_accupd:
+            self.accsnapshot = self.accsnapshot.update(accountName, key,
+                                                       currency, value)
+
+    @property
+    def acc_upds(self):
+        '''Current account valueinfos per account (not to be modified)'''
+        return self.accsnapshot.values
+
+    @property
+    def acc_cash(self):
+        '''Current total cash per account (not to be modified)'''
+        return self.accsnapshot.cash
+
+    @property
+    def acc_value(self):
+        '''Current total value per account (not to be modified)'''
+        return self.accsnapshot.value
+
+    def get_acc_snapshot(self):
+        '''Returns the current ``AccountSnapshot``. It is never modified:
+        a new one is published with each update'''
+        return self.accsnapshot
+
+    def get_acc_version(self):
+        '''Returns the version of the account values, which changes with
+        each update received. It can be used to skip work if nothing changed
+        since the last time it was checked'''
+        return self.accsnapshot.version
 
-            if key == 'NetLiquidation':
-                # NetLiquidationByCurrency and currency == 'BASE' is the same
-                self.acc_value[accountName] = value
-            elif key == 'CashBalance' and currency == 'BASE':
-                self.acc_cash[accountName] = value
-    
     @logibmsg
     def get_acc_values(self, account=None):
         '''Returns all account value infos sent by TWS during regular updates
@@ -2141,33 +3739,35 @@ class IBStore(with_metaclass(MetaSingleton, object)):
 
         If account is specified or the system has only 1 account the dictionary
         corresponding to that account is returned
+
+        The result is a copy (all levels) which can be freely modified
         '''
         # Wait for at least 1 account update download to have been finished
         # before the account infos can be returned to the calling client
         # if self.connected():
         #     self._event_accdownload.wait()
-        # Lock access to acc_cash to avoid an event intefering
-        with self._updacclock:
-            if account is None:
-                # wait for the managedAccount Messages
-                # if self.connected():
-                #     self._event_managed_accounts.wait()
+        # The snapshot is immutable: no lock, but it is copied to keep it so
+        values = self.accsnapshot.values
+        if account is None:
+            # wait for the managedAccount Messages
+            # if self.connected():
+            #     self._event_managed_accounts.wait()
 
-                if not self.managed_accounts:
-                    return self.acc_upds.copy()
+            if not self.managed_accounts:
+                return copyvalues(values)
 
-                elif len(self.managed_accounts) > 1:
-                    return self.acc_upds.copy()
+            elif len(self.managed_accounts) > 1:
+                return copyvalues(values)
 
-                # Only 1 account, fall through to return only 1
-                account = self.managed_accounts[0]
+            # Only 1 account, fall through to return only 1
+            account = self.managed_accounts[0]
 
-            try:
-                return self.acc_upds[account].copy()
-            except KeyError:
-                pass
+        try:
+            return copyvalues(values[account])
+        except KeyError:
+            pass
 
-            return self.acc_upds.copy()
+        return copyvalues(values)
 
     @logibmsg
     def get_acc_value(self, account=None):
@@ -2182,22 +3782,21 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         '''
         # Wait for at least 1 account update download to have been finished
         # before the value can be returned to the calling client
-        # Lock access to acc_cash to avoid an event intefering
-
-        with self._updacclock:
-            if account is None:
-                if not self.managed_accounts:
-                    return float()
-                elif len(self.managed_accounts) > 1:
-                    return sum(self.acc_value.values())
-
-                # Only 1 account, fall through to return only 1
-                account = self.managed_accounts[0]
-                
-            try:
-                return self.acc_value[account]
-            except KeyError:
-                pass
+        # The snapshot is immutable: no lock needed
+        acc_value = self.accsnapshot.value
+        if account is None:
+            if not self.managed_accounts:
+                return float()
+            elif len(self.managed_accounts) > 1:
+                return sum(acc_value.values())
+
+            # Only 1 account, fall through to return only 1
+            account = self.managed_accounts[0]
+
+        try:
+            return acc_value[account]
+        except KeyError:
+            pass
 
         return float()
 
@@ -2216,23 +3815,25 @@ class IBStore(with_metaclass(MetaSingleton, object)):
         # before the cash can be returned to the calling client
         # if self.connected():
         #     self._event_accdownload.wait()
-        # Lock access to acc_cash to avoid an event intefering
-        with self._lock_accupd:
-            if account is None:
-                # # wait for the managedAccount Messages
-                # if self.connected():
-                #     self._event_managed_accounts.wait()
+        # The snapshot is immutable: no lock needed
+        acc_cash = self.accsnapshot.cash
+        if account is None:
+            # # wait for the managedAccount Messages
+            # if self.connected():
+            #     self._event_managed_accounts.wait()
 
-                if not self.managed_accounts:
-                    return float()
+            if not self.managed_accounts:
+                return float()
 
-                elif len(self.managed_accounts) > 1:
-                    return sum(self.acc_cash.values())
+            elif len(self.managed_accounts) > 1:
+                return sum(acc_cash.values())
 
-                # Only 1 account, fall through to return only 1
-                account = self.managed_accounts[0]
+            # Only 1 account, fall through to return only 1
+            account = self.managed_accounts[0]
 
-            try:
-                return self.acc_cash[account]
-            except KeyError:
-                pass
+        try:
+            return acc_cash[account]
+        except KeyError:
+            pass
+
+        return float()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Append-only journal of the live market data received by the store, in
+# memory-mapped files of fixed-width records (one per instrument and day)
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from array import array
+import bisect
+import mmap
+import os
+import os.path
+import struct
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# Record: receive time (ns), integer value (event time, count), kind, tick
+# type and 7 values. See the kinds below for the meaning of the fields
+RECORD = struct.Struct('<qqBB6x7d')
+RECSIZE = RECORD.size  # 80 bytes
+
+# Header (first record of the file): magic, record size, records written
+# (updated when the file is closed, readers rely on the first zero record)
+HEADER = struct.Struct('<4sqq')
+MAGIC = b'TKJ1'
+
+NS_PER_SEC = 1000000000
+NS_PER_DAY = 86400 * NS_PER_SEC
+
+# Kinds of record and their fields (after receive time)
+PRICE = 1  # ttype: tickType, v0: price
+SIZE = 2  # ttype: tickType, v0: size
+RTVOLUME = 3  # ival: trade time (ms), v0-v4: price, size, volume, vwap, single
+LAST = 4  # ival: time (s), ttype: tickType, v0-v1: price, size
+BIDASK = 5  # ival: time (s), v0-v3: bid, ask, bid size, ask size
+MIDPOINT = 6  # ival: time (s), v0: midpoint
+RTBAR = 7  # ival: time (s), v0-v6: open, high, low, close, volume, wap, count
+
+KINDS = {PRICE: 'price', SIZE: 'size', RTVOLUME: 'rtvolume', LAST: 'last',
+         BIDASK: 'bidask', MIDPOINT: 'midpoint', RTBAR: 'rtbar'}
+
+
+class JournalFile(object):
+    '''Writer of the journal file of an instrument for a day
+
+    The file grows in preallocated segments of ``segrecords`` records which
+    are memory-mapped. A record is written in place with ``pack_into``. The
+    index (``.idx`` file) holds pairs (second, first record of the second) and
+    is written when the file is closed
+    '''
+    def __init__(self, path, segrecords):
+        self.path = path
+        self.segsize = segrecords * RECSIZE
+
+        exists = os.path.exists(path)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self.fd).st_size
+        if not size:
+            size = self.segsize + RECSIZE
+            os.ftruncate(self.fd, size)
+
+        self.mm = mmap.mmap(self.fd, size)
+        self.end = size
+        self.pos = RECSIZE
+        self.index = array('q')
+        if exists:  # reopened in the same day: append after the last one
+            self.pos = RECSIZE * (1 + count_records(self.mm))
+            self.index = load_index(path)
+        else:
+            HEADER.pack_into(self.mm, 0, MAGIC, RECSIZE, 0)
+
+        self.lastsec = self.index[-2] if self.index else -1
+
+    def append(self, t, ival, kind, ttype, v0, v1, v2, v3, v4, v5, v6):
+        pos = self.pos
+        if pos >= self.end:
+            self._grow()
+
+        RECORD.pack_into(self.mm, pos, t, ival, kind, ttype,
+                         v0, v1, v2, v3, v4, v5, v6)
+        self.pos = pos + RECSIZE
+        if t // NS_PER_SEC != self.lastsec:
+            self.mark(t, pos)
+
+    def mark(self, t, pos):
+        '''Adds the record at pos (received at t) to the index: the first of
+        its second'''
+        self.lastsec = sec = t // NS_PER_SEC
+        self.index.append(sec)
+        self.index.append(pos // RECSIZE - 1)
+
+    def _grow(self):
+        self.mm.close()
+        self.end += self.segsize
+        os.ftruncate(self.fd, self.end)
+        self.mm = mmap.mmap(self.fd, self.end)
+
+    def close(self):
+        count = self.pos // RECSIZE - 1
+        HEADER.pack_into(self.mm, 0, MAGIC, RECSIZE, count)
+        self.mm.flush()
+        self.mm.close()
+        os.close(self.fd)
+        with open(self.path + '.idx', 'wb') as f:
+            self.index.tofile(f)
+
+
+def count_records(buf):
+    '''Returns the number of records in the journal buffer buf: the records
+    are followed by zeroes (preallocated space)'''
+    lo, hi = 0, len(buf) // RECSIZE - 1
+    while lo < hi:  # first record with a zero receive time
+        mid = (lo + hi) // 2
+        if struct.unpack_from('<q', buf, RECSIZE * (mid + 1))[0]:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    return lo
+
+
+def load_index(path):
+    '''Returns the index (array of second, record pairs) of a journal file
+    (empty if there is none)'''
+    index = array('q')
+    try:
+        with open(path + '.idx', 'rb') as f:
+            index.frombytes(f.read())
+    except (IOError, OSError):
+        pass
+
+    return index
+
+
+def read_journal(path, start=None, end=None):
+    '''Yields the records of the journal file ``path`` as tuples (receive
+    time ns, ival, kind, ttype, v0, ..., v6), optionally only those received
+    from ``start`` to ``end`` (epoch seconds, end excluded). The index is
+    used to find the first record'''
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        count = count_records(buf)
+        first = 0
+        index = load_index(path)
+        if start is not None and index:
+            secs = index[0::2]
+            i = bisect.bisect_left(secs, int(start))
+            first = index[2 * i + 1] if i < len(secs) else count
+
+        stop = NS_PER_SEC * end if end is not None else None
+        begin = NS_PER_SEC * start if start is not None else None
+        for recno in range(first, count):
+            rec = RECORD.unpack_from(buf, RECSIZE * (recno + 1))
+            if begin is not None and rec[0] < begin:
+                continue
+            if stop is not None and rec[0] >= stop:
+                break
+            yield rec
+    finally:
+        buf.close()
+
+
+def journal_name(contract):
+    '''Returns the name of the journal files of contract: its ``conId`` or,
+    if not yet resolved, its description'''
+    if contract.conId:
+        return str(contract.conId)
+
+    return '-'.join(str(x) for x in (
+        contract.symbol, contract.secType, contract.exchange,
+        contract.currency, contract.localSymbol) if x)
+
+
+def journal_files(path, name, fromday=None, today=None):
+    '''Returns (sorted by day) the journal files of instrument ``name``
+    (``conId`` or description of the contract) in the journal directory
+    ``path``, optionally only those from/to the given days (``YYYYMMDD``,
+    both included)'''
+    files = list()
+    for day in sorted(os.listdir(path)):
+        if fromday is not None and day < fromday:
+            continue
+        if today is not None and day > today:
+            break
+
+        fname = os.path.join(path, day, name + '.ticks')
+        if os.path.exists(fname):
+            files.append(fname)
+
+    return files
+
+
+class TickJournal(object):
+    '''Journal of the live market data of the store in the directory
+    ``path``: a subdirectory per day (UTC, ``YYYYMMDD``) and in it a file per
+    instrument (``conId`` or description of the contract). Files are rotated
+    at midnight UTC
+
+    Requests are registered (``register``) with their contract and the events
+    are then written with the method of their kind, from the TWS API
+    thread(s)
+    '''
+    def __init__(self, path, segrecords=1 << 16):
+        self.path = path
+        self.segrecords = segrecords
+        self._names = dict()  # tickerId -> instrument name
+        self._files = dict()  # instrument name -> JournalFile
+        self._byid = dict()  # tickerId -> JournalFile (of the day)
+        self._day = None
+        self._rollat = 0  # receive time at which files are rotated
+        self._lock = threading.Lock()  # data connections of the pool
+        self.records = 0
+
+    def register(self, tickerId, contract):
+        name = journal_name(contract)
+        with self._lock:
+            self._names[tickerId] = name
+
+    def unregister(self, tickerId):
+        with self._lock:
+            self._names.pop(tickerId, None)
+            self._byid.pop(tickerId, None)
+
+    def _open(self, tickerId):
+        name = self._names.get(tickerId)
+        if name is None:
+            return None
+
+        jf = self._files.get(name)
+        if jf is None:
+            daypath = os.path.join(self.path, self._day)
+            os.makedirs(daypath, exist_ok=True)
+            jf = JournalFile(os.path.join(daypath, name + '.ticks'),
+                             self.segrecords)
+            self._files[name] = jf
+
+        self._byid[tickerId] = jf
+        return jf
+
+    def _rotate(self, t):
+        self._close()
+        day = t // NS_PER_DAY
+        self._day = time.strftime('%Y%m%d', time.gmtime(day * 86400))
+        self._rollat = (day + 1) * NS_PER_DAY
+
+    def _write(self, tickerId, kind, ttype, ival,
+               v0=0.0, v1=0.0, v2=0.0, v3=0.0, v4=0.0, v5=0.0, v6=0.0):
+        t = time.time_ns()
+        with self._lock:
+            if t >= self._rollat:
+                self._rotate(t)
+
+            jf = self._byid.get(tickerId)
+            if jf is None:
+                jf = self._open(tickerId)
+                if jf is None:
+                    return  # not registered
+
+            # JournalFile.append inlined: this runs for every tick
+            pos = jf.pos
+            if pos >= jf.end:
+                jf._grow()
+
+            RECORD.pack_into(jf.mm, pos, t, ival, kind, ttype,
+                             v0, v1, v2, v3, v4, v5, v6)
+            jf.pos = pos + RECSIZE
+            if t // NS_PER_SEC != jf.lastsec:
+                jf.mark(t, pos)
+
+            self.records += 1
+
+    def price(self, tickerId, tickType, price):
+        self._write(tickerId, PRICE, tickType, 0, price)
+
+    def size(self, tickerId, tickType, size):
+        self._write(tickerId, SIZE, tickType, 0, size)
+
+    def rtvolume(self, tickerId, ms, price, size, volume, vwap, single):
+        self._write(tickerId, RTVOLUME, 48, ms, price, size, volume, vwap,
+                    single)
+
+    def last(self, tickerId, tickType, tm, price, size):
+        self._write(tickerId, LAST, tickType, tm, price, size)
+
+    def bidask(self, tickerId, tm, bid, ask, bidsize, asksize):
+        self._write(tickerId, BIDASK, 0, tm, bid, ask, bidsize, asksize)
+
+    def midpoint(self, tickerId, tm, midpoint):
+        self._write(tickerId, MIDPOINT, 0, tm, midpoint)
+
+    def rtbar(self, tickerId, tm, open_, high, low, close, volume, wap, count):
+        self._write(tickerId, RTBAR, 0, tm, open_, high, low, close, volume,
+                    wap, count)
+
+    def stats(self):
+        '''Returns a dict with the ``records`` written, the ``files`` open and
+        the current ``day``'''
+        return dict(records=self.records, files=len(self._files),
+                    day=self._day)
+
+    def close(self):
+        '''Closes the files (writing their index). They are opened again if
+        more events are written'''
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        files, self._files = self._files, dict()
+        self._byid = dict()
+        for jf in files.values():
+            try:
+                jf.close()
+            except Exception as e:
+                logger.error(f'Closing journal {jf.path}: {e}')
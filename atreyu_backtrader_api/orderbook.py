@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Bounded bookkeeping of the orders and executions of the broker, with an
+# optional on disk archive of the finished orders
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+from decimal import Decimal
+import sqlite3
+import sys
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def qty(value):
+    '''Returns a quantity (float, Decimal, str) as a ``Decimal`` to compare
+    quantities exactly (``Decimal('3') == Decimal('3.0')``)'''
+    if isinstance(value, Decimal):
+        return value
+
+    return Decimal(str(value))
+
+
+class OrderIndex(object):
+    '''Orders of the broker by ``orderId`` and the executions waiting for
+    their commission report
+
+    Orders are ``live`` until they are finished (``finish``). The last
+    ``keep`` finished orders are kept (for duplicate notifications from TWS);
+    older ones are dropped or, if ``path`` is given, archived in an SQLite
+    database (see ``archived``)
+
+    Executions are kept by ``execId`` (only those of known orders) until the
+    commission report arrives, ``pending`` of them at most. The ``execIds``
+    already reported are remembered (``pending`` of them) to discard
+    duplicates
+
+    Lookups (``[]``, ``get``, ``in``) cover live and kept orders
+    '''
+    _SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS orders (
+            orderId INTEGER PRIMARY KEY, ref INTEGER, symbol TEXT,
+            action TEXT, status TEXT, size REAL, price REAL,
+            exsize REAL, exprice REAL, excomm REAL, pnl REAL, dt REAL)''',
+    )
+
+    def __init__(self, keep=1000, path=None, pending=10000):
+        self.keep = keep
+        self.pending = pending
+        self._lock = threading.Lock()
+        self.live = dict()  # orderId -> order
+        self.done = collections.OrderedDict()  # orderId -> finished order
+        self.executions = collections.OrderedDict()  # execId -> execution
+        self.reported = collections.OrderedDict()  # execId -> orderId
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            with self._db:
+                self._db.execute('PRAGMA journal_mode=WAL')
+                for sql in self._SCHEMA:
+                    self._db.execute(sql)
+
+        self.counters = collections.Counter()
+
+    def __setitem__(self, orderId, order):
+        with self._lock:
+            self.live[orderId] = order
+
+    def __getitem__(self, orderId):
+        try:
+            return self.live[orderId]
+        except KeyError:
+            return self.done[orderId]
+
+    def get(self, orderId, default=None):
+        order = self.live.get(orderId)
+        if order is None:
+            order = self.done.get(orderId, default)
+        return order
+
+    def __contains__(self, orderId):
+        return orderId in self.live or orderId in self.done
+
+    def __len__(self):
+        return len(self.live) + len(self.done)
+
+    def finish(self, order):
+        '''Moves order (no longer alive) out of the live orders'''
+        archive = list()
+        with self._lock:
+            if self.live.pop(order.orderId, None) is None:
+                return
+
+            self.done[order.orderId] = order
+            self.counters['finished'] += 1
+            while len(self.done) > self.keep:
+                _, old = self.done.popitem(last=False)
+                archive.append(old)
+
+        if archive:
+            self.counters['evicted'] += len(archive)
+            if self._db is not None:
+                self._archive(archive)
+
+    def _archive(self, orders):
+        rows = list()
+        for o in orders:
+            ex = o.executed
+            symbol = getattr(getattr(o.data, 'tradecontract', None),
+                             'symbol', None)
+            rows.append((o.orderId, o.ref, symbol,
+                         'BUY' if o.isbuy() else 'SELL', o.getstatusname(),
+                         o.created.size, o.created.price,
+                         ex.size, ex.price, ex.comm, ex.pnl, ex.dt))
+
+        try:
+            with self._db:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO orders VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.counters['archived'] += len(rows)
+        except sqlite3.Error as e:
+            logger.error(f'Cannot archive {len(rows)} orders: {e}')
+
+    def archived(self, orderId):
+        '''Returns a dict with the archived record of ``orderId`` (``None``
+        if it has not been archived)'''
+        if self._db is None:
+            return None
+
+        cur = self._db.execute('SELECT * FROM orders WHERE orderId = ?',
+                               (orderId,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+
+        return dict(zip((d[0] for d in cur.description), row))
+
+    def add_execution(self, ex):
+        '''Keeps the execution ``ex`` until its commission report. Returns
+        ``False`` if it is discarded: duplicate or of an unknown order'''
+        with self._lock:
+            if ex.execId in self.executions or ex.execId in self.reported:
+                self.counters['duplicated'] += 1
+                return False
+
+            if ex.orderId not in self.live and ex.orderId not in self.done:
+                self.counters['foreign'] += 1  # other client or manual
+                return False
+
+            self.executions[ex.execId] = ex
+            while len(self.executions) > self.pending:
+                self.executions.popitem(last=False)
+                self.counters['expired'] += 1
+
+        return True
+
+    def pop_execution(self, execId):
+        '''Returns the execution for the commission report of ``execId`` or
+        ``None`` if unknown, discarded or already reported'''
+        with self._lock:
+            ex = self.executions.pop(execId, None)
+            if ex is None:
+                self.counters['unmatched'] += 1
+                return None
+
+            self.reported[execId] = ex.orderId
+            while len(self.reported) > self.pending:
+                self.reported.popitem(last=False)
+
+        return ex
+
+    def stats(self):
+        '''Returns a dict with the number of ``live`` and ``kept`` (finished)
+        orders, the ``executions`` waiting for a commission report, the
+        ``reported`` execIds remembered, the counters (``finished``,
+        ``evicted``, ``archived``, ``duplicated``, ``foreign``, ``expired``,
+        ``unmatched``) and the approximate ``bytes`` of the containers'''
+        with self._lock:
+            stats = dict.fromkeys(('finished', 'evicted', 'archived',
+                                   'duplicated', 'foreign', 'expired',
+                                   'unmatched'), 0)
+            stats.update(self.counters)
+            stats['live'] = len(self.live)
+            stats['kept'] = len(self.done)
+            stats['executions'] = len(self.executions)
+            stats['reported'] = len(self.reported)
+            stats['bytes'] = sum(sys.getsizeof(c) for c in (
+                self.live, self.done, self.executions, self.reported))
+
+        return stats
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
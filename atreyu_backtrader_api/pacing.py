@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Pacing aware scheduler for the requests sent by the store to TWS
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import threading
+import time
+
+from backtrader.metabase import MetaParams
+from backtrader.utils.py3 import with_metaclass
+
+from atreyu_backtrader_api.histogram import LatencyHistogram
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Priority lanes (lower value is served first)
+LIVE, BACKFILL, RESEARCH = range(3)
+LANES = ('live', 'backfill', 'research')
+
+
+class TokenBucket(object):
+    '''Holds ``capacity`` tokens. Each token spent comes back ``period``
+    seconds later, which means that no more than ``capacity`` tokens can be
+    spent in any window of ``period`` seconds (which is how IB counts for its
+    pacing limits), unlike a bucket refilled at a constant rate which allows
+    bursts over the limit'''
+    __slots__ = ('capacity', 'period', 'spent')
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.spent = collections.deque()
+
+    def wait(self, now):
+        '''Seconds until a token is available (0.0 if one is)'''
+        spent = self.spent
+        while spent and now - spent[0] >= self.period:
+            spent.popleft()
+
+        if len(spent) < self.capacity:
+            return 0.0
+
+        return self.period - (now - spent[0])
+
+    def take(self, now):
+        self.spent.append(now)
+
+    def available(self, now):
+        self.wait(now)  # expire tokens
+        return self.capacity - len(self.spent)
+
+
+class PacedRequest(object):
+    '''A request waiting in (or sent by) the scheduler'''
+    __slots__ = ('kind', 'priority', 'tickerId', 'fn', 'args', 'key', 'group',
+                 'submitted', 'notbefore', 'retries')
+
+    def __init__(self, kind, priority, tickerId, fn, args, key, group):
+        self.kind = kind
+        self.priority = priority
+        self.tickerId = tickerId
+        self.fn = fn
+        self.args = args
+        self.key = key  # identity of the request (identical requests)
+        self.group = group  # contract/tick type for per contract pacing
+        self.submitted = time.monotonic()
+        self.notbefore = 0.0
+        self.retries = 0
+
+
+class RequestScheduler(with_metaclass(MetaParams, object)):
+    '''Sends the requests to TWS respecting the IB pacing limits
+
+    Requests are queued in priority lanes (``LIVE``, ``BACKFILL``,
+    ``RESEARCH``) and a background thread sends the first one (lanes in
+    priority order, FIFO inside a lane) which is allowed by the limits of its
+    kind:
+
+      - all kinds: ``msglimit`` messages per period
+      - ``hist`` (historical bars and ticks): ``histlimit`` requests per
+        period, ``contractlimit`` requests per period for the same contract
+        and tick type and no identical request in ``identical`` seconds
+
+    Requests which are identical to one still waiting for the same tickerId
+    are discarded (``deduped``).
+
+    A request cancelled by TWS with a pacing violation can be put back with
+    ``retry``: it is sent again after a backoff (doubling on each attempt) and
+    all ``hist`` requests are held during that time
+
+    Params:
+
+      - ``msglimit`` (default: ``(50, 1.0)``)
+      - ``histlimit`` (default: ``(60, 600.0)``)
+      - ``contractlimit`` (default: ``(5, 2.0)``)
+      - ``identical`` (default: ``15.0``)
+      - ``backoff`` (default: ``5.0``): seconds for the 1st retry
+      - ``maxbackoff`` (default: ``300.0``)
+      - ``retries`` (default: ``5``): attempts before giving up
+    '''
+    params = (
+        ('msglimit', (50, 1.0)),
+        ('histlimit', (60, 600.0)),
+        ('contractlimit', (5, 2.0)),
+        ('identical', 15.0),
+        ('backoff', 5.0),
+        ('maxbackoff', 300.0),
+        ('retries', 5),
+    )
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._lanes = [collections.deque() for _ in LANES]
+        self._msgbucket = TokenBucket(*self.p.msglimit)
+        self._histbucket = TokenBucket(*self.p.histlimit)
+        self._groupbuckets = dict()  # group -> TokenBucket
+        self._lastsent = dict()  # key -> time of last identical request
+        self._histhold = 0.0  # no hist request before this time
+        self._inflight = dict()  # tickerId -> request (answer pending)
+        self._stopped = False
+
+        self.waits = [LatencyHistogram() for _ in LANES]
+        self.counters = collections.Counter()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, kind, priority, tickerId, fn, args, key=None, group=None):
+        '''Queues the call ``fn(*args)`` for request ``tickerId``'''
+        req = PacedRequest(kind, priority, tickerId, fn, args, key, group)
+        with self._cond:
+            self.counters['submitted'] += 1
+            lane = self._lanes[priority]
+            for other in lane:
+                if other.tickerId == tickerId and other.key == key:
+                    self.counters['deduped'] += 1
+                    return
+
+            lane.append(req)
+            self._cond.notify()
+
+    def cancel(self, tickerId):
+        '''Removes the requests of tickerId not yet sent. Returns ``True`` if
+        any was removed (nothing has to be cancelled in TWS)'''
+        with self._cond:
+            removed = False
+            for lane in self._lanes:
+                for req in [r for r in lane if r.tickerId == tickerId]:
+                    lane.remove(req)
+                    removed = True
+
+            self._inflight.pop(tickerId, None)
+
+        return removed
+
+    def done(self, tickerId):
+        '''The answer to the request of tickerId is complete'''
+        with self._cond:
+            self._inflight.pop(tickerId, None)
+
+    def retry(self, tickerId):
+        '''Schedules again the request of tickerId after a pacing violation.
+        Returns ``False`` if the request is unknown or out of retries'''
+        with self._cond:
+            self.counters['violations'] += 1
+            req = self._inflight.pop(tickerId, None)
+            if req is None or req.retries >= self.p.retries:
+                self.counters['failed'] += 1
+                return False
+
+            backoff = min(self.p.backoff * (2 ** req.retries), self.p.maxbackoff)
+            logger.warning(f'Pacing violation for {tickerId}: retry '
+                           f'{req.retries + 1} in {backoff} seconds')
+            now = time.monotonic()
+            req.retries += 1
+            req.notbefore = now + backoff
+            if req.kind == 'hist':
+                self._histhold = max(self._histhold, req.notbefore)
+
+            self.counters['retried'] += 1
+            self._lanes[req.priority].appendleft(req)
+            self._cond.notify()
+            return True
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _wait(self, req, now):
+        # Seconds until req can be sent
+        wait = max(self._msgbucket.wait(now), req.notbefore - now)
+        if req.kind == 'hist':
+            wait = max(wait, self._histbucket.wait(now), self._histhold - now)
+            bucket = self._groupbuckets.get(req.group)
+            if bucket is not None:
+                wait = max(wait, bucket.wait(now))
+            last = self._lastsent.get(req.key)
+            if last is not None:
+                wait = max(wait, last + self.p.identical - now)
+
+        return max(wait, 0.0)
+
+    def _next(self, now):
+        # Returns the request to send and/or the time to wait for one
+        minwait = None
+        for lane in self._lanes:
+            for req in lane:
+                wait = self._wait(req, now)
+                if not wait:
+                    lane.remove(req)
+                    return req, 0.0
+
+                if minwait is None or wait < minwait:
+                    minwait = wait
+
+        return None, minwait
+
+    def _take(self, req, now):
+        self._msgbucket.take(now)
+        if req.kind == 'hist':
+            self._histbucket.take(now)
+            bucket = self._groupbuckets.get(req.group)
+            if bucket is None:
+                bucket = TokenBucket(*self.p.contractlimit)
+                self._groupbuckets[req.group] = bucket
+            bucket.take(now)
+
+            if len(self._lastsent) > 4096:  # forget the expired ones
+                self._lastsent = {k: t for k, t in self._lastsent.items()
+                                  if now - t < self.p.identical}
+            self._lastsent[req.key] = now
+
+        if req.kind != 'live':  # an answer is expected and can fail
+            self._inflight[req.tickerId] = req
+
+        self.waits[req.priority].record(int((now - req.submitted) * 1e9))
+        self.counters['sent'] += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+
+                    now = time.monotonic()
+                    req, wait = self._next(now)
+                    if req is not None:
+                        break
+
+                    self._cond.wait(wait)
+
+                self._take(req, now)
+
+            try:
+                req.fn(*req.args)
+            except Exception as e:
+                logger.exception(f'Sending request {req.tickerId}: {e}')
+
+    def stats(self):
+        '''Returns a dict with the depth and wait time (ns: mean, p50, p99,
+        max) of each lane, the counters (``submitted``, ``sent``,
+        ``deduped``, ``violations``, ``retried``, ``failed``), the requests
+        waiting for an answer and the historical requests still available in
+        the current window'''
+        with self._cond:
+            now = time.monotonic()
+            stats = dict.fromkeys(('submitted', 'sent', 'deduped',
+                                   'violations', 'retried', 'failed'), 0)
+            stats.update(self.counters)
+            stats['lanes'] = {
+                name: dict(depth=len(lane), wait=hist.report())
+                for name, lane, hist in zip(LANES, self._lanes, self.waits)
+            }
+            stats['inflight'] = len(self._inflight)
+            stats['histavailable'] = self._histbucket.available(now)
+            stats['histhold'] = max(0.0, self._histhold - now)
+
+        return stats
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Depth, rates and age of the messages pending in the data queues of the
+# store, sampled periodically, with thresholds to detect lagging datas
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+
+from atreyu_backtrader_api.aio import AsyncQueue
+from atreyu_backtrader_api.ringbuffer import RingQueue
+
+
+def queue_counts(q):
+    '''Returns (depth, enqueued, dequeued) of a data queue. The counters are
+    those the queues already keep: nothing is added to ``put``/``get``. For
+    a shared subscription (``queues``) those of the deepest consumer
+
+    Returns ``None`` for the stand-ins which keep no counters (the sinks of
+    the segments of a historical request)'''
+    queues = getattr(q, 'queues', None)
+    if queues is not None:
+        counts = [c for c in map(queue_counts, queues) if c is not None]
+        return max(counts, default=(0, 0, 0))
+
+    if not isinstance(q, (RingQueue, AsyncQueue)) and \
+       not hasattr(q, 'unfinished_tasks'):
+        return None
+
+    depth = q.qsize()
+    if isinstance(q, RingQueue):
+        enqueued = q._tail + q.controls
+    elif isinstance(q, AsyncQueue):
+        enqueued = q.msgs
+    else:  # queue.Queue (task_done is never called)
+        enqueued = q.unfinished_tasks
+
+    # merged/discarded messages are neither pending nor taken by the consumer
+    lost = getattr(q, 'coalesced', 0) + getattr(q, 'dropped', 0)
+    return depth, enqueued, enqueued - depth - lost
+
+
+class QueueState(object):
+    '''Sampled state of the queue of a tickerId'''
+    __slots__ = ('hwm', 'depth', 'enqueued', 'dequeued', 'inrate', 'outrate',
+                 'age', 'lagging', 'tlast', 'marks')
+
+    MAXMARKS = 4096
+
+    def __init__(self):
+        self.hwm = self.depth = self.enqueued = self.dequeued = 0
+        self.inrate = self.outrate = self.age = 0.0
+        self.lagging = False
+        self.tlast = None
+        # (time, enqueued) of the samples since the oldest pending message
+        # was put: the first one is when it was already in the queue
+        self.marks = collections.deque()
+
+    def update(self, now, depth, enqueued, dequeued):
+        if self.tlast is not None and now > self.tlast:
+            elapsed = now - self.tlast
+            self.inrate = (enqueued - self.enqueued) / elapsed
+            self.outrate = (dequeued - self.dequeued) / elapsed
+
+        self.tlast = now
+        self.depth, self.enqueued, self.dequeued = depth, enqueued, dequeued
+        if depth > self.hwm:
+            self.hwm = depth
+
+        marks = self.marks
+        if not depth:
+            marks.clear()
+            self.age = 0.0
+            return
+
+        if not marks or marks[-1][1] != enqueued:
+            if len(marks) >= self.MAXMARKS:
+                marks.popleft()  # age will be underestimated
+            marks.append((now, enqueued))
+
+        # Samples at which the oldest pending message had not been put yet
+        while len(marks) > 1 and marks[1][1] <= dequeued:
+            marks.popleft()
+
+        self.age = now - marks[0][0]
+
+    def report(self):
+        return dict(hwm=self.hwm, inrate=self.inrate, outrate=self.outrate,
+                    age=self.age, lagging=self.lagging)
+
+
+class QueueMonitor(object):
+    '''Samples (``sample``) the depth and counters of the data queues and
+    keeps per tickerId: the high-water mark of the depth, the rates at which
+    messages are put and taken, and the age of the oldest pending message
+    (with the resolution of the sampling interval)
+
+    A queue is lagging if its depth reaches ``maxdepth`` or its oldest
+    message is ``maxage`` seconds old (``0`` disables each check)
+    '''
+    def __init__(self, maxdepth=0, maxage=0.0):
+        self.maxdepth = maxdepth
+        self.maxage = maxage
+        self.states = dict()  # tickerId -> QueueState
+
+    def sample(self, qs, now):
+        '''Samples the queues in ``qs`` (iterable of tickerId, queue) at
+        ``now`` (seconds). Returns a list of (tickerId, QueueState) which
+        started or stopped lagging'''
+        states, changed = dict(), list()
+        for tickerId, q in qs:
+            counts = queue_counts(q)
+            if counts is None:
+                continue
+
+            state = self.states.get(tickerId)
+            if state is None:
+                state = QueueState()
+            states[tickerId] = state
+
+            state.update(now, *counts)
+            lagging = bool(
+                (self.maxdepth and state.depth >= self.maxdepth) or
+                (self.maxage and state.age >= self.maxage))
+            if lagging != state.lagging:
+                state.lagging = lagging
+                changed.append((tickerId, state))
+
+        self.states = states  # forget cancelled requests
+        return changed
+
+    def stats(self, tickerId):
+        '''Returns a dict with the sampled figures of tickerId (empty if not
+        yet sampled)'''
+        state = self.states.get(tickerId)
+        if state is None:
+            return dict()
+
+        return state.report()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Single producer/single consumer ring buffer for the data queues of the store
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import threading
+import time
+
+from backtrader.utils.py3 import queue
+
+
+class RingQueue(object):
+    '''Bounded, preallocated queue for one producer and one consumer thread
+
+    Offers the subset of the ``queue.Queue`` interface used by the store and
+    the data feeds (``put``, ``get``, ``get_nowait``, ``qsize``, ``empty``)
+    plus ``drain`` to fetch everything pending in one call.
+
+    The producer (the TWS API thread) and the consumer (the data feed) each
+    own one index (``_tail`` and ``_head`` respectively) and only read the
+    other one, so no lock is taken to move items. The GIL makes the slot
+    store visible before the index update. An ``Event`` is only signaled when
+    the other side is actually waiting (empty queue for the consumer, full
+    queue for the producer)
+
+    The size is rounded up to a power of two. If the queue is full, ``put``
+    blocks (as a bounded ``queue.Queue`` would) until the consumer frees a
+    slot or ``timeout`` expires (``queue.Full`` is then raised)
+
+    Other threads (the store ending or notifying the datas) must not use
+    ``put``: ``put_control`` keeps their items apart, tagged with the
+    position of the producer at that moment, and the consumer delivers them
+    in that place of the sequence
+    '''
+
+    def __init__(self, maxsize=4096):
+        size = 1
+        while size < maxsize:
+            size <<= 1
+
+        self.maxsize = size
+        self._mask = size - 1
+        self._buf = [None] * size
+        self._head = 0  # next slot to read (consumer)
+        self._tail = 0  # next slot to write (producer)
+
+        self._getwait = False
+        self._notempty = threading.Event()
+        self._putwait = False
+        self._notfull = threading.Event()
+
+        self._ctrl = collections.deque()  # (position, item) from other threads
+        self._ctrllock = threading.Lock()
+        self.controls = 0
+
+    def qsize(self):
+        return self._tail - self._head + len(self._ctrl)
+
+    def empty(self):
+        return self._tail == self._head and not self._ctrl
+
+    def full(self):
+        return self._tail - self._head >= self.maxsize
+
+    def put(self, item, block=True, timeout=None):
+        tail = self._tail
+        if tail - self._head >= self.maxsize:
+            self._waitnotfull(block, timeout)
+
+        self._buf[tail & self._mask] = item
+        self._tail = tail + 1
+        if self._getwait:
+            self._getwait = False
+            self._notempty.set()
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def put_control(self, item):
+        '''Puts ``item`` from a thread which is not the producer. It is
+        delivered after the items already put by the producer and never
+        blocks'''
+        with self._ctrllock:  # positions in order if several threads
+            self._ctrl.append((self._tail, item))
+            self.controls += 1
+
+        self._notempty.set()  # wake up the consumer if waiting
+
+    def _waitnotfull(self, block, timeout):
+        if not block:
+            raise queue.Full
+
+        endtime = None if timeout is None else time.monotonic() + timeout
+        while self._tail - self._head >= self.maxsize:
+            self._notfull.clear()
+            self._putwait = True
+            if self._tail - self._head < self.maxsize:  # freed meanwhile
+                break
+
+            remaining = None
+            if endtime is not None:
+                remaining = endtime - time.monotonic()
+                if remaining <= 0.0:
+                    self._putwait = False
+                    raise queue.Full
+
+            self._notfull.wait(remaining)
+
+        self._putwait = False
+
+    def _waitnotempty(self, block, timeout):
+        if not block:
+            raise queue.Empty
+
+        endtime = None if timeout is None else time.monotonic() + timeout
+        while self._tail == self._head and not self._ctrl:
+            self._notempty.clear()
+            self._getwait = True
+            if self._tail != self._head or self._ctrl:  # produced meanwhile
+                break
+
+            remaining = None
+            if endtime is not None:
+                remaining = endtime - time.monotonic()
+                if remaining <= 0.0:
+                    self._getwait = False
+                    raise queue.Empty
+
+            self._notempty.wait(remaining)
+
+        self._getwait = False
+
+    def get(self, block=True, timeout=None):
+        head = self._head
+        ctrl = self._ctrl
+        if ctrl and ctrl[0][0] <= head:
+            return ctrl.popleft()[1]
+
+        if head == self._tail:
+            self._waitnotempty(block, timeout)
+            if ctrl and ctrl[0][0] <= head:
+                return ctrl.popleft()[1]
+
+        idx = head & self._mask
+        item = self._buf[idx]
+        self._buf[idx] = None  # release the reference
+        self._head = head + 1
+        if self._putwait:
+            self._putwait = False
+            self._notfull.set()
+
+        return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def drain(self, maxitems=None, block=False, timeout=None):
+        '''Returns a list with the pending items (at most ``maxitems``)
+
+        If ``block`` is ``True`` it waits (up to ``timeout``) for at least one
+        item to be available and raises ``queue.Empty`` otherwise
+        '''
+        head, tail = self._head, self._tail
+        ctrl = self._ctrl
+        if head == tail and not ctrl:
+            if not block:
+                return []
+            self._waitnotempty(block, timeout)
+            tail = self._tail
+
+        buf, mask = self._buf, self._mask
+        items = list()
+        while maxitems is None or len(items) < maxitems:
+            if ctrl and ctrl[0][0] <= head:
+                items.append(ctrl.popleft()[1])
+                continue
+
+            if head == tail:
+                break
+
+            stop = tail
+            if ctrl and ctrl[0][0] < stop:
+                stop = ctrl[0][0]  # deliver the control item in its place
+            if maxitems is not None:
+                stop = min(stop, head + maxitems - len(items))
+
+            for i in range(head, stop):
+                idx = i & mask
+                items.append(buf[idx])
+                buf[idx] = None
+
+            head = stop
+
+        self._head = head
+        if self._putwait:
+            self._putwait = False
+            self._notfull.set()
+
+        return items
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+###############################################################################
+#
+# Aggregation of the live ticks of a request into OHLCV bars in the store,
+# to deliver bars instead of ticks to the data feed
+#
+###############################################################################
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+
+
+class TickBars(object):
+    '''Builds bars of ``barsize`` seconds (aligned to multiples of it, epoch
+    time) from the ticks (time, price, size) of request ``tickerId``. The bars
+    are delivered as ``msgcls`` messages (``RTBar``), labelled with their
+    start time as the bars of TWS
+
+    ``tick`` returns the completed bar when a tick of a later bar arrives.
+    ``flush`` returns it once the (server) time is past its end, for the last
+    bar before a quiet period. Ticks of an already delivered bar are counted
+    in ``late`` and discarded
+
+    If ``partial`` is greater than ``0``, the bar in progress is also
+    returned by ``tick``, at most every ``partial`` seconds (for
+    ``cerebro.replaydata``)
+
+    ``tick`` and ``flush`` are called from different threads (the API one and
+    a timer) and take no lock: the caller holds ``lock`` around them and the
+    delivery of the returned bar, so that the bars reach the (single
+    producer) queue one at a time and in order
+    '''
+    def __init__(self, tickerId, barsize, msgcls, partial=0.0):
+        self.tickerId = tickerId
+        self.barsize = barsize
+        self.msgcls = msgcls
+        self.partial = partial
+        self.lock = threading.Lock()  # ticks (API) vs flush (timer)
+
+        self.start = None  # start of the bar in progress (epoch seconds)
+        self.end = None
+        self.tpartial = 0.0  # time at which the last partial was delivered
+        self.ticks = self.bars = self.late = 0
+
+    def _bar(self):
+        wap = self.pv / self.volume if self.volume else self.close
+        return self.msgcls(self.tickerId, self.start, self.open, self.high, self.low,
+                           self.close, self.volume, wap, self.count)
+
+    def _open(self, start, price, size):
+        self.start, self.end = start, start + self.barsize
+        self.open = self.high = self.low = self.close = price
+        self.volume = size
+        self.pv = price * size
+        self.count = 1
+
+    def tick(self, t, price, size=0.0):
+        '''Adds a tick at time ``t`` (epoch seconds). Returns the bar to be
+        delivered (if any)'''
+        self.ticks += 1
+        end = self.end
+        if end is not None and self.start <= t < end:
+            if price > self.high:
+                self.high = price
+            elif price < self.low:
+                self.low = price
+            self.close = price
+            if size:
+                self.volume += size
+                self.pv += price * size
+            self.count += 1
+
+            if self.partial and t - self.tpartial >= self.partial:
+                self.tpartial = t
+                return self._bar()
+            return None
+
+        if self.start is not None and t < self.start:
+            self.late += 1
+            return None
+
+        bar = None
+        if end is not None:
+            bar = self._bar()
+            self.bars += 1
+
+        self._open(t - t % self.barsize, price, size)
+        self.tpartial = t
+        return bar
+
+    def flush(self, now):
+        '''Returns the bar in progress if it ended before ``now`` (epoch
+        seconds, server time)'''
+        if self.end is None or now < self.end:
+            return None
+
+        bar = self._bar()
+        self.bars += 1
+        # keep start/end for late ticks: the next tick opens a new bar
+        self.start, self.end = self.end, None
+        return bar
+
+    def stats(self):
+        return dict(barsize=self.barsize, ticks=self.ticks, bars=self.bars,
+                    late=self.late)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Market data throughput of the store with all the subscriptions over the main
+connection and spread over a pool of data connections (``dataconns``),
+against the simulated gateway
+
+    python benchmarks/connection_pool.py --symbols 500 --rate 50 --pool 4
+
+Reported for each setup: messages per second taken out of the data queues,
+ticks per second written and dropped by the gateway (the client did not read
+fast enough), messages pending in the IBApi reader queues and the
+subscriptions per connection. Each setup runs in its own process (the store
+is a singleton)
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import multiprocessing
+import os.path
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backtrader.utils.py3 import queue  # noqa: E402
+
+from atreyu_backtrader_api import IBStore  # noqa: E402
+from atreyu_backtrader_api.ibsimulator import (  # noqa: E402
+    IBGatewaySimulator, Scenario)
+
+
+def consume(qs, counter, stop):
+    # A single consumer draining all queues (the cerebro thread)
+    while not stop.is_set():
+        idle = True
+        for q in qs:
+            try:
+                while True:
+                    q.get_nowait()
+                    counter[0] += 1
+                    idle = False
+            except queue.Empty:
+                pass
+        if idle:
+            time.sleep(0.001)
+
+
+def run_one(port, nsymbols, dataconns, duration, warmup):
+    store = IBStore(port=port, clientId=1, dataconns=dataconns)
+    store._event_managed_accounts.wait(5.0)
+
+    qs = list()
+    for i in range(nsymbols):
+        contract = store.makecontract(f'SYM{i:04d}', 'STK', 'SMART', 'USD')
+        qs.append(store.reqMktData(contract))
+
+    stop = threading.Event()
+    counter = [0]
+    t = threading.Thread(target=consume, args=(qs, counter, stop),
+                         daemon=True)
+    t.start()
+
+    time.sleep(warmup)
+    c0, t0 = counter[0], time.monotonic()
+    time.sleep(duration)
+    received = (counter[0] - c0) / (time.monotonic() - t0)
+
+    conns = [store.conn]
+    if store.pool is not None:
+        conns = store.pool.conns
+    backlog = sum(conn.msg_queue.qsize() for conn in conns)
+    shards = [s['active'] for s in store.get_pool_stats().values()]
+
+    stop.set()
+    store.stop()
+    return received, backlog, shards or [nsymbols]
+
+
+def run(nsymbols, rate, duration, pool, warmup=2.0):
+    scenario = Scenario(rate=rate)
+    sim = IBGatewaySimulator(port=0, scenario=scenario).start()
+
+    print(f'{nsymbols} symbols x {rate:.0f} ticks/s '
+          f'(offered {nsymbols * rate:.0f} ticks/s)')
+    print(f'{"setup":12} {"received/s":>10} {"sent/s":>8} {"dropped/s":>9} '
+          f'{"reader":>7}  subscriptions per connection')
+    for name, dataconns in (('single', 0), (f'pool {pool}', pool)):
+        with multiprocessing.Pool(1) as mpool:
+            res = mpool.apply_async(
+                run_one, (sim.port, nsymbols, dataconns, duration, warmup))
+            time.sleep(warmup)  # the gateway figures over the same period
+            sim.stats.reset()
+            received, backlog, shards = res.get()
+            r = sim.stats.report()
+
+        print(f'{name:12} {received:10.0f} {r["ticks_s"]:8.0f} '
+              f'{r["dropped"] / r["elapsed"]:9.0f} {backlog:7}  {shards}')
+        time.sleep(1.0)  # let the gateway see the disconnections
+
+    sim.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--symbols', default=500, type=int)
+    parser.add_argument('--rate', default=50.0, type=float,
+                        help='ticks per second per symbol')
+    parser.add_argument('--duration', default=10, type=int)
+    parser.add_argument('--pool', default=4, type=int,
+                        help='data connections of the pool')
+    args = parser.parse_args()
+    run(args.symbols, args.rate, args.duration, args.pool)
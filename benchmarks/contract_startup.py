@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Startup time of resolving the contracts of many instruments, as the data
+feeds do in ``start``, with and without the contract details registry
+
+    python benchmarks/contract_startup.py --symbols 500 --latency 0.01
+
+The gateway answers each contract details request after ``--latency``
+seconds. Each instrument is resolved ``--feeds`` times (several feeds or
+timeframes of the same instrument). Runs:
+
+  - nocache: every resolution is a round trip to the gateway
+  - cold: empty registry (1st start of the day)
+  - warm: the registry already holds the answers (feeds restarted)
+  - disk: new registry loaded from the SQLite file (new process)
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import os
+import os.path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from atreyu_backtrader_api import IBStore  # noqa: E402
+from atreyu_backtrader_api.contractcache import ContractRegistry  # noqa: E402
+from atreyu_backtrader_api.ibsimulator import (  # noqa: E402
+    IBGatewaySimulator, Scenario)
+
+
+def resolve(store, symbols, feeds):
+    t0 = time.monotonic()
+    contracts = list()
+    for _ in range(feeds):
+        for symbol in symbols:
+            precontract = store.makecontract(symbol, 'STK', 'SMART', 'USD')
+            cds = store.getContractDetails(precontract, maxcount=1)
+            contracts.append(cds[0].contract)
+
+    return time.monotonic() - t0, contracts
+
+
+def run(nsymbols, latency, feeds):
+    symbols = [f'SYM{i:04d}' for i in range(nsymbols)]
+    sim = IBGatewaySimulator(
+        port=0, scenario=Scenario(rate=1.0, cdlatency=latency)).start()
+
+    path = os.path.join(tempfile.mkdtemp(), 'contracts.db')
+    store = IBStore(port=sim.port, clientId=1)
+    store._event_managed_accounts.wait(5.0)
+
+    print(f'{nsymbols} instruments x {feeds} feeds, {latency}s per request')
+    print(f'{"run":8} {"wall s":>7} {"requests":>8} {"hits":>6} '
+          f'{"misses":>6} {"objects":>7}')
+    runs = [
+        ('nocache', lambda: None),
+        ('cold', lambda: ContractRegistry(path)),
+        ('warm', lambda: store.contractcache),
+        ('disk', lambda: ContractRegistry(path)),
+    ]
+    for name, mkregistry in runs:
+        store.contractcache = mkregistry()  # the store is a singleton
+        nreqs = sim.stats.requests['reqContractDetails']
+        elapsed, contracts = resolve(store, symbols, feeds)
+        nreqs = sim.stats.requests['reqContractDetails'] - nreqs
+        stats = store.get_contractcache_stats()
+        print(f'{name:8} {elapsed:7.2f} {nreqs:>8} '
+              f'{stats.get("hits", 0):>6} {stats.get("misses", 0):>6} '
+              f'{len(set(map(id, contracts))):>7}')
+
+    store.contractcache.close()
+    store.stop()
+    sim.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--symbols', default=500, type=int)
+    parser.add_argument('--latency', default=0.01, type=float,
+                        help='seconds before the gateway answers a request')
+    parser.add_argument('--feeds', default=2, type=int,
+                        help='resolutions of each instrument per run')
+    args = parser.parse_args()
+    run(args.symbols, args.latency, args.feeds)
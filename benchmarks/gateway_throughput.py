@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Drives the real IBStore/IBApi client against the simulated gateway and reports
+the sustained tick throughput of the store together with drop/backlog figures
+
+    python benchmarks/gateway_throughput.py --symbols 500 --rate 50
+
+    python benchmarks/gateway_throughput.py \
+        --scenario benchmarks/scenarios/open_outage.json
+
+Figures reported:
+
+  - gateway: messages/ticks per second written to the socket, ticks dropped
+    because the client did not read fast enough and bytes pending in the
+    socket
+  - client: messages per second taken out of the data queues, messages
+    pending in the IBApi reader queue (not yet decoded) and in the data queues
+    (decoded but not yet consumed)
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import os.path
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backtrader.utils.py3 import queue  # noqa: E402
+
+from atreyu_backtrader_api import IBStore  # noqa: E402
+from atreyu_backtrader_api.ibsimulator import (  # noqa: E402
+    IBGatewaySimulator, Scenario)
+
+
+def consume(q, counter, stop):
+    # A consumer per queue, like a data feed in the cerebro thread
+    while not stop.is_set():
+        try:
+            msg = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if msg is None:
+            break
+        counter[0] += 1
+
+
+def run(nsymbols, rate, duration, mix, scenariofile=None, ringbuffer=0):
+    kwargs = dict()
+    if rate is not None:
+        kwargs['rate'] = rate
+    if mix is not None:
+        kwargs['mix'] = tuple(mix.split(','))
+    if scenariofile:
+        scenario = Scenario.fromfile(scenariofile, **kwargs)
+    else:
+        scenario = Scenario(**kwargs)
+
+    sim = IBGatewaySimulator(port=0, scenario=scenario).start()
+
+    store = IBStore(port=sim.port, clientId=1, ringbuffer=ringbuffer)
+    store._event_managed_accounts.wait(5.0)
+
+    qs = list()
+    for i in range(nsymbols):
+        contract = store.makecontract(f'SYM{i:04d}', 'STK', 'SMART', 'USD')
+        qs.append(store.reqMktData(contract))
+
+    stop = threading.Event()
+    counters = list()
+    for q in qs:
+        counter = [0]
+        counters.append(counter)
+        t = threading.Thread(target=consume, args=(q, counter, stop),
+                             daemon=True)
+        t.start()
+
+    sim.stats.reset()
+    tstart = time.monotonic()
+    for _ in range(int(duration)):
+        time.sleep(1.0)
+        elapsed = time.monotonic() - tstart
+        received = sum(c[0] for c in counters)
+        decodeq = store.conn.msg_queue.qsize()
+        dataq = sum(q.qsize() for q in qs)
+        print(f'{elapsed:5.1f}s gateway [{sim.stats}]')
+        print(f'{"":6} client received: {received} '
+              f'({received / elapsed:.0f}/s) backlog reader: {decodeq} '
+              f'queues: {dataq}')
+
+    stop.set()
+    sim.stop()
+    store.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--symbols', default=500, type=int)
+    parser.add_argument('--rate', default=None, type=float,
+                        help='ticks per second per symbol (default: 50)')
+    parser.add_argument('--duration', default=10, type=int)
+    parser.add_argument('--mix', default=None,
+                        help='comma separated: rtvolume,last,bidask '
+                             '(default: rtvolume)')
+    parser.add_argument('--scenario', default=None,
+                        help='JSON file with the scenario params')
+    parser.add_argument('--ringbuffer', default=0, type=int,
+                        help='use RingQueue of this size for the data queues')
+    args = parser.parse_args()
+    run(args.symbols, args.rate, args.duration, args.mix, args.scenario,
+        args.ringbuffer)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Cost per bar of converting the dates of historical bars to a naive UTC
+datetime and a date2num value, before (parse/localize each bar in the store
+and date2num in the data feed) and after (HistDateConverter)
+
+    python benchmarks/histdate_conversion.py --years 10 --symbols 100
+
+The "before" conversion is an inline copy of the former implementation so
+that both variants are measured in the same interpreter. The results of both
+are checked to be identical
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+from datetime import datetime, time as dtime, timedelta
+import os.path
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backtrader import date2num  # noqa: E402
+from backtrader.utils import UTC  # noqa: E402
+
+from atreyu_backtrader_api.histdates import HistDateConverter  # noqa: E402
+
+
+def old_histdate(dtstr, daily, sessionend, tz):
+    if daily:
+        dt = datetime.strptime(dtstr, '%Y%m%d')
+        dteos = datetime.combine(dt, sessionend)
+        if tz:
+            dteostz = tz.localize(dteos)
+            dteosutc = dteostz.astimezone(UTC).replace(tzinfo=None)
+        else:
+            dteosutc = dteos
+
+        if dteosutc <= datetime.utcnow():
+            dt = dteosutc
+
+        return dt
+
+    return datetime.utcfromtimestamp(int(dtstr))
+
+
+def old(dtstrs, daily, sessionend, tz):
+    out = list()
+    for dtstr in dtstrs:
+        dt = old_histdate(dtstr, daily, sessionend, tz)
+        out.append((dt, date2num(dt)))  # date2num was done by the data feed
+    return out
+
+
+def new(dtstrs, daily, sessionend, tz, conv):
+    return [conv.convert(dtstr, daily, sessionend, tz) for dtstr in dtstrs]
+
+
+def batch(dtstrs, daily, sessionend, tz, conv):
+    dts, nums = conv.convert_many(dtstrs, daily, sessionend, tz)
+    return list(zip(dts, nums))
+
+
+def measure(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - t0, result
+
+
+def run(years, symbols, tzname):
+    try:
+        import pytz
+        tz = pytz.timezone(tzname)
+    except ImportError:
+        print('pytz not available: daily bars without timezone')
+        tz = None
+
+    sessionend = dtime(16, 0)
+    today = datetime.utcnow().date()
+    days = [(today - timedelta(days=i)).strftime('%Y%m%d')
+            for i in range(int(years * 365), 0, -1)]
+    daily = days * symbols  # the same calendar for all symbols
+
+    t1 = int(time.time()) // 60 * 60
+    minutes = [str(t) for t in range(t1 - 86400 * 20, t1, 60)]
+
+    print(f'{"bars":24} {"count":>9} {"before ns":>10} {"after ns":>9} '
+          f'{"batch ns":>9} identical')
+    cases = ((f'daily {years}y x {symbols}', daily, True),
+             ('1 min, 20 days', minutes, False))
+    for name, dtstrs, isdaily in cases:
+        conv = HistDateConverter()
+        told, rold = measure(old, dtstrs, isdaily, sessionend, tz)
+        tnew, rnew = measure(new, dtstrs, isdaily, sessionend, tz, conv)
+        tbat, rbat = measure(batch, dtstrs, isdaily, sessionend, tz, conv)
+        n = len(dtstrs)
+        print(f'{name:24} {n:>9} {told / n * 1e9:10.0f} '
+              f'{tnew / n * 1e9:9.0f} {tbat / n * 1e9:9.0f} '
+              f'{rold == rnew == rbat}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--years', default=10, type=int)
+    parser.add_argument('--symbols', default=100, type=int)
+    parser.add_argument('--tz', default='US/Eastern')
+    args = parser.parse_args()
+    run(args.years, args.symbols, args.tz)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Time to preload historical 1 minute bars of many symbols into Cerebro
+(preload=True, runonce=True) with the bars loaded one by one and with the
+columnar (NumPy) bulk path of IBData, against the simulated gateway
+
+    python benchmarks/historical_preload.py --symbols 50 --days 365
+
+Reported for each path: wall time of ``cerebro.run`` (download + preload +
+a runonce SMA), the bars loaded, the CPU time of the cerebro thread and the
+part of it spent in ``preload`` (taking the bars out of the queue and into
+the lines, while the download goes on in the TWS API thread). Each path runs in its own process (the
+store is a singleton) and the lines of both runs are compared
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+from datetime import datetime, timedelta
+import hashlib
+import multiprocessing
+import os.path
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import backtrader as bt  # noqa: E402
+
+from atreyu_backtrader_api import IBData, IBStore  # noqa: E402
+from atreyu_backtrader_api.ibsimulator import (  # noqa: E402
+    IBGatewaySimulator, Scenario)
+
+
+class TimedIBData(IBData):
+    def preload(self):
+        c0 = time.thread_time()
+        super(TimedIBData, self).preload()
+        self.preloadcpu = time.thread_time() - c0
+
+
+class SMA(bt.Strategy):
+    def __init__(self):
+        for d in self.datas:
+            bt.indicators.SMA(d, period=20)
+
+
+def run_one(port, symbols, begindate, enddate, columnar, concurrency):
+    cerebro = bt.Cerebro(preload=True, runonce=True, stdstats=False)
+    for symbol in symbols:
+        data = TimedIBData(dataname=f'{symbol}-STK-SMART-USD', port=port,
+                      clientId=1, histconcurrency=concurrency,
+                      historical=True, timeframe=bt.TimeFrame.Minutes,
+                      compression=1, fromdate=begindate, todate=enddate,
+                      columnar=columnar)
+        cerebro.adddata(data)
+    cerebro.addstrategy(SMA)
+
+    t0 = time.monotonic()
+    c0 = time.thread_time()
+    cerebro.run()
+    cpu = time.thread_time() - c0
+    elapsed = time.monotonic() - t0
+
+    bars = sum(d.buflen() for d in cerebro.datas)
+    preloadcpu = sum(d.preloadcpu for d in cerebro.datas)
+    digest = hashlib.sha1()
+    for d in cerebro.datas:
+        for alias in d.getlinealiases():
+            digest.update(getattr(d.lines, alias).array.tobytes())
+
+    IBStore().stop()
+    return elapsed, cpu, preloadcpu, bars, digest.hexdigest()
+
+
+def run(nsymbols, days, concurrency):
+    symbols = [f'SYM{i:03d}' for i in range(nsymbols)]
+    sim = IBGatewaySimulator(port=0, scenario=Scenario(rate=1.0)).start()
+
+    enddate = datetime.utcnow().replace(hour=0, minute=0, second=0,
+                                        microsecond=0)
+    begindate = enddate - timedelta(days=days)
+
+    print(f'{nsymbols} symbols x {days} days of 1 minute bars')
+    print(f'{"path":10} {"bars":>10} {"wall s":>8} {"cpu s":>8} '
+          f'{"preload s":>9} {"bars/preload s":>14}')
+    digests = set()
+    for name, columnar in (('one-by-one', False), ('columnar', True)):
+        with multiprocessing.Pool(1) as pool:
+            elapsed, cpu, preloadcpu, bars, digest = pool.apply(
+                run_one, (sim.port, symbols, begindate, enddate, columnar,
+                          concurrency))
+        digests.add(digest)
+        print(f'{name:10} {bars:>10} {elapsed:8.2f} {cpu:8.2f} '
+              f'{preloadcpu:9.2f} {bars / preloadcpu:14.0f}')
+
+    print(f'lines identical: {len(digests) == 1}')
+    sim.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--symbols', default=50, type=int)
+    parser.add_argument('--days', default=365, type=int)
+    parser.add_argument('--concurrency', default=6, type=int,
+                        help='concurrent segments per download')
+    args = parser.parse_args()
+    run(args.symbols, args.days, args.concurrency)
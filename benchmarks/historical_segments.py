@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Wall time of a segmented reqHistoricalDataEx download (range larger than the
+maximum duration of the barsize) with the serial chain and with concurrent
+segments, against the simulated gateway
+
+    python benchmarks/historical_segments.py --days 60 --latency 1.0
+
+The gateway answers each historical request after ``--latency`` seconds (the
+round trip to the IB farms dominates a real download). Each run requests the
+same range and checks that the bars are delivered complete and in
+chronological order
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+from datetime import datetime, timedelta
+import os.path
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backtrader import TimeFrame  # noqa: E402
+from backtrader.utils.py3 import queue  # noqa: E402
+
+from atreyu_backtrader_api import IBStore  # noqa: E402
+from atreyu_backtrader_api.ibsimulator import (  # noqa: E402
+    IBGatewaySimulator, Scenario)
+
+
+def download(store, contract, begindate, enddate, timeframe, compression):
+    t0 = time.monotonic()
+    q = store.reqHistoricalDataEx(contract, enddate, begindate,
+                                  timeframe, compression)
+    dates = list()
+    while True:
+        try:
+            msg = q.get(timeout=0.05)
+        except queue.Empty:
+            if not store.validQueue(q):
+                break  # request over and everything consumed
+            continue
+
+        if msg is None or isinstance(msg, int):
+            print(f'download interrupted with: {msg}')
+            break
+        dates.append(msg.date)
+
+    return time.monotonic() - t0, dates
+
+
+def run(days, latency, concurrency, compression):
+    sim = IBGatewaySimulator(
+        port=0, scenario=Scenario(rate=1.0, histlatency=latency)).start()
+    store = IBStore(port=sim.port, clientId=1)
+    store._event_managed_accounts.wait(5.0)
+    cds = store.getContractDetails(
+        store.makecontract('AAPL', 'STK', 'SMART', 'USD'))
+    contract = cds[0].contract
+
+    enddate = datetime.utcnow().replace(second=0, microsecond=0)
+    begindate = enddate - timedelta(days=days)
+
+    print(f'{days} days of {compression} min bars, {latency}s per request')
+    print(f'{"concurrency":>11} {"requests":>8} {"bars":>7} {"wall s":>7} '
+          f'{"speedup":>7} ordered')
+    serial = None
+    for conc in [1] + concurrency:
+        store.p.histconcurrency = conc  # the store is a singleton
+        nreqs = sim.stats.requests['reqHistoricalData']
+        elapsed, dates = download(store, contract, begindate, enddate,
+                                  TimeFrame.Minutes, compression)
+        nreqs = sim.stats.requests['reqHistoricalData'] - nreqs
+        serial = serial or elapsed
+        ordered = all(a < b for a, b in zip(dates, dates[1:]))
+        print(f'{conc:>11} {nreqs:>8} {len(dates):>7} {elapsed:7.2f} '
+              f'{serial / elapsed:7.2f} {ordered}')
+
+    store.stop()
+    sim.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--days', default=60, type=int)
+    parser.add_argument('--latency', default=1.0, type=float,
+                        help='seconds before the gateway answers a request')
+    parser.add_argument('--concurrency', default='2,4,6',
+                        help='comma separated values to compare to serial')
+    parser.add_argument('--compression', default=1, type=int,
+                        help='minutes per bar')
+    args = parser.parse_args()
+    run(args.days, args.latency,
+        [int(x) for x in args.concurrency.split(',')], args.compression)
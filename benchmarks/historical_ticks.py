@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Ticks/s downloaded by a paged reqHistoricalTicksEx over a range, against the
+simulated gateway
+
+    python benchmarks/historical_ticks.py --minutes 60 --latency 0.2
+
+The gateway generates 4 ticks per second and answers each page after
+``--latency`` seconds. The run checks that the ticks are delivered complete
+(no tick of a second repeated across pages) and in chronological order
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+from datetime import datetime, timedelta
+import os.path
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backtrader.utils.py3 import queue  # noqa: E402
+
+from atreyu_backtrader_api import IBStore  # noqa: E402
+from atreyu_backtrader_api.ibsimulator import (  # noqa: E402
+    IBGatewaySimulator, Scenario)
+
+
+def download(store, contract, begindate, enddate, what, nticks):
+    t0 = time.monotonic()
+    q = store.reqHistoricalTicksEx(contract, enddate=enddate,
+                                   begindate=begindate, what=what,
+                                   numberOfTicks=nticks)
+    times = list()
+    while True:
+        try:
+            msg = q.get(timeout=0.05)
+        except queue.Empty:
+            if not store.validQueue(q):
+                break  # request over and everything consumed
+            continue
+
+        if msg is None or isinstance(msg, int):
+            print(f'download interrupted with: {msg}')
+            break
+        times.append(msg.time)
+
+    return time.monotonic() - t0, times
+
+
+def run(minutes, latency, what, nticks):
+    sim = IBGatewaySimulator(
+        port=0, scenario=Scenario(rate=1.0, histlatency=latency)).start()
+    store = IBStore(port=sim.port, clientId=1)
+    store._event_managed_accounts.wait(5.0)
+    cds = store.getContractDetails(
+        store.makecontract('AAPL', 'STK', 'SMART', 'USD'))
+    contract = cds[0].contract
+
+    enddate = datetime.utcnow().replace(microsecond=0)
+    begindate = enddate - timedelta(minutes=minutes)
+
+    nreqs = sim.stats.requests['reqHistoricalTicks']
+    elapsed, times = download(store, contract, begindate, enddate, what,
+                              nticks)
+    nreqs = sim.stats.requests['reqHistoricalTicks'] - nreqs
+
+    expected = (minutes * 60 + 1) * 4
+    persec = collections.Counter(times)
+    ordered = all(a <= b for a, b in zip(times, times[1:]))
+    print(f'{minutes} min of {what} ticks, {nticks} per page, '
+          f'{latency}s per request')
+    print(f'pages: {nreqs} ticks: {len(times)} (expected {expected}) '
+          f'max per second: {max(persec.values(), default=0)} '
+          f'ordered: {ordered}')
+    print(f'wall: {elapsed:.2f}s -> {len(times) / elapsed:.0f} ticks/s')
+
+    store.stop()
+    sim.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--minutes', default=60, type=int)
+    parser.add_argument('--latency', default=0.2, type=float,
+                        help='seconds before the gateway answers a request')
+    parser.add_argument('--what', default='TRADES',
+                        choices=['TRADES', 'BID_ASK', 'MIDPOINT'])
+    parser.add_argument('--nticks', default=1000, type=int,
+                        help='ticks per page (max 1000)')
+    args = parser.parse_args()
+    run(args.minutes, args.latency, args.what, args.nticks)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+CPU time per tick of timestamping the live messages in the store and loading
+the timestamp in the data feed, before (datetime in the store, date2num in
+the feed) and after (epoch seconds to date2num once in the store, ``dtnum``)
+
+    python benchmarks/live_timestamps.py --count 200000
+
+The "before" classes are inline copies of the former implementation so that
+both variants are measured in the same interpreter. Each variant runs in its
+own process and the figure is process CPU time, the best of ``--repeat``
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+from datetime import datetime, timedelta
+import multiprocessing
+import os.path
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backtrader import date2num  # noqa: E402
+
+from atreyu_backtrader_api.ibstore import (  # noqa: E402
+    RTBar, RTPrice, RTSize, RTTickBidAsk, RTTickLast, RTTickMidPoint)
+
+
+class OldRTPrice(object):
+    __slots__ = ('price', 'size', 'datetime')
+
+    def __init__(self, price, tmoffset=None):
+        self.size = None
+        self.price = price
+        self.datetime = datetime.now()
+        if tmoffset is not None:
+            self.datetime += tmoffset
+
+
+class OldRTSize(object):
+    __slots__ = ('price', 'size', 'datetime')
+
+    def __init__(self, size, tmoffset=None):
+        self.price = None
+        self.size = size
+        self.datetime = datetime.now()
+        if tmoffset is not None:
+            self.datetime += tmoffset
+
+
+class OldRTBar(object):
+    __slots__ = ('reqId', 'time', 'open', 'high', 'low', 'close', 'volume',
+                 'wap', 'count')
+
+    def __init__(self, reqId, time, open_, high, low, close, volume, wap, count):
+        self.reqId = reqId
+        self.time = time
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.wap = wap
+        self.count = count
+
+
+class OldRTTickLast(object):
+    __slots__ = ('dataType', 'datetime', 'tickType', 'price', 'size',
+                 'pastlimit', 'unreported')
+
+    def __init__(self, tickType, time, price, size, tickAtrribLast, exchange, specialConditions):
+        self.dataType = "RT_TICK_LAST"
+        self.datetime = datetime.utcfromtimestamp(time)
+        self.tickType = tickType
+        self.price = price
+        self.size = float(size)
+        self.pastlimit = tickAtrribLast.pastLimit
+        self.unreported = tickAtrribLast.unreported
+
+
+class OldRTTickBidAsk(object):
+    __slots__ = ('dataType', 'datetime', 'bidPrice', 'askPrice', 'bidSize',
+                 'askSize', 'bidPastLow', 'askPastHigh')
+
+    def __init__(self, time, bidPrice, askPrice, bidSize, askSize, tickAttribBidAsk):
+        self.dataType = "RT_TICK_BID_ASK"
+        self.datetime = datetime.utcfromtimestamp(time)
+        self.bidPrice = bidPrice
+        self.askPrice = askPrice
+        self.bidSize = float(bidSize)
+        self.askSize = float(askSize)
+        self.bidPastLow = tickAttribBidAsk.bidPastLow
+        self.askPastHigh = tickAttribBidAsk.askPastHigh
+
+
+class OldRTTickMidPoint(object):
+    __slots__ = ('dataType', 'datetime', 'midPoint')
+
+    def __init__(self, time, midPoint):
+        self.dataType = "RT_TICK_MIDPOINT"
+        self.datetime = datetime.utcfromtimestamp(time)
+        self.midPoint = midPoint
+
+
+class _Attrib(object):
+    pastLimit = unreported = bidPastLow = askPastHigh = False
+
+
+ATTRIB = _Attrib()
+TMOFFSET = timedelta(milliseconds=-12)
+T0 = 1700000000
+
+
+def old_realtimebar(t):
+    # the store converted the epoch seconds of the bar after building it
+    msg = OldRTBar(1, t, 1.0, 2.0, 0.5, 1.5, 100.0, 1.2, 10)
+    msg.time = datetime.utcfromtimestamp(float(msg.time))
+    return msg
+
+
+# name, (store: message for tick i, feed: date2num value)
+CASES = {
+    'RTPrice': (
+        (lambda i: OldRTPrice(101.25, TMOFFSET),
+         lambda m: date2num(m.datetime)),
+        (lambda i: RTPrice(101.25, TMOFFSET), lambda m: m.dtnum)),
+    'RTSize': (
+        (lambda i: OldRTSize(100, TMOFFSET), lambda m: date2num(m.datetime)),
+        (lambda i: RTSize(100, TMOFFSET), lambda m: m.dtnum)),
+    'RTBar': (
+        (lambda i: old_realtimebar(T0 + 5 * i), lambda m: date2num(m.time)),
+        (lambda i: RTBar(1, T0 + 5 * i, 1.0, 2.0, 0.5, 1.5, 100.0, 1.2, 10),
+         lambda m: m.dtnum)),
+    'RTTickLast': (
+        (lambda i: OldRTTickLast(1, T0 + i, 101.25, 100, ATTRIB, '', ''),
+         lambda m: date2num(m.datetime)),
+        (lambda i: RTTickLast(1, T0 + i, 101.25, 100, ATTRIB, '', ''),
+         lambda m: m.dtnum)),
+    'RTTickBidAsk': (
+        (lambda i: OldRTTickBidAsk(T0 + i, 101.2, 101.3, 100, 200, ATTRIB),
+         lambda m: date2num(m.datetime)),
+        (lambda i: RTTickBidAsk(T0 + i, 101.2, 101.3, 100, 200, ATTRIB),
+         lambda m: m.dtnum)),
+    'RTTickMidPoint': (
+        (lambda i: OldRTTickMidPoint(T0 + i, 101.25),
+         lambda m: date2num(m.datetime)),
+        (lambda i: RTTickMidPoint(T0 + i, 101.25), lambda m: m.dtnum)),
+}
+
+
+def cputime(name, variant, count, repeat, out):
+    store, feed = CASES[name][variant]
+    best = None
+    for _ in range(repeat):
+        t0 = time.process_time()
+        for i in range(count):
+            feed(store(i))
+        elapsed = time.process_time() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    out.put(best / count)
+
+
+def measure(name, variant, count, repeat):
+    out = multiprocessing.Queue()
+    p = multiprocessing.Process(target=cputime,
+                                args=(name, variant, count, repeat, out))
+    p.start()
+    result = out.get()
+    p.join()
+    return result
+
+
+def identical(name, count):
+    # The epoch second ticks and bars must load the same date2num value
+    (ostore, ofeed), (nstore, nfeed) = CASES[name]
+    return all(ofeed(ostore(i)) == nfeed(nstore(i)) for i in range(count))
+
+
+def run(count, repeat):
+    print(f'{"message":16} {"before ns":>10} {"after ns":>9} identical')
+    for name in CASES:
+        told = measure(name, 0, count, repeat) * 1e9
+        tnew = measure(name, 1, count, repeat) * 1e9
+        same = '-' if name in ('RTPrice', 'RTSize') else identical(name, count)
+        print(f'{name:16} {told:10.0f} {tnew:9.0f} {same}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--count', default=100000, type=int,
+                        help='ticks per timing repeat')
+    parser.add_argument('--repeat', default=3, type=int)
+    args = parser.parse_args()
+    run(args.count, args.repeat)
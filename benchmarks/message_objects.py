@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Construction cost and per message memory of the store message objects, before
+(``__dict__`` plus the ``self.vars = vars()`` copy) and after (``__slots__``)
+
+    python benchmarks/message_objects.py --number 200000
+
+The "before" classes are inline copies of the former implementation so that
+both variants are measured in the same interpreter
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import gc
+import os.path
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from atreyu_backtrader_api.ibstore import (  # noqa: E402
+    RTVolume, RTPrice, RTBar, RTTickLast, RTTickBidAsk, _ts2dt)
+
+
+class OldRTVolume(object):
+    _fields = [
+        ('price', float),
+        ('size', float),
+        ('datetime', _ts2dt),
+        ('volume', float),
+        ('vwap', float),
+        ('single', bool)
+    ]
+
+    def __init__(self, rtvol='', price=None, tmoffset=None):
+        self.vars = vars()
+        tokens = iter(rtvol.split(';'))
+        for name, func in self._fields:
+            setattr(self, name, func(next(tokens)) if rtvol else func())
+        if price is not None:
+            self.price = price
+        if tmoffset is not None:
+            self.datetime += tmoffset
+
+    def __str__(self):
+        return f'{self.vars}'
+
+
+class OldRTPrice(object):
+    def __init__(self, price, tmoffset=None):
+        self.vars = vars()
+        self.size = None
+        self.price = price
+        self.datetime = datetime.now()
+        if tmoffset is not None:
+            self.datetime += tmoffset
+
+    def __str__(self):
+        return f'{self.vars}'
+
+
+class OldRTBar(object):
+    def __init__(self, reqId, time, open_, high, low, close, volume, wap, count):
+        self.vars = vars()
+        self.reqId = reqId
+        self.time = time
+        self.open = open_
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.wap = wap
+        self.count = count
+
+    def __str__(self):
+        return f'{self.vars}'
+
+
+class OldRTTickLast(object):
+    def __init__(self, tickType, time, price, size, tickAtrribLast, exchange, specialConditions):
+        self.vars = vars()
+        self.dataType = "RT_TICK_LAST"
+        self.datetime = datetime.utcfromtimestamp(time)
+        self.tickType = tickType
+        self.price = price
+        self.size = float(size)
+        self.pastlimit = tickAtrribLast.pastLimit
+        self.unreported = tickAtrribLast.unreported
+
+    def __str__(self):
+        return f'{self.vars}'
+
+
+class OldRTTickBidAsk(object):
+    def __init__(self, time, bidPrice, askPrice, bidSize, askSize, tickAttribBidAsk):
+        self.vars = vars()
+        self.dataType = "RT_TICK_BID_ASK"
+        self.datetime = datetime.utcfromtimestamp(time)
+        self.bidPrice = bidPrice
+        self.askPrice = askPrice
+        self.bidSize = float(bidSize)
+        self.askSize = float(askSize)
+        self.bidPastLow = tickAttribBidAsk.bidPastLow
+        self.askPastHigh = tickAttribBidAsk.askPastHigh
+
+    def __str__(self):
+        return f'{self.vars}'
+
+
+class _Attrib(object):
+    pastLimit = unreported = bidPastLow = askPastHigh = False
+
+
+RTVOL = '101.25;100;1700000000123;250000;101.2231;true'
+ATTRIB = _Attrib()
+
+CASES = [
+    ('RTVolume', lambda: OldRTVolume(RTVOL), lambda: RTVolume(RTVOL)),
+    ('RTPrice', lambda: OldRTPrice(101.25), lambda: RTPrice(101.25)),
+    ('RTBar',
+     lambda: OldRTBar(1, 1700000000, 1.0, 2.0, 0.5, 1.5, 100, 1.2, 10),
+     lambda: RTBar(1, 1700000000, 1.0, 2.0, 0.5, 1.5, 100, 1.2, 10)),
+    ('RTTickLast',
+     lambda: OldRTTickLast(1, 1700000000, 101.25, 100, ATTRIB, 'ISLAND', ''),
+     lambda: RTTickLast(1, 1700000000, 101.25, 100, ATTRIB, 'ISLAND', '')),
+    ('RTTickBidAsk',
+     lambda: OldRTTickBidAsk(1700000000, 101.2, 101.3, 100, 200, ATTRIB),
+     lambda: RTTickBidAsk(1700000000, 101.2, 101.3, 100, 200, ATTRIB)),
+]
+
+
+def construction(factory, number, repeat):
+    return min(timeit.repeat(factory, number=number, repeat=repeat)) / number
+
+
+def allocation(factory, count):
+    # Keep the objects alive to account for everything each one retains
+    gc.collect()
+    tracemalloc.start()
+    keep = [factory() for _ in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del keep
+    return size / count
+
+
+def run(number, repeat, count):
+    print(f'{"message":14} {"before ns":>10} {"after ns":>10} '
+          f'{"before B":>9} {"after B":>9}')
+    for name, before, after in CASES:
+        tb = construction(before, number, repeat) * 1e9
+        ta = construction(after, number, repeat) * 1e9
+        mb = allocation(before, count)
+        ma = allocation(after, count)
+        print(f'{name:14} {tb:10.0f} {ta:10.0f} {mb:9.0f} {ma:9.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', default=100000, type=int,
+                        help='constructions per timing repeat')
+    parser.add_argument('--repeat', default=5, type=int)
+    parser.add_argument('--count', default=20000, type=int,
+                        help='live objects for the allocation figure')
+    args = parser.parse_args()
+    run(args.number, args.repeat, args.count)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Compares queue.Queue and RingQueue as data queue between a producer thread
+(the TWS API thread) and a consumer thread (the data feed)
+
+    python benchmarks/ringbuffer_queue.py --rates 10000,50000,100000
+
+For each rate the producer puts timestamped messages in bursts paced to the
+rate and the consumer takes them with ``get(timeout=...)`` as ``IBData`` does.
+Reported: achieved rate, producer CPU per put and delivery latency (p50/p99/
+max). A last unpaced run gives the maximum throughput of each queue
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import os.path
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backtrader.utils.py3 import queue  # noqa: E402
+
+from atreyu_backtrader_api.histogram import LatencyHistogram  # noqa: E402
+from atreyu_backtrader_api.ringbuffer import RingQueue  # noqa: E402
+
+
+def consume(q, count, hist, batch):
+    perf_counter_ns = time.perf_counter_ns
+    received = 0
+    while received < count:
+        if batch:
+            try:
+                msgs = q.drain(block=True, timeout=0.5)
+            except queue.Empty:
+                continue
+        else:
+            try:
+                msgs = (q.get(timeout=0.5),)
+            except queue.Empty:
+                continue
+
+        now = perf_counter_ns()
+        for stamp in msgs:
+            hist.record(now - stamp)
+        received += len(msgs)
+
+
+def produce(q, count, rate, cputime):
+    perf_counter_ns = time.perf_counter_ns
+    put = q.put
+    sent = 0
+    cpu = 0
+    t0 = time.monotonic()
+    while sent < count:
+        if rate:
+            due = min(count, int((time.monotonic() - t0) * rate)) - sent
+            if due <= 0:
+                time.sleep(0.0002)
+                continue
+        else:
+            due = min(1000, count - sent)
+
+        c0 = time.thread_time_ns()
+        for _ in range(due):
+            put(perf_counter_ns())
+        cpu += time.thread_time_ns() - c0
+        sent += due
+
+    cputime[0] = cpu
+
+
+def run_one(mkqueue, count, rate, batch=False):
+    q = mkqueue()
+    hist = LatencyHistogram()
+    cputime = [0]
+    consumer = threading.Thread(target=consume, args=(q, count, hist, batch))
+    producer = threading.Thread(target=produce, args=(q, count, rate, cputime))
+    t0 = time.perf_counter()
+    consumer.start()
+    producer.start()
+    producer.join()
+    consumer.join()
+    elapsed = time.perf_counter() - t0
+    return count / elapsed, cputime[0] / count, hist
+
+
+def run(rates, seconds, ringsize):
+    kinds = [
+        ('queue.Queue', queue.Queue, False),
+        ('RingQueue', lambda: RingQueue(ringsize), False),
+        ('RingQueue drain', lambda: RingQueue(ringsize), True),
+    ]
+    print(f'{"rate":>8} {"queue":16} {"msgs/s":>9} {"put ns":>7} '
+          f'{"p50 us":>8} {"p99 us":>8} {"max us":>9}')
+    for rate in rates + [0]:
+        count = int(rate * seconds) if rate else 500000
+        for name, mkqueue, batch in kinds:
+            achieved, putns, hist = run_one(mkqueue, count, rate, batch)
+            r = hist.report()
+            label = rate or 'max'
+            print(f'{label:>8} {name:16} {achieved:9.0f} {putns:7.0f} '
+                  f'{r["p50"] / 1e3:8.1f} {r["p99"] / 1e3:8.1f} '
+                  f'{r["max"] / 1e3:9.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rates', default='10000,25000,50000,100000',
+                        help='comma separated messages per second')
+    parser.add_argument('--seconds', default=2.0, type=float,
+                        help='duration of each paced run')
+    parser.add_argument('--ringsize', default=65536, type=int)
+    args = parser.parse_args()
+    run([int(x) for x in args.rates.split(',')], args.seconds, args.ringsize)
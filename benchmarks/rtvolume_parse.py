@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+'''
+Cost per message of turning a RTVolume tickString into the message of the
+store and the date2num value loaded by the data feed, before (field table,
+datetime and date2num) and after (RTVolume.parse, integer milliseconds)
+
+    python benchmarks/rtvolume_parse.py --count 200000
+    python benchmarks/rtvolume_parse.py --journal /path/to/journal
+
+The stream is the one recorded in a tick journal (store param ``journal``,
+file or directory) if given, else a synthetic one as sent by the simulator.
+The "before" parser is an inline copy of the former implementation so that
+both variants are measured in the same interpreter. The prices, sizes and
+date2num values of both are checked to be identical
+'''
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import os.path
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from backtrader import date2num  # noqa: E402
+
+from atreyu_backtrader_api import journal  # noqa: E402
+from atreyu_backtrader_api.ibstore import RTVolume, _ts2dt  # noqa: E402
+
+
+class OldRTVolume(object):
+    _fields = [
+        ('price', float),
+        ('size', float),
+        ('datetime', _ts2dt),
+        ('volume', float),
+        ('vwap', float),
+        ('single', bool)
+    ]
+
+    __slots__ = tuple(name for name, func in _fields)
+
+    def __init__(self, rtvol='', price=None, tmoffset=None):
+        tokens = iter(rtvol.split(';'))
+        for name, func in self._fields:
+            setattr(self, name, func(next(tokens)) if rtvol else func())
+        if price is not None:
+            self.price = price
+        if tmoffset is not None:
+            self.datetime += tmoffset
+
+
+def captured(path):
+    '''RTVolume tickStrings rebuilt from the records of a tick journal'''
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, f)
+                       for root, dirs, fnames in os.walk(path)
+                       for f in fnames if f.endswith('.ticks'))
+    else:
+        files = [path]
+
+    out = list()
+    for fname in files:
+        for rec in journal.read_journal(fname):
+            if rec[2] == journal.RTVOLUME:
+                ms, price, size, volume, vwap, single = rec[1], *rec[4:9]
+                out.append(f'{price!r};{size:g};{ms};{volume:g};{vwap!r};'
+                           f'{"true" if single else "false"}')
+    return out
+
+
+def synthetic(count):
+    ms = int(time.time() * 1000)
+    price, volume = 100.0, 0
+    out = list()
+    for _ in range(count):
+        ms += random.randint(0, 50)
+        price = round(price + random.choice((-0.01, 0.0, 0.01)), 2)
+        size = random.choice((1, 100, 200, 500))
+        volume += size
+        out.append(f'{price};{size};{ms};{volume};{price};false')
+    return out
+
+
+def old(rtvols):
+    out = list()
+    for rtvol in rtvols:
+        msg = OldRTVolume(rtvol)
+        out.append((msg.price, msg.size, date2num(msg.datetime)))
+    return out
+
+
+def new(rtvols):
+    out = list()
+    for rtvol in rtvols:
+        msg = RTVolume.parse(rtvol)
+        out.append((msg.price, msg.size, msg.dtnum))
+    return out
+
+
+def measure(fn, rtvols, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(rtvols)
+        elapsed = time.perf_counter() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def run(rtvols, repeat):
+    n = len(rtvols)
+    if not n:
+        print('No RTVolume messages in the stream')
+        return
+
+    told, rold = measure(old, rtvols, repeat)
+    tnew, rnew = measure(new, rtvols, repeat)
+    print(f'{"messages":>9} {"before ns":>10} {"after ns":>9} identical')
+    print(f'{n:9} {told / n * 1e9:10.0f} {tnew / n * 1e9:9.0f} '
+          f'{rold == rnew}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--journal', default=None,
+                        help='tick journal file or directory to take the '
+                             'RTVolume stream from')
+    parser.add_argument('--count', default=100000, type=int,
+                        help='messages of the synthetic stream')
+    parser.add_argument('--repeat', default=5, type=int)
+    args = parser.parse_args()
+    stream = captured(args.journal) if args.journal else synthetic(args.count)
+    run(stream, args.repeat)
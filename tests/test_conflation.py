@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import pytest
+
+from backtrader.utils.py3 import queue
+
+from atreyu_backtrader_api.conflation import ConflatingQueue
+
+
+class Price(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class Size(Price):
+    pass
+
+
+def test_full_block_merges_without_waiting():
+    q = ConflatingQueue(maxsize=2, overflow='block', conflate=True)
+    q.put(Price(1))
+    q.put(Size(1))
+    q.put_nowait(Price(2))  # merged into the pending one: no room needed
+
+    assert q.coalesced == 1
+    assert q.get().value == 2
+
+
+def test_full_block_notifications_take_no_room():
+    q = ConflatingQueue(maxsize=2, overflow='block', conflate=True)
+    q.put(Price(1))
+    q.put(Size(1))
+    q.put_nowait(-1100)
+    q.put_nowait(None)
+
+    # after the barrier a new data message needs room
+    with pytest.raises(queue.Full):
+        q.put_nowait(Price(2))
+    with pytest.raises(queue.Full):
+        q.put(Price(2), timeout=0.01)
+
+    assert q.get().value == 1
+    q.put_nowait(Price(2))
+    msgs = [q.get_nowait() for _ in range(q.qsize())]
+    assert [getattr(m, 'value', m) for m in msgs] == [1, -1100, None, 2]
+
+
+def test_dropoldest_keeps_notifications():
+    q = ConflatingQueue(maxsize=2, overflow='dropoldest')
+    for i in range(5):
+        q.put(Price(i))
+        q.put(-1)
+
+    assert q.dropped == 3
+    assert q.qsize() == 7  # 5 notifications and the 2 newest messages
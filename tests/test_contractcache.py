@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8; py-indent-offset:4 -*-
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+from ibapi.contract import Contract, ContractDetails
+
+from atreyu_backtrader_api.contractcache import ContractRegistry
+
+
+def makecontract(exchange, conId=0, symbol='AAPL'):
+    contract = Contract()
+    contract.conId = conId
+    contract.symbol = symbol
+    contract.secType = 'STK'
+    contract.exchange = exchange
+    contract.primaryExchange = 'NASDAQ'
+    contract.currency = 'USD'
+    return contract
+
+
+def makedetails(exchange, conId=265598):
+    cd = ContractDetails()
+    cd.contract = makecontract(exchange, conId)
+    cd.marketName = 'NMS'
+    return cd
+
+
+def test_same_conid_other_exchange():
+    registry = ContractRegistry()
+    smart = registry.put(makecontract('SMART'), [makedetails('SMART')])
+    island = registry.put(makecontract('ISLAND'), [makedetails('ISLAND')])
+
+    assert smart[0] is not island[0]
+    assert smart[0].contract.exchange == 'SMART'  # left alone
+    assert island[0].contract.exchange == 'ISLAND'
+    assert registry.get(makecontract('SMART'))[0] is smart[0]
+    assert registry.get(makecontract('ISLAND'))[0] is island[0]
+
+
+def test_same_instrument_shared():
+    registry = ContractRegistry()
+    first = registry.put(makecontract('SMART'), [makedetails('SMART')])
+    # by conId resolves to the same instrument and routing
+    again = registry.put(makecontract('SMART', conId=265598),
+                         [makedetails('SMART')])
+
+    assert again[0] is first[0]
+    assert registry.stats()['interned'] == 1
+
+
+def test_changed_answer_not_modified():
+    registry = ContractRegistry()
+    first = registry.put(makecontract('SMART'), [makedetails('SMART')])
+    cd = makedetails('SMART')
+    cd.marketName = 'OTHER'
+    again = registry.put(makecontract('SMART'), [cd])
+
+    assert again[0] is cd
+    assert first[0].marketName == 'NMS'  # given out before: unchanged
+    assert registry.get(makecontract('SMART'))[0] is cd
+
+
+def test_disk(tmp_path):
+    path = str(tmp_path / 'contracts.db')
+    registry = ContractRegistry(path)
+    registry.put(makecontract('SMART'), [makedetails('SMART')])
+    registry.put(makecontract('ISLAND'), [makedetails('ISLAND')])
+    registry.close()
+
+    registry = ContractRegistry(path)
+    smart = registry.get(makecontract('SMART'))
+    island = registry.get(makecontract('ISLAND'))
+    assert smart[0].contract.exchange == 'SMART'
+    assert island[0].contract.exchange == 'ISLAND'
+    assert registry.stats()['disk'] == 2
+    registry.close()